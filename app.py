@@ -1,45 +1,194 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, g
 import os
 from flask_cors import CORS
 import json
+import hashlib
+import shutil
+import queue
+import threading
+import time
 
 # Import from main and preprocess_data
-from pdf_generator import generate_pdf_from_lesson_data, process_with_ai
+from pdf_generator import (generate_pdf_from_lesson_data, process_with_ai, build_lesson_pdf, ai_singleflight, llm, async_llm,
+                           generate_mindmap_from_lesson_data, build_mindmap, get_cached_lesson_data)
+from prompt_condense import prompt_stats
 # Trigger reload, process_with_ai
-from preprocess_data import extract_metadata_from_filename, extract_text_from_pptx, update_lessons_registry
+from preprocess_data import extract_metadata_from_filename, extract_text_from_pptx, lesson_scanner
 from cache import lesson_cache
+from pdf_store import pdf_store, file_digest
+from artifact_store import artifact_store
+from http_cache import http_cache, LESSONS_CACHE_CONTROL, TEACHER_INFO_CACHE_CONTROL
+from jobs import job_queue, FINAL_STATUSES
+from lesson_registry import lesson_registry, SLOT_FIELDS
+from binder import build_binder_pdf, sort_lessons, binder_filename, BinderError, BINDER_MAX_LESSONS
+from template_env import jinja_env
+from uploads import UploadRequest, UPLOAD_MAX_BYTES, extracted_text_memo, known_deck_content
+from observability import get_logger, metrics, request_seconds, span, start_request_timing, server_timing_header
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES
+
+log = get_logger(__name__)
 
 # Configure CORS to allow Vercel frontend
 CORS(app, resources={
     r"/*": {
         "origins": "*",
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "Prefer"],
+        "expose_headers": ["X-Total-Count", "Server-Timing"]
     }
 })
 
+def stored_pdf_response(key, pdf_filename, ext="pdf"):
+    """Serve a PDF (or mind-map PNG) straight from the PDF store (its key is the ETag)."""
+    return send_file(pdf_store.path_for(key, ext), mimetype="image/png" if ext == "png" else "application/pdf",
+                     as_attachment=True, download_name=pdf_filename, etag=key)
+
+def pdf_response(lesson_data, pdf_filename):
+    """Serve the lesson's PDF straight from the PDF store."""
+    return stored_pdf_response(build_lesson_pdf(lesson_data), pdf_filename)
+
+def run_generation_job(params):
+    """Job handler: AI analysis then PDF render, same result shape as the sync endpoints."""
+    lesson_data = process_with_ai(params["title"], params["subject"], params["level"], params["period"],
+                                  params["week"], params["session"], params["content"])
+    if not lesson_data:
+        raise RuntimeError("AI analysis failed")
+    pdf_path = generate_pdf_from_lesson_data(lesson_data, params["pdf_filename"])
+    result = {
+        "title": params["title"],
+        "lesson_data": lesson_data,
+        "pdf_path": pdf_path
+    }
+    if params.get("mindmap"):
+        # Same AI result, second artifact
+        result["mindmap_path"] = generate_mindmap_from_lesson_data(lesson_data, mindmap_filename(params["pdf_filename"]))
+    return result
+
+job_queue.register("generate", run_generation_job)
+
+def upload_pdf_filename(meta, deck_sha256):
+    """
+    Journal name for an uploaded deck. Every subject and teacher shares the
+    same period/week/session slot, so subject, level and the deck hash are added.
+    """
+    return (f"{meta['subject']}_N{meta['level']}_Period{meta['period']}_Week{meta['week']}"
+            f"_Session{meta['session']}_{deck_sha256[:10]}.pdf")
+
+def mindmap_filename(pdf_filename, ext="pdf"):
+    return f"{os.path.splitext(pdf_filename)[0]} - mindmap.{ext}"
+
+def wants_mindmap():
+    """?mindmap=1 on the generate endpoints also produces the lesson's mind map."""
+    return request.args.get("mindmap") in ("1", "true")
+
+def run_binder_job(params):
+    """Job handler: build the binder and publish it under output_pdfs/."""
+    lessons = [lesson_registry.get(lesson_id) for lesson_id in params["lesson_ids"]]
+    if None in lessons:
+        raise RuntimeError("Lesson not found")
+    key = build_binder_pdf(lessons)
+    return {
+        "lesson_ids": params["lesson_ids"],
+        "pdf_path": artifact_store.publish(key, params["pdf_filename"])
+    }
+
+job_queue.register("binder", run_binder_job)
+
+def wants_async():
+    """Clients opt in with ?async=1 or a `Prefer: respond-async` header."""
+    return request.args.get("async") in ("1", "true") or "respond-async" in request.headers.get("Prefer", "")
+
+def submit_generation_job(params, kind="generate"):
+    """Queue (or join) a generation job and answer 202 with its id."""
+    dedupe_key = hashlib.sha256(json.dumps([kind, params], sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    job = job_queue.submit(kind, params, dedupe_key)
+    response = jsonify({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['job_id']}",
+        "events_url": f"/jobs/{job['job_id']}/events"
+    })
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job['job_id']}"
+    return response
+
+@app.before_request
+def start_background_services():
+    # Per-process and idempotent: each gunicorn worker starts its own scanner, job threads, artifact sweeper and metrics flusher
+    lesson_scanner.start()
+    job_queue.start()
+    artifact_store.start()
+    metrics.start()
+    g.request_start = time.perf_counter()
+    start_request_timing()
+
+@app.after_request
+def record_request_timing(response):
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe(elapsed, method=request.method, endpoint=endpoint, status=response.status_code)
+    header = server_timing_header(elapsed)
+    if header:
+        response.headers["Server-Timing"] = header
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage and request latency histograms and token counters, all workers summed."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/")
 def home():
     return {"status": "running", "service": "raida-backend"}
 
 @app.route('/generate', methods=['POST'])
 def generate():
-    uploaded_file = request.files.get("file")
+    # The body has already been streamed into a hashed spool (see uploads.py);
+    # MAX_CONTENT_LENGTH turns oversized uploads into a 413.
+    with span("upload"):
+        uploaded_file = request.files.get("file")
     if not uploaded_file:
         return jsonify({"error": "No file provided"}), 400
 
-    lessons_dir = "lessons"
-    os.makedirs(lessons_dir, exist_ok=True)
-    pptx_path = os.path.join(lessons_dir, uploaded_file.filename)
-    uploaded_file.save(pptx_path)
+    filename = os.path.basename(uploaded_file.filename.replace("\\", "/"))
+    if not filename.lower().endswith(".pptx") or filename.startswith("."):
+        return jsonify({"error": "Expected a .pptx file"}), 400
+    spool = uploaded_file.stream
+    deck_sha256 = spool.sha256
 
     # Extract metadata
-    meta = extract_metadata_from_filename(uploaded_file.filename)
+    meta = extract_metadata_from_filename(filename)
     
-    # Extract content
-    content = extract_text_from_pptx(pptx_path)
+    # Extract content (skipped when this exact deck was already extracted)
+    content = known_deck_content(deck_sha256)
+    if content is None:
+        spool.seek(0)
+        content = extract_text_from_pptx(spool)
+        extracted_text_memo.set(deck_sha256, content)
+    else:
+        log.debug("⚡ Known deck %s..., skipped text extraction", deck_sha256[:16])
+
+    # Only keep the upload in lessons/ when explicitly asked to
+    if request.args.get("save") in ("1", "true") or request.form.get("save") in ("1", "true"):
+        lessons_dir = "lessons"
+        os.makedirs(lessons_dir, exist_ok=True)
+        spool.seek(0)
+        with open(os.path.join(lessons_dir, filename), "wb") as f:
+            shutil.copyfileobj(spool, f)
+        lesson_scanner.trigger()
+
+    if wants_async():
+        return submit_generation_job({
+            "title": meta["title"], "subject": meta["subject"], "level": meta["level"],
+            "period": meta["period"], "week": meta["week"], "session": meta["session"],
+            "content": content,
+            "pdf_filename": upload_pdf_filename(meta, deck_sha256),
+            **({"mindmap": True} if wants_mindmap() else {})
+        })
 
     # Process with AI
     lesson_data = process_with_ai(meta["title"], meta["subject"], meta["level"], meta["period"], meta["week"], meta["session"], content)
@@ -48,23 +197,35 @@ def generate():
         return jsonify({"error": "AI analysis failed"}), 500
 
     # Generate PDF
-    pdf_filename = f"Period{meta['period']}_Week{meta['week']}_Session{meta['session']}.pdf"
+    pdf_filename = upload_pdf_filename(meta, deck_sha256)
+    if request.args.get("format") == "pdf":
+        return pdf_response(lesson_data, pdf_filename)
     pdf_path = generate_pdf_from_lesson_data(lesson_data, pdf_filename)
     
-    return jsonify({
+    result = {
         "title": meta["title"],
         "lesson_data": lesson_data,
         "pdf_path": pdf_path
-    })
+    }
+    if wants_mindmap():
+        result["mindmap_path"] = generate_mindmap_from_lesson_data(lesson_data, mindmap_filename(pdf_filename))
+    return jsonify(result)
 
 @app.route("/generate_from_id/<int:lesson_id>", methods=["POST"])
 def generate_from_id(lesson_id):
-    with open("data/lessons.json", "r", encoding="utf-8") as f:
-        lessons = json.load(f)
-    lesson = next((l for l in lessons if l["id"] == lesson_id), None)
+    lesson = lesson_registry.get(lesson_id)
     if not lesson:
         return jsonify({"error": "Lesson not found"}), 404
 
+    if wants_async():
+        return submit_generation_job({
+            "title": lesson["title"], "subject": lesson["subject"], "level": lesson["level"],
+            "period": lesson["period"], "week": lesson["week"], "session": lesson["session"],
+            "content": lesson["content"],
+            "pdf_filename": f"{lesson['title']}.pdf",
+            **({"mindmap": True} if wants_mindmap() else {})
+        })
+
     # Here we have all the info
     lesson_data = process_with_ai(lesson["title"], lesson["subject"], lesson["level"], lesson["period"], lesson["week"], lesson["session"], lesson["content"])  
     
@@ -72,78 +233,250 @@ def generate_from_id(lesson_id):
         return jsonify({"error": "AI analysis failed"}), 500
 
     pdf_filename = f"{lesson['title']}.pdf"
+    if request.args.get("format") == "pdf":
+        return pdf_response(lesson_data, pdf_filename)
     pdf_path = generate_pdf_from_lesson_data(lesson_data, pdf_filename)
 
-    return jsonify({
+    result = {
         "title": lesson["title"],
         "lesson_data": lesson_data,
         "pdf_path": pdf_path
-    })
+    }
+    if wants_mindmap():
+        result["mindmap_path"] = generate_mindmap_from_lesson_data(lesson_data, mindmap_filename(pdf_filename))
+    return jsonify(result)
 
-import threading
-import time
+@app.route("/generate_mindmap/<int:lesson_id>", methods=["GET", "POST"])
+def generate_mindmap(lesson_id):
+    """
+    Mind map of a lesson (?format=pdf, the default, or png), built from the
+    cached AI result. No OpenAI call: 409 if the journal was never generated.
+    """
+    lesson = lesson_registry.get(lesson_id)
+    if not lesson:
+        return jsonify({"error": "Lesson not found"}), 404
+    fmt = request.args.get("format", "pdf")
+    if fmt not in ("pdf", "png"):
+        return jsonify({"error": "format must be pdf or png"}), 400
+
+    lesson_data = get_cached_lesson_data(lesson["title"], lesson["subject"], lesson["level"], lesson["period"],
+                                         lesson["week"], lesson["session"], lesson["content"])
+    if not lesson_data:
+        return jsonify({"error": "No AI data for this lesson yet, generate its journal first"}), 409
+
+    key = build_mindmap(lesson_data, fmt)
+    return stored_pdf_response(key, mindmap_filename(f"{lesson['title']}.pdf", fmt), fmt)
+
+@app.route("/generate_from_id/<int:lesson_id>/stream", methods=["GET", "POST"])
+def generate_from_id_stream(lesson_id):
+    """
+    Server-Sent Events version of /generate_from_id.
+    Emits a `step` event ({index, step}) as each step is written by the AI (a
+    retried completion restarts at index 0), `lesson` once lesson_data is
+    complete, then `done` with the same body as the sync endpoint, or `error`.
+    """
+    lesson = lesson_registry.get(lesson_id)
+    if not lesson:
+        return jsonify({"error": "Lesson not found"}), 404
 
-def delete_file_later(file_path, delay=120):
-    """Delete a file after a specified delay in seconds."""
-    def delayed_delete():
-        time.sleep(delay)
+    events = queue.Queue()
+
+    def work():
         try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"🗑️ Deleted temporary file: {file_path}")
+            lesson_data = process_with_ai(
+                lesson["title"], lesson["subject"], lesson["level"], lesson["period"], lesson["week"],
+                lesson["session"], lesson["content"],
+                on_step=lambda index, step: events.put(("step", {"index": index, "step": step}))
+            )
+            if not lesson_data:
+                events.put(("error", {"error": "AI analysis failed"}))
+                return
+            events.put(("lesson", {"lesson_data": lesson_data}))
+            pdf_path = generate_pdf_from_lesson_data(lesson_data, f"{lesson['title']}.pdf")
+            events.put(("done", {"title": lesson["title"], "lesson_data": lesson_data, "pdf_path": pdf_path}))
         except Exception as e:
-            print(f"❌ Error deleting file {file_path}: {e}")
-            
-    thread = threading.Thread(target=delayed_delete)
-    thread.daemon = True
-    thread.start()
+            events.put(("error", {"error": str(e)}))
+
+    threading.Thread(target=work, daemon=True).start()
+
+    def stream():
+        while True:
+            event, data = events.get()
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            if event in ("done", "error"):
+                return
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/binder", methods=["GET", "POST"])
+def binder():
+    """
+    Several journals in one PDF.
+    Lessons come from `lesson_ids` (JSON list, or comma-separated in the query
+    string) or from a subject/level/period/week/session selector. Missing AI
+    data is fetched concurrently. ?async=1 answers 202 with a job.
+    """
+    params = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    lesson_ids = params.get("lesson_ids")
+    if isinstance(lesson_ids, str):
+        lesson_ids = [part for part in lesson_ids.split(",") if part.strip()]
+    try:
+        lesson_ids = [int(lesson_id) for lesson_id in lesson_ids or []]
+    except (TypeError, ValueError):
+        return jsonify({"error": "lesson_ids must be integers"}), 400
+
+    if lesson_ids:
+        lessons = [lesson_registry.get(lesson_id) for lesson_id in lesson_ids]
+        missing = [lesson_id for lesson_id, lesson in zip(lesson_ids, lessons) if not lesson]
+        if missing:
+            return jsonify({"error": "Lesson not found", "lesson_ids": missing}), 404
+    else:
+        filters = {field: params.get(field) for field in SLOT_FIELDS}
+        if not any(filters.values()):
+            return jsonify({"error": "Give lesson_ids or a subject/level/period/week selector"}), 400
+        lessons = [l for l in sort_lessons(lesson_registry.find(**filters)) if l.get("content", "").strip()]
+
+    if not lessons:
+        return jsonify({"error": "No lessons selected"}), 404
+    if len(lessons) > BINDER_MAX_LESSONS:
+        return jsonify({"error": f"At most {BINDER_MAX_LESSONS} lessons per binder"}), 400
+
+    pdf_filename = binder_filename(lessons)
+    if wants_async():
+        return submit_generation_job({"lesson_ids": [l["id"] for l in lessons], "pdf_filename": pdf_filename},
+                                     kind="binder")
+    try:
+        key = build_binder_pdf(lessons)
+    except BinderError as e:
+        return jsonify({"error": str(e)}), 500
+    return stored_pdf_response(key, pdf_filename)
 
 @app.route("/download_pdf/<filename>")
 def download_pdf(filename):
-    """Serve a generated PDF for download and schedule its deletion."""
-    pdf_path = os.path.join("output_pdfs", filename)
-    if not os.path.exists(pdf_path):
+    """Serve a generated PDF for download (each download restarts its expiry, see artifact_store.py)."""
+    pdf_path = artifact_store.open(filename)
+    if pdf_path is None:
         return jsonify({"error": "PDF not found"}), 404
-        
-    # Schedule deletion after 2 minutes (120 seconds)
-    delete_file_later(pdf_path, delay=120)
-    
-    return send_file(pdf_path, as_attachment=True)
+
+    # Strong content ETag: a matching If-None-Match gets a 304. conditional=True answers
+    # Range requests with 206, and full responses go through wsgi.file_wrapper (sendfile under gunicorn)
+    return send_file(pdf_path, as_attachment=True, etag=file_digest(pdf_path), conditional=True)
+
+@app.route("/jobs", methods=["GET"])
+def jobs_stats():
+    """Get job queue statistics."""
+    return jsonify(job_queue.get_stats())
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Job status and result. ?wait=N long-polls up to N seconds (max 30) for completion."""
+    wait = min(request.args.get("wait", 0, type=float), 30)
+    job = job_queue.wait(job_id, timeout=wait) if wait > 0 else job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-Sent Events stream: one `status` event per state change until the job finishes."""
+    if not job_queue.get(job_id):
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        last_status = None
+        deadline = time.time() + 300
+        while True:
+            job = job_queue.get(job_id)
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"event: status\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            if job["status"] in FINAL_STATUSES:
+                return
+            if time.time() > deadline:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/lessons", methods=["GET"])
 def get_lessons():
-    # Scan for new files first
-    update_lessons_registry()
-    
-    with open("data/lessons.json", "r", encoding="utf-8") as f:
-        lessons = json.load(f)
-    # Return full lesson objects
-    return jsonify(lessons)
-    
+    """
+    List lessons.
+    Query params: slim=1 (omit `content`), subject/level/period/week/session
+    filters, page/per_page pagination (total count in X-Total-Count).
+    The body is built once per registry version and query, precompressed (see http_cache.py).
+    """
+    # Only the parameters that change the body make up the variant: a cache-buster
+    # (?_=123) must not rebuild and recompress the whole registry
+    slim = request.args.get("slim") in ("1", "true")
+    filters = {field: request.args.get(field, "").strip() for field in SLOT_FIELDS}
+    page = request.args.get("page", 0, type=int)
+    page = max(page, 1) if page else 0
+    per_page = max(1, min(request.args.get("per_page", 50, type=int), 500)) if page else 0
+    variant = "&".join([f"slim={int(slim)}", *(f"{k}={v}" for k, v in filters.items()),
+                        f"page={page}", f"per_page={per_page}"])
+
+    def build():
+        if any(filters.values()):
+            lessons = lesson_registry.find(slim=slim, **filters)
+        else:
+            lessons = lesson_registry.all(slim=slim)
 
+        total = len(lessons)
+        if page:
+            start = (page - 1) * per_page
+            lessons = lessons[start:start + per_page]
+        return lessons, {"X-Total-Count": str(total)}
+
+    return http_cache.respond(http_cache.get("lessons", variant, lesson_registry.version, build),
+                              LESSONS_CACHE_CONTROL)
+
+@app.route("/lessons/<int:lesson_id>", methods=["GET"])
+def get_lesson(lesson_id):
+    """Full lesson record, including its slide `content`."""
+    lesson = lesson_registry.get(lesson_id)
+    if not lesson:
+        return jsonify({"error": "Lesson not found"}), 404
+    return jsonify(lesson)
 
 @app.route("/cache/stats", methods=["GET"])
 def cache_stats():
     """Get cache statistics."""
     stats = lesson_cache.get_stats()
+    stats["pdf_store"] = pdf_store.get_stats()
+    stats["artifacts"] = artifact_store.get_stats()
+    stats["http"] = http_cache.get_stats()
+    stats["ai_calls"] = ai_singleflight.get_stats()
+    stats["prompt"] = prompt_stats.get_stats()
+    stats["llm"] = llm.get_stats()
+    if async_llm.stats["calls"]:
+        # Served through asgi.py: its native route calls OpenAI through the async client
+        stats["llm_async"] = async_llm.get_stats()
     return jsonify(stats)
 
 @app.route("/cache/clear", methods=["POST"])
 def clear_cache():
-    """Clear all cache entries."""
+    """Clear all AI cache entries (the other workers drop their memory tier on their next lookup)."""
     lesson_cache.clear()
     return jsonify({"message": "Cache cleared successfully"})
 
 @app.route("/teacher-info", methods=["GET", "POST"])
 def manage_teacher_info():
     teacher_info_path = os.path.join(os.path.dirname(__file__), "teacherInfo.json")
-    print(f"Request to /teacher-info: {request.method}")
+    log.debug("Request to /teacher-info: %s", request.method)
 
     if request.method == "GET":
-        if os.path.exists(teacher_info_path):
+        def build():
+            if not os.path.exists(teacher_info_path):
+                return [], {}
             with open(teacher_info_path, "r", encoding="utf-8") as f:
-                return jsonify(json.load(f))
-        return jsonify([])
+                return json.load(f), {}
+
+        body = http_cache.get("teacher-info", "", file_digest(teacher_info_path), build)
+        return http_cache.respond(body, TEACHER_INFO_CACHE_CONTROL)
 
     if request.method == "POST":
         data = request.json
@@ -152,4 +485,6 @@ def manage_teacher_info():
         return jsonify({"message": "Info updated successfully"})
 
 if __name__ == "__main__":
+    # Pick up template edits without restarting the dev server
+    jinja_env.auto_reload = True
     app.run(debug=True, port=5000)
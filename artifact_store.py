@@ -0,0 +1,244 @@
+"""
+Published artifacts under output_pdfs/, with expiry and a byte quota.
+Every journal, mind map and binder offered for download is recorded in a
+SQLite index shared by the workers (name, size, last access). A download
+refreshes the entry, so a file stays downloadable as long as it keeps being
+used. One background sweeper per worker removes entries idle for longer than
+ARTIFACT_TTL_SECONDS. It then evicts the least recently used files until
+output_pdfs/ fits in ARTIFACT_MAX_MB. A lock file makes sure only one worker
+sweeps at a time. The rendered bytes stay in the PDF store, so publishing an
+expired artifact again never re-renders it.
+"""
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pdf_store import pdf_store
+from observability import get_logger
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "output_pdfs")
+ARTIFACTS_DB_PATH = os.getenv("ARTIFACTS_DB_PATH", "data/artifacts.sqlite3")
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", "900"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_MB", "512")) * 1024 * 1024
+ARTIFACT_SWEEP_INTERVAL = float(os.getenv("ARTIFACT_SWEEP_INTERVAL", "60"))
+
+log = get_logger(__name__)
+
+
+class ArtifactStore:
+    def __init__(self, root: str = ARTIFACT_DIR, db_path: str = ARTIFACTS_DB_PATH,
+                 ttl_seconds: int = ARTIFACT_TTL_SECONDS, max_bytes: int = ARTIFACT_MAX_BYTES,
+                 sweep_interval: float = ARTIFACT_SWEEP_INTERVAL):
+        """
+        Initialize the store.
+
+        Args:
+            root: Directory the artifacts are published in (served by /download_pdf)
+            db_path: SQLite file holding the access index
+            ttl_seconds: Idle time after which an artifact is removed
+            max_bytes: Byte quota for root (0 disables eviction)
+            sweep_interval: Seconds between sweeps
+        """
+        self.root = root
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.last_sweep: Optional[float] = None
+        self.stats = {
+            "published": 0,
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evicted": 0
+        }
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                "name TEXT PRIMARY KEY, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS artifacts_accessed ON artifacts (accessed)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    def path_for(self, filename: str) -> str:
+        return os.path.join(self.root, filename)
+
+    def _touch(self, filename: str, size: int) -> None:
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO artifacts (name, size, created, accessed) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET size = excluded.size, accessed = excluded.accessed",
+            (filename, size, now, now)
+        )
+
+    def publish(self, key: str, filename: str, ext: str = "pdf") -> str:
+        """
+        Expose a PDF store artifact as root/filename and start its TTL.
+
+        Args:
+            key: PDF store key
+            filename: Download name (no directories)
+            ext: Stored artifact type ("pdf" or "png")
+
+        Returns:
+            Published path
+        """
+        # Index first: a sweep that is removing this name finishes before the new link appears
+        self._touch(filename, os.path.getsize(pdf_store.path_for(key, ext)))
+        path = pdf_store.publish(key, self.path_for(filename), ext)
+        self._count("published")
+        if self.max_bytes and self.total_bytes() > self.max_bytes:
+            self._wake.set()
+        return path
+
+    def open(self, filename: str) -> Optional[str]:
+        """
+        Look up a published artifact for download and refresh its TTL.
+
+        Returns:
+            Path, or None if it does not exist (or has expired)
+        """
+        path = self.path_for(filename)
+        if filename.startswith(".") or not os.path.isfile(path):
+            # Publish temp files are hidden; a missing file's stale row just goes away
+            self._conn().execute("DELETE FROM artifacts WHERE name = ?", (filename,))
+            self._count("misses")
+            return None
+        self._touch(filename, os.path.getsize(path))
+        self._count("hits")
+        return path
+
+    def total_bytes(self) -> int:
+        return self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+
+    def start(self) -> None:
+        """Start this process's sweeper thread (no-op if already running)."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name="artifact-sweeper", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.sweep(blocking=False)
+            except Exception as e:
+                log.error("❌ Artifact sweep failed: %s", e)
+            self._wake.wait(self.sweep_interval)
+            self._wake.clear()
+
+    def sweep(self, blocking: bool = True) -> Dict[str, int]:
+        """
+        Remove expired artifacts, then evict the least recently used ones
+        until the directory fits the quota.
+
+        Args:
+            blocking: Wait for another process's sweep instead of skipping
+
+        Returns:
+            Counts of expired and evicted files
+        """
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with open(self.db_path + ".sweep.lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return {"expired": 0, "evicted": 0}
+            try:
+                return self._sweep_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sweep_locked(self) -> Dict[str, int]:
+        self._index_untracked_files()
+        conn = self._conn()
+        now = time.time()
+        removed = {"expired": 0, "evicted": 0}
+        # The file is unlinked inside the transaction, so a concurrent publish()
+        # (which indexes before linking) can't lose its new file
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute("SELECT name FROM artifacts WHERE accessed < ?",
+                                   (now - self.ttl_seconds,)).fetchall()
+            for (name,) in expired:
+                self._remove(conn, name)
+                removed["expired"] += 1
+            if self.max_bytes:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+                for name, size in conn.execute("SELECT name, size FROM artifacts ORDER BY accessed").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._remove(conn, name)
+                    total -= size
+                    removed["evicted"] += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.last_sweep = now
+        self._count("expired", removed["expired"])
+        self._count("evicted", removed["evicted"])
+        if removed["expired"] or removed["evicted"]:
+            log.info("🧹 Artifacts: %d expired, %d evicted", removed["expired"], removed["evicted"])
+        return removed
+
+    def _remove(self, conn: sqlite3.Connection, name: str) -> None:
+        conn.execute("DELETE FROM artifacts WHERE name = ?", (name,))
+        try:
+            os.remove(self.path_for(name))
+        except FileNotFoundError:
+            pass
+
+    def _index_untracked_files(self) -> None:
+        """Give files published before the index existed (or copied in by hand) a TTL from their mtime."""
+        try:
+            entries = [e for e in os.scandir(self.root) if e.is_file() and not e.name.startswith(".")]
+        except FileNotFoundError:
+            return
+        conn = self._conn()
+        known = {name for (name,) in conn.execute("SELECT name FROM artifacts")}
+        for entry in entries:
+            if entry.name in known:
+                continue
+            st = entry.stat()
+            conn.execute("INSERT OR IGNORE INTO artifacts (name, size, created, accessed) VALUES (?, ?, ?, ?)",
+                         (entry.name, st.st_size, st.st_mtime, st.st_mtime))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        files, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts").fetchone()
+        stats.update({
+            "files": files,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "last_sweep": self.last_sweep
+        })
+        return stats
+
+
+# Global store instance
+artifact_store = ArtifactStore()
@@ -0,0 +1,226 @@
+"""
+ASGI entry point: the same URLs and JSON as app.py, served from an event loop.
+    gunicorn -k uvicorn_worker.UvicornWorker --workers 3 --bind 0.0.0.0:5000 asgi:app
+POST /generate_from_id/<id>, the slow path (OpenAI round trip, then Chromium),
+runs natively on the worker's event loop with AsyncOpenAI and async
+Playwright. A pending generation is just a coroutine, so one process holds
+dozens of them in flight without a thread each; only its short blocking steps
+(SQLite, file stores, templates) borrow a thread. Every other request (uploads,
+jobs, SSE streams, stats, the async/mindmap/format variants of the route
+above) goes to the Flask app unchanged, on a bounded thread pool.
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from app import app as flask_app
+from artifact_store import artifact_store
+from browser_pool import async_browser_pool
+from jobs import job_queue
+from lesson_registry import lesson_registry
+from pdf_generator import process_with_ai_async, generate_pdf_from_lesson_data_async
+from preprocess_data import lesson_scanner
+from observability import get_logger, metrics, request_seconds, start_request_timing, server_timing_header
+
+# Threads running Flask for the routes that aren't native (SSE streams and long polls hold one each)
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+
+GENERATE_FROM_ID_PATH = re.compile(r"^/generate_from_id/(\d+)$")
+GENERATE_FROM_ID_RULE = "/generate_from_id/<int:lesson_id>"
+
+log = get_logger(__name__)
+
+_wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    lesson_id = _native_generate_id(scope)
+    if lesson_id is not None:
+        await _generate_from_id(scope, lesson_id, send)
+    else:
+        await _call_flask(scope, receive, send)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            lesson_scanner.start()
+            job_queue.start()
+            artifact_store.start()
+            metrics.start()
+            try:
+                await async_browser_pool.start()
+            except Exception as e:
+                # Renders will retry the start; the rest of the app works without Chromium
+                log.error("❌ Could not start async Playwright: %s", e)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_browser_pool.shutdown()
+            _wsgi_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+# ---------------------------
+# NATIVE ROUTES
+# ---------------------------
+def _native_generate_id(scope):
+    """Lesson id if this is a plain synchronous POST /generate_from_id/<id>, else None (Flask serves it)."""
+    if scope["method"] != "POST":
+        return None
+    match = GENERATE_FROM_ID_PATH.match(scope["path"])
+    if not match:
+        return None
+    query = parse_qs(scope["query_string"].decode("latin-1"))
+    if query.keys() & {"async", "mindmap", "format"}:
+        return None
+    prefer = next((v for k, v in scope["headers"] if k == b"prefer"), b"")
+    if b"respond-async" in prefer:
+        return None
+    return int(match.group(1))
+
+
+async def _generate_from_id(scope, lesson_id, send):
+    """app.generate_from_id without ?async, ?mindmap or ?format=pdf, awaited end to end."""
+    start = time.perf_counter()
+    start_request_timing()
+    try:
+        lesson = await asyncio.to_thread(lesson_registry.get, lesson_id)
+        if not lesson:
+            status, body = 404, {"error": "Lesson not found"}
+        else:
+            lesson_data = await process_with_ai_async(lesson["title"], lesson["subject"], lesson["level"],
+                                                      lesson["period"], lesson["week"], lesson["session"],
+                                                      lesson["content"])
+            if not lesson_data:
+                status, body = 500, {"error": "AI analysis failed"}
+            else:
+                pdf_path = await generate_pdf_from_lesson_data_async(lesson_data, f"{lesson['title']}.pdf")
+                status, body = 200, {"title": lesson["title"], "lesson_data": lesson_data, "pdf_path": pdf_path}
+    except Exception as e:
+        log.exception("❌ Generation failed for lesson %s", lesson_id)
+        status, body = 500, {"error": str(e)}
+
+    elapsed = time.perf_counter() - start
+    request_seconds.observe(elapsed, method="POST", endpoint=GENERATE_FROM_ID_RULE, status=status)
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"access-control-allow-origin", b"*"),
+        (b"access-control-expose-headers", b"X-Total-Count, Server-Timing")
+    ]
+    timing = server_timing_header(elapsed)
+    if timing:
+        headers += [(b"server-timing", timing.encode()), (b"timing-allow-origin", b"*")]
+    # Same serializer (and so the same bytes) as Flask's jsonify
+    payload = (flask_app.json.dumps(body) + "\n").encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": headers + [(b"content-length", str(len(payload)).encode())]})
+    await send({"type": "http.response.body", "body": payload})
+
+
+# ---------------------------
+# FLASK BRIDGE
+# ---------------------------
+class _ReceiveStream(io.RawIOBase):
+    """wsgi.input reading the ASGI request body from a worker thread, chunk by chunk."""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b""
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and not self._done:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                self._done = True
+                break
+            self._buffer = message.get("body", b"")
+            self._done = not message.get("more_body", False)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name == "content-length":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_flask(environ, send, loop):
+    """Run the WSGI app in this thread, forwarding every body chunk to the client as it is produced."""
+    def send_now(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+        return lambda data: send_body(data)
+
+    def send_body(chunk):
+        if not response.get("started"):
+            response["started"] = True
+            send_now({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+        if chunk:
+            send_now({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    iterable = flask_app(environ, start_response)
+    try:
+        for chunk in iterable:
+            send_body(chunk)
+        send_body(b"")
+        send_now({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+
+
+async def _call_flask(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    environ = _environ(scope, io.BufferedReader(_ReceiveStream(receive, loop)))
+    await loop.run_in_executor(_wsgi_executor, _run_flask, environ, send, loop)
@@ -0,0 +1,241 @@
+"""
+Load test of the ASGI mode (asgi.py) against the default gunicorn sync
+workers (app.py), with OpenAI replaced by fake_openai.py.
+
+Each mode runs as its own server process tree with fresh state. Both get the
+same burst of /generate_from_id misses (one distinct lesson per request), so
+every request waits on the fake LLM. Sync workers can only hold workers x
+threads generations at once; the ASGI worker holds all of them on its event
+loop. Peak RSS of the server processes shows what that concurrency costs in
+memory.
+
+Usage:
+    python benchmarks/bench_async.py                                   # 64 requests, 64 at once, 2 s LLM
+    python benchmarks/bench_async.py --latency 4 --concurrency 32 --requests 90
+    python benchmarks/bench_async.py --sync-workers 3 --sync-threads 4 --async-workers 1
+    python benchmarks/bench_async.py --baseline benchmarks/results/async-main.json
+
+Chromium is replaced by a fixed delay (--stub-chromium-ms) in both modes, so
+the numbers isolate request handling. Writes benchmarks/results/async.json.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import (REPO_ROOT, RESULTS_DIR, isolate_state, stub_chromium, summarize,  # noqa: E402
+                               write_results, compare_with_baseline)
+
+MODES = ("sync", "async")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(port, method, path, timeout=600):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request(method, path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def tree_rss_mb(pid):
+    """RSS of a process and all its descendants, in MB (Linux /proc)."""
+    total, stack = 0.0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status", "r") as f:
+                total += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0) / 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children", "r") as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def serve(args):
+    """Child process: stub Chromium, then run the app under gunicorn (sync) or uvicorn (async)."""
+    isolate_state(args.state_dir)
+    if args.serve == "async":
+        import uvicorn
+        import asgi
+        stub_chromium(args.stub_chromium_ms)
+        uvicorn.run(asgi.app, host="127.0.0.1", port=args.port, workers=1, log_level="warning",
+                    access_log=False)
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class SyncServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"127.0.0.1:{args.port}")
+            self.cfg.set("workers", args.sync_workers)
+            self.cfg.set("threads", args.sync_threads)
+            self.cfg.set("timeout", 600)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            import app
+            stub_chromium(args.stub_chromium_ms)
+            return app.app
+
+    SyncServer().run()
+
+
+def start_server(mode, args, scratch, fake_url):
+    port = free_port()
+    state_dir = os.path.join(scratch, mode)
+    os.makedirs(state_dir)
+    env = dict(os.environ, OPENAI_BASE_URL=fake_url, OPENAI_API_KEY="fake", LOG_LEVEL="WARNING",
+               PYTHONPATH=REPO_ROOT)
+    command = [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port),
+               "--state-dir", state_dir, "--stub-chromium-ms", str(args.stub_chromium_ms),
+               "--sync-workers", str(args.sync_workers), "--sync-threads", str(args.sync_threads)]
+    log = open(os.path.join(scratch, f"{mode}.log"), "w")
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if request(port, "GET", "/", timeout=2)[0] == 200:
+                return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit(f"{mode} server did not start, see {log.name}")
+
+
+def load_test(port, pid, lesson_ids, concurrency):
+    """Fire one request per lesson id from `concurrency` client threads, sampling server RSS."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    in_flight = {"now": 0, "peak": 0}
+    rss = {"peak": tree_rss_mb(pid)}
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.wait(0.1):
+            rss["peak"] = max(rss["peak"], tree_rss_mb(pid))
+
+    def one(lesson_id):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        start = time.perf_counter()
+        try:
+            status, _ = request(port, "POST", f"/generate_from_id/{lesson_id}")
+        except OSError as e:
+            status = str(e)
+        elapsed = time.perf_counter() - start
+        with lock:
+            in_flight["now"] -= 1
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors.append(status)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, lesson_ids))
+    wall = time.perf_counter() - wall_start
+    sampling.set()
+    sampler.join()
+    if errors:
+        print(f"⚠️  {len(errors)} failed requests, e.g. {errors[0]}")
+    summary = summarize(latencies, wall, len(errors))
+    summary["peak_rss_mb"] = round(rss["peak"], 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--requests", type=int, default=64, help="distinct lessons requested (cache misses)")
+    parser.add_argument("--concurrency", type=int, default=64, help="simultaneous client connections")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake OpenAI latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--stub-chromium-ms", type=float, default=150, help="fixed delay replacing page.pdf")
+    parser.add_argument("--sync-workers", type=int, default=3, help="gunicorn workers in sync mode")
+    parser.add_argument("--sync-threads", type=int, default=4, help="threads per gunicorn worker in sync mode")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "async.json"))
+    parser.add_argument("--baseline", help="previous async.json to compare with")
+    # Internal: run one server (started by the parent process)
+    parser.add_argument("--serve", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--state-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    modes = args.modes.split(",")
+    os.chdir(REPO_ROOT)
+    scratch = tempfile.mkdtemp(prefix="bench-async-")
+
+    from fake_openai import FakeOpenAIServer
+    fake = FakeOpenAIServer(latency=args.latency, jitter=args.jitter).start()
+    print(f"🚀 Fake OpenAI at {fake.base_url} (latency {args.latency}s), logs in {scratch}")
+
+    results = {}
+    try:
+        for mode in modes:
+            process, port = start_server(mode, args, scratch, fake.base_url)
+            try:
+                lessons = json.loads(request(port, "GET", "/lessons?slim=1")[1])
+                lesson_ids = [lesson["id"] for lesson in lessons][:args.requests]
+                idle_rss = tree_rss_mb(process.pid)
+                summary = load_test(port, process.pid, lesson_ids, args.concurrency)
+                summary["idle_rss_mb"] = round(idle_rss, 1)
+                results[mode] = summary
+                capacity = (f"{args.sync_workers} workers x {args.sync_threads} threads" if mode == "sync"
+                            else "1 worker, event loop")
+                print(f"{mode:6} ({capacity}) n={summary['requests']:<4} p50 {summary['p50_ms']:9.1f} ms  "
+                      f"p95 {summary['p95_ms']:9.1f} ms  {summary['throughput_rps']:7.2f} req/s  "
+                      f"RSS {summary['idle_rss_mb']:.0f} → {summary['peak_rss_mb']:.0f} MB  "
+                      f"errors {summary['errors']}")
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        fake.stop()
+
+    if "sync" in results and "async" in results and results["sync"]["throughput_rps"]:
+        speedup = results["async"]["throughput_rps"] / results["sync"]["throughput_rps"]
+        print(f"⚡ ASGI mode: {speedup:.1f}x the throughput of sync workers")
+
+    config = {
+        "modes": modes,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "openai_latency_s": args.latency,
+        "openai_jitter_s": args.jitter,
+        "stub_chromium_ms": args.stub_chromium_ms,
+        "sync_workers": args.sync_workers,
+        "sync_threads": args.sync_threads,
+    }
+    write_results(args.output, "async", config, results)
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
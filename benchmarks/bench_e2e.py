@@ -0,0 +1,223 @@
+"""
+End-to-end benchmark: the Flask app over real HTTP, with OpenAI replaced by
+fake_openai.py (configurable latency) and, optionally, Chromium replaced by
+a fixed render delay.
+
+Usage:
+    python benchmarks/bench_e2e.py                             # every scenario at concurrency 1, 4, 16
+    python benchmarks/bench_e2e.py --latency 2 --jitter 0.5    # slower "OpenAI"
+    python benchmarks/bench_e2e.py --stub-chromium-ms 150      # no Chromium on this machine
+    python benchmarks/bench_e2e.py --scenarios lessons,hit --concurrency 8 --requests 200
+    python benchmarks/bench_e2e.py --baseline benchmarks/results/e2e-main.json
+
+Scenarios:
+    lessons      GET /lessons?slim=1
+    hit          POST /generate_from_id/<id> with the AI result cached
+    miss         POST /generate_from_id/<id> after /cache/clear (one request per lesson)
+    upload       POST /generate with synthetic .pptx decks
+    download     GET /download_pdf/<file> of an already generated journal
+
+Reports p50/p95/p99 latency and throughput per scenario and concurrency
+level and writes benchmarks/results/e2e.json. The AI cache, PDF store,
+jobs and locks live in a temporary directory, so data/ is never touched.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import (REPO_ROOT, RESULTS_DIR, isolate_state, stub_chromium, summarize,  # noqa: E402
+                               write_results, compare_with_baseline)
+
+SCENARIOS = ("lessons", "hit", "miss", "upload", "download")
+
+
+class Client:
+    """Minimal HTTP client; one connection per request, like independent browsers."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=600)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+
+def multipart(filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/vnd.openxmlformats-officedocument.presentationml.presentation\r\n\r\n"
+            ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def run_level(client, make_request, requests, concurrency):
+    """Send `requests` requests from `concurrency` threads; returns the summary."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def one(i):
+        method, path, body, headers = make_request(i)
+        start = time.perf_counter()
+        try:
+            status, _ = client.request(method, path, body, headers)
+        except OSError as e:
+            status = str(e)
+        elapsed = time.perf_counter() - start
+        with lock:
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors.append(status)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - wall_start
+    if errors:
+        print(f"⚠️  {len(errors)} failed requests, e.g. {errors[0]}")
+    return summarize(latencies, wall, len(errors))
+
+
+def build_decks(directory, count, slides):
+    """Synthetic decks named like real uploads, so metadata extraction succeeds."""
+    from benchmarks.bench_extract import build_synthetic_corpus
+    decks = []
+    for i, path in enumerate(build_synthetic_corpus(directory, decks=count, slides=slides)):
+        with open(path, "rb") as f:
+            decks.append((f"FR_N5_P1_SEM{i + 1}_S1.pptx", f.read()))
+    return decks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of the scenarios")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario and level")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--stub-chromium-ms", type=float,
+                        help="replace page.pdf with this fixed delay (for machines without Chromium)")
+    parser.add_argument("--decks", type=int, default=5, help="synthetic decks for the upload scenario")
+    parser.add_argument("--slides", type=int, default=30)
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "e2e.json"))
+    parser.add_argument("--baseline", help="previous e2e.json to compare with")
+    parser.add_argument("--verbose", action="store_true", help="show the app's INFO log and every request (default: warnings only)")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    # The app resolves data/lessons.json and templates/ relative to the repo
+    os.chdir(REPO_ROOT)
+    scratch = tempfile.mkdtemp(prefix="bench-e2e-")
+    isolate_state(scratch)
+
+    from fake_openai import FakeOpenAIServer
+    fake = FakeOpenAIServer(latency=args.latency, jitter=args.jitter).start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ["OPENAI_API_KEY"] = "fake"
+
+    if not args.verbose:
+        # Keep the app's INFO logs out of the result table
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    import app as app_module
+    from browser_pool import browser_pool
+    if args.stub_chromium_ms is not None:
+        stub_chromium(args.stub_chromium_ms)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *a, **kw):
+            pass
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True,
+                         request_handler=WSGIRequestHandler if args.verbose else QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = Client("127.0.0.1", server.server_port)
+    print(f"🚀 App on :{server.server_port}, fake OpenAI at {fake.base_url} "
+          f"(latency {args.latency}s ± {args.jitter}s)")
+
+    lesson_ids = [lesson["id"] for lesson in json.loads(client.request("GET", "/lessons?slim=1")[1])]
+    hit_id = lesson_ids[0]
+    decks = build_decks(scratch, args.decks, args.slides) if "upload" in scenarios else []
+
+    def warm_pdf():
+        status, body = client.request("POST", f"/generate_from_id/{hit_id}")
+        if status != 200:
+            sys.exit(f"Could not generate a journal to warm up: HTTP {status} {body[:200]!r}")
+        return os.path.basename(json.loads(body)["pdf_path"])
+
+    pdf_name = warm_pdf()
+
+    def make(scenario):
+        if scenario == "lessons":
+            return lambda i: ("GET", "/lessons?slim=1", None, {})
+        if scenario == "hit":
+            return lambda i: ("POST", f"/generate_from_id/{hit_id}", None, {})
+        if scenario == "miss":
+            return lambda i: ("POST", f"/generate_from_id/{lesson_ids[i % len(lesson_ids)]}", None, {})
+        if scenario == "upload":
+            def upload(i):
+                body, headers = multipart(*decks[i % len(decks)])
+                return "POST", "/generate", body, headers
+            return upload
+        return lambda i: ("GET", f"/download_pdf/{quote(pdf_name)}", None, {})
+
+    results = {}
+    try:
+        for scenario in scenarios:
+            results[scenario] = {}
+            for concurrency in levels:
+                requests = args.requests
+                if scenario == "miss":
+                    # Every request must be a distinct lesson, or the second one hits
+                    client.request("POST", "/cache/clear")
+                    requests = min(requests, len(lesson_ids))
+                elif scenario == "download":
+                    pdf_name = warm_pdf()  # the artifact sweeper may have removed the last one
+                summary = run_level(client, make(scenario), requests, concurrency)
+                results[scenario][f"c{concurrency}"] = summary
+                print(f"{scenario:9} c={concurrency:<3} n={summary['requests']:<4} p50 {summary['p50_ms']:9.1f} ms  "
+                      f"p95 {summary['p95_ms']:9.1f} ms  p99 {summary['p99_ms']:9.1f} ms  "
+                      f"{summary['throughput_rps']:8.1f} req/s  errors {summary['errors']}")
+    finally:
+        server.shutdown()
+        fake.stop()
+        browser_pool.shutdown()
+
+    config = {
+        "scenarios": scenarios,
+        "concurrency": levels,
+        "requests": args.requests,
+        "openai_latency_s": args.latency,
+        "openai_jitter_s": args.jitter,
+        "stub_chromium_ms": args.stub_chromium_ms,
+        "decks": args.decks if decks else 0,
+        "slides": args.slides if decks else 0,
+        "fake_openai_requests": fake.requests,
+    }
+    write_results(args.output, "e2e", config, results)
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: slide-XML extractor vs the original python-pptx extractor.
+
+Usage:
+    python benchmarks/bench_extract.py                  # synthetic corpus
+    python benchmarks/bench_extract.py --corpus lessons # real decks
+    python benchmarks/bench_extract.py --media-mb 100   # add a 100 MB embedded video
+
+Reports median time, peak Python memory (tracemalloc) and characters
+extracted per deck, and writes benchmarks/results/extract.json.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocess_data import extract_text_from_pptx, extract_text_from_pptx_legacy  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def build_synthetic_corpus(directory, decks=5, slides=30, media_mb=0):
+    """Decks with titles, group shapes, tables and speaker notes (python-pptx)."""
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    paths = []
+    for d in range(decks):
+        prs = Presentation()
+        for s in range(slides):
+            slide = prs.slides.add_slide(prs.slide_layouts[5])
+            slide.shapes.title.text = f"الحصة {s + 1} - Séance {s + 1}"
+            group = slide.shapes.add_group_shape()
+            box = group.shapes.add_textbox(Inches(1), Inches(2), Inches(4), Inches(1))
+            box.text_frame.text = "نشاط اعتيادي\n\n\nتعيين تلميذ(ة) للإجابة"
+            table = slide.shapes.add_table(2, 2, Inches(1), Inches(4), Inches(4), Inches(1)).table
+            table.cell(0, 0).text = "Oral"
+            table.cell(1, 1).text = "Lecture – Phrases"
+            slide.notes_slide.notes_text_frame.text = f"Les élèves lisent puis répondent (fiche {d + 1})."
+        if media_mb:
+            video = os.path.join(directory, "video.bin")
+            with open(video, "wb") as f:
+                f.write(os.urandom(media_mb * 1024 * 1024))
+            prs.slides[0].shapes.add_movie(video, Inches(0), Inches(0), Inches(1), Inches(1), mime_type="video/mp4")
+        path = os.path.join(directory, f"deck_{d}.pptx")
+        prs.save(path)
+        paths.append(path)
+    return paths
+
+
+def measure(fn, path, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        text = fn(path)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 2),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "chars": len(text),
+        "lines": len(text.splitlines())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of .pptx decks (default: generate a synthetic corpus)")
+    parser.add_argument("--decks", type=int, default=5)
+    parser.add_argument("--slides", type=int, default=30)
+    parser.add_argument("--media-mb", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "extract.json"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            paths = sorted(glob.glob(os.path.join(args.corpus, "*.pptx")))
+        else:
+            paths = build_synthetic_corpus(tmp, args.decks, args.slides, args.media_mb)
+        if not paths:
+            sys.exit("No .pptx decks found")
+
+        rows = []
+        for path in paths:
+            legacy = measure(extract_text_from_pptx_legacy, path, args.repeats)
+            fast = measure(extract_text_from_pptx, path, args.repeats)
+            rows.append({"deck": os.path.basename(path), "size_mb": round(os.path.getsize(path) / 1024 / 1024, 2),
+                         "legacy": legacy, "xml": fast})
+            print(f"{os.path.basename(path):40} legacy {legacy['median_ms']:8.1f} ms {legacy['peak_mb']:7.1f} MB "
+                  f"{legacy['chars']:6} ch | xml {fast['median_ms']:8.1f} ms {fast['peak_mb']:7.1f} MB {fast['chars']:6} ch")
+
+    total_legacy = sum(r["legacy"]["median_ms"] for r in rows)
+    total_fast = sum(r["xml"]["median_ms"] for r in rows)
+    summary = {
+        "decks": len(rows),
+        "legacy_total_ms": round(total_legacy, 2),
+        "xml_total_ms": round(total_fast, 2),
+        "speedup": round(total_legacy / total_fast, 2) if total_fast else None,
+        "legacy_peak_mb": max(r["legacy"]["peak_mb"] for r in rows),
+        "xml_peak_mb": max(r["xml"]["peak_mb"] for r in rows)
+    }
+    print(json.dumps(summary, indent=2))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"benchmark": "extract", "timestamp": time.time(), "summary": summary, "decks": rows},
+                  f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Micro-benchmarks of the hot steps behind /generate_from_id, each timed on
+its own: slide text extraction, the AI cache lookup, the Jinja render and
+Chromium's page.pdf.
+
+Usage:
+    python benchmarks/bench_micro.py                 # everything (page.pdf needs Chromium)
+    python benchmarks/bench_micro.py --repeats 500
+    python benchmarks/bench_micro.py --baseline benchmarks/results/micro-main.json
+
+Reports median/p95/min per operation and writes benchmarks/results/micro.json.
+page.pdf is reported as skipped, with the reason, when Chromium can't start.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import (REPO_ROOT, RESULTS_DIR, isolate_state, chromium_unavailable, percentile,  # noqa: E402
+                               write_results, compare_with_baseline)
+
+SAMPLE_STEPS = [
+    {"name": "Mise en situation", "duration": "5 min", "icon": "🎯",
+     "content": "L'enseignant présente la situation et pose des questions d'anticipation."},
+    {"name": "Lecture", "duration": "15 min", "icon": "📖",
+     "content": "Lecture silencieuse puis lecture magistrale ; les élèves lisent à tour de rôle."},
+    {"name": "Compréhension", "duration": "15 min", "icon": "🧠",
+     "content": "Questions de compréhension, justification dans le texte, synthèse au tableau."},
+    {"name": "Évaluation", "duration": "10 min", "icon": "✅",
+     "content": "Exercice écrit individuel et correction collective."},
+]
+SAMPLE_SUBJECTS = {"french": "français", "math": "mathématiques", "arabe": "langue arabe"}
+
+
+def time_calls(fn, repeats):
+    """Run fn() `repeats` times (output silenced); return timing stats in ms."""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()  # warm-up
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "runs": repeats,
+        "median_ms": round(percentile(times, 50) * 1000, 4),
+        "p95_ms": round(percentile(times, 95) * 1000, 4),
+        "min_ms": round(times[0] * 1000, 4),
+    }
+
+
+def sample_lesson_data(subject):
+    return {"title": "FR N5 P1 SEM1 S1", "subject": subject, "level": "5", "period": "1", "week": "1",
+            "session": "1", "objective": "Lire et comprendre un texte narratif.", "steps": SAMPLE_STEPS}
+
+
+def report(name, stats):
+    if "skipped" in stats:
+        print(f"{name:28} skipped: {stats['skipped']}")
+    else:
+        print(f"{name:28} median {stats['median_ms']:10.3f} ms  p95 {stats['p95_ms']:10.3f} ms  "
+              f"min {stats['min_ms']:10.3f} ms  ({stats['runs']} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=200, help="runs of the fast operations")
+    parser.add_argument("--slow-repeats", type=int, default=10, help="runs of extraction and page.pdf")
+    parser.add_argument("--slides", type=int, default=30, help="slides in the synthetic deck")
+    parser.add_argument("--no-pdf", action="store_true", help="skip page.pdf")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "micro.json"))
+    parser.add_argument("--baseline", help="previous micro.json to compare with")
+    args = parser.parse_args()
+
+    os.chdir(REPO_ROOT)
+    scratch = tempfile.mkdtemp(prefix="bench-micro-")
+    isolate_state(scratch)
+    os.environ.setdefault("OPENAI_API_KEY", "unused")  # the client is created at import, never called
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from benchmarks.bench_extract import build_synthetic_corpus
+    from cache import LessonCache
+    from preprocess_data import extract_text_from_pptx
+    from pdf_generator import render_lesson_html, render_pdf_bytes
+    from browser_pool import browser_pool
+
+    results = {}
+
+    deck = build_synthetic_corpus(scratch, decks=1, slides=args.slides)[0]
+    results["extract_text_from_pptx"] = time_calls(lambda: extract_text_from_pptx(deck), args.slow_repeats)
+    report("extract_text_from_pptx", results["extract_text_from_pptx"])
+
+    content = extract_text_from_pptx(deck)
+    lesson_data = sample_lesson_data("français")
+    cache = LessonCache(db_path=os.path.join(scratch, "micro-cache.sqlite3"))
+    cache.set(content, "fr", "français", "1", lesson_data)
+    # No memory tier: every lookup goes to SQLite
+    disk_only = LessonCache(max_memory_bytes=0, db_path=os.path.join(scratch, "micro-cache.sqlite3"))
+    cases = {
+        "lesson_cache.get.memory_hit": lambda: cache.get(content, "fr", "français", "1"),
+        "lesson_cache.get.disk_hit": lambda: disk_only.get(content, "fr", "français", "1"),
+        "lesson_cache.get.miss": lambda: cache.get(content + " (autre)", "fr", "français", "1"),
+    }
+    for name, fn in cases.items():
+        results[name] = time_calls(fn, args.repeats)
+        report(name, results[name])
+
+    htmls = {}
+    for template, subject in SAMPLE_SUBJECTS.items():
+        data = sample_lesson_data(subject)
+        name = f"jinja_render.{template}"
+        results[name] = time_calls(lambda: render_lesson_html(data), args.repeats)
+        report(name, results[name])
+        with contextlib.redirect_stdout(io.StringIO()):
+            htmls[template] = render_lesson_html(data)
+
+    reason = "--no-pdf" if args.no_pdf else chromium_unavailable()
+    for template, html in htmls.items():
+        name = f"page_pdf.{template}"
+        results[name] = {"skipped": reason} if reason else time_calls(lambda: render_pdf_bytes(html), args.slow_repeats)
+        report(name, results[name])
+    browser_pool.shutdown()
+
+    config = {"repeats": args.repeats, "slow_repeats": args.slow_repeats, "slides": args.slides,
+              "content_chars": len(content)}
+    write_results(args.output, "micro", config, results)
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Helpers shared by the benchmarks: isolated state, latency summaries, the
+Chromium stub and machine-readable results (with an optional comparison
+against a previous run).
+"""
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# Smallest well-formed PDF, returned by the Chromium stub
+STUB_PDF = (b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+            b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+            b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n"
+            b"trailer<</Root 1 0 R>>\n%%EOF\n")
+STUB_PNG = b"\x89PNG\r\n\x1a\n"
+
+
+def isolate_state(directory: str) -> None:
+    """
+    Point every on-disk store (AI cache, PDF store, artifacts, jobs, locks,
+    Jinja cache, metrics, OpenAI batch state) at a scratch directory and lift
+    the OpenAI rate limit. Must run before the app modules are imported,
+    since they read their paths at import time.
+    """
+    os.environ.update({
+        "CACHE_DB_PATH": os.path.join(directory, "cache.sqlite3"),
+        "PDF_STORE_DIR": os.path.join(directory, "pdf_store"),
+        "JOBS_DB_PATH": os.path.join(directory, "jobs.sqlite3"),
+        "SINGLEFLIGHT_LOCK_DIR": os.path.join(directory, "locks"),
+        "LLM_RATE_STATE_PATH": os.path.join(directory, "locks", "llm-rate.json"),
+        "LLM_BATCH_RATE_STATE_PATH": os.path.join(directory, "locks", "llm-rate-batch.json"),
+        "JINJA_CACHE_DIR": os.path.join(directory, "jinja_cache"),
+        "ARTIFACT_DIR": os.path.join(directory, "output_pdfs"),
+        "ARTIFACTS_DB_PATH": os.path.join(directory, "artifacts.sqlite3"),
+        # Otherwise the run's snapshots would be summed into the production /metrics
+        "METRICS_DIR": os.path.join(directory, "metrics"),
+        "OPENAI_BATCH_STATE": os.path.join(directory, "openai_batch.json"),
+        "OPENAI_BATCH_DIR": os.path.join(directory, "openai_batches"),
+        "LLM_RATE_PER_MINUTE": "0",
+    })
+
+
+def stub_chromium(render_ms: float) -> None:
+    """Replace page.pdf/screenshot with a fixed delay (for machines without Chromium)."""
+    import pdf_generator
+
+    def render_pdf_bytes(html_content):
+        time.sleep(render_ms / 1000)
+        return STUB_PDF
+
+    def render_png_bytes(html_content, width=None):
+        time.sleep(render_ms / 1000)
+        return STUB_PNG
+
+    async def render_pdf_bytes_async(html_content):
+        await asyncio.sleep(render_ms / 1000)
+        return STUB_PDF
+
+    pdf_generator.render_pdf_bytes = render_pdf_bytes
+    pdf_generator.render_png_bytes = render_png_bytes
+    pdf_generator.render_pdf_bytes_async = render_pdf_bytes_async
+
+
+def chromium_unavailable() -> Optional[str]:
+    """None when a pooled page can be used, otherwise the reason it can't."""
+    from browser_pool import browser_pool
+    try:
+        browser_pool.run(lambda page: page.set_content("<p>ok</p>"), timeout=60)
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}".splitlines()[0]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], wall_seconds: float, errors: int = 0) -> Dict[str, Any]:
+    """Latency percentiles (ms) and throughput for one run."""
+    values = sorted(latencies)
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+        "throughput_rps": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path: str, benchmark: str, config: Dict[str, Any], results: Dict[str, Any]) -> None:
+    """Write {"benchmark", "timestamp", "revision", "config", "results"} as JSON."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    payload = {
+        "benchmark": benchmark,
+        "timestamp": time.time(),
+        "revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"💾 Results written to {path}")
+
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline_path: str, metric_suffixes=("_ms", "_rps")) -> None:
+    """Print the relative change of every latency/throughput metric present in both runs."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = _flatten(json.load(f).get("results", {}))
+    current = _flatten(results)
+    print(f"\n📊 Compared with {baseline_path}")
+    for name, value in current.items():
+        old = baseline.get(name)
+        if not name.endswith(metric_suffixes) or not old:
+            continue
+        change = (value - old) / old * 100
+        better = change < 0 if name.endswith("_ms") else change > 0
+        marker = "  " if abs(change) < 5 else ("✅" if better else "⚠️ ")
+        print(f"{marker} {name:55} {old:10.2f} → {value:10.2f} ({change:+.1f}%)")
@@ -0,0 +1,130 @@
+"""
+Multi-lesson binder: a week or a whole period of journals in one PDF.
+Lesson data is fetched concurrently. Cache hits cost nothing, and misses
+share the OpenAI rate limit and retries. Consecutive journals that use the
+same template are joined into one HTML document with CSS page breaks and
+printed with a single page.pdf call. When subjects are mixed, the groups
+are merged with pypdf. Finished binders are kept in the PDF store.
+"""
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import Any, Dict, List
+
+from pypdf import PdfReader, PdfWriter
+
+from pdf_generator import (process_with_ai, select_template, render_lesson_html, render_pdf_bytes,
+                           TEACHER_INFO_PATH)
+from pdf_store import pdf_store
+from observability import get_logger
+
+BINDER_MAX_LESSONS = int(os.getenv("BINDER_MAX_LESSONS", "60"))
+BINDER_AI_CONCURRENCY = int(os.getenv("BINDER_AI_CONCURRENCY", "4"))
+
+log = get_logger(__name__)
+
+_BODY = re.compile(r"<body[^>]*>(.*)</body>", re.DOTALL | re.IGNORECASE)
+PAGE_BREAK_CSS = "<style>.binder-page { break-after: page; } .binder-page:last-child { break-after: auto; }</style>"
+
+
+class BinderError(Exception):
+    """The binder cannot be built (bad selection or AI failures)."""
+
+
+def _number(value: Any) -> int:
+    value = str(value)
+    return int(value) if value.isdigit() else 0
+
+
+def sort_lessons(lessons: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Selector results in teaching order (level, period, week, session)."""
+    order = ("level", "period", "week", "session")
+    return sorted(lessons, key=lambda l: (l["subject"], *(_number(l.get(f, "")) for f in order)))
+
+
+def binder_filename(lessons: List[Dict[str, Any]]) -> str:
+    first, last = lessons[0]["title"], lessons[-1]["title"]
+    return f"{first}.pdf" if first == last else f"{first} - {last}.pdf"
+
+
+def fetch_lesson_data(lessons: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    lesson_data for every lesson, fetched concurrently, in input order.
+
+    Raises:
+        BinderError: one or more AI calls failed
+    """
+    def fetch(lesson):
+        return process_with_ai(lesson["title"], lesson["subject"], lesson["level"], lesson["period"],
+                               lesson["week"], lesson["session"], lesson["content"])
+
+    with ThreadPoolExecutor(max_workers=max(1, min(BINDER_AI_CONCURRENCY, len(lessons)))) as executor:
+        results = list(executor.map(fetch, lessons))
+    failed = [lesson["title"] for lesson, data in zip(lessons, results) if not data]
+    if failed:
+        raise BinderError(f"AI analysis failed for: {', '.join(failed)}")
+    return results
+
+
+def combine_html(documents: List[str]) -> str:
+    """
+    One HTML document from several renders of the same template: the first
+    document's head (styles and inlined fonts, once) and every body in a
+    page-breaking section.
+    """
+    first = documents[0]
+    body_start = _BODY.search(first)
+    if not body_start:
+        raise BinderError("Template has no <body>")
+    head = first[:body_start.start()].replace("</head>", PAGE_BREAK_CSS + "</head>", 1)
+    pages = []
+    for document in documents:
+        match = _BODY.search(document)
+        pages.append(f'<section class="binder-page">{match.group(1)}</section>')
+    return f"{head}<body>{''.join(pages)}</body></html>"
+
+
+def merge_pdfs(parts: List[bytes]) -> bytes:
+    """Concatenate PDFs page by page."""
+    if len(parts) == 1:
+        return parts[0]
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(io.BytesIO(part)))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def build_binder_pdf(lessons: List[Dict[str, Any]]) -> str:
+    """
+    Make sure the binder PDF for these lessons (in this order) is in the PDF store.
+
+    Returns:
+        Artifact key
+    """
+    if not lessons:
+        raise BinderError("No lessons selected")
+    if len(lessons) > BINDER_MAX_LESSONS:
+        raise BinderError(f"At most {BINDER_MAX_LESSONS} lessons per binder")
+
+    lesson_datas = fetch_lesson_data(lessons)
+    templates = [select_template(data)[0] for data in lesson_datas]
+    page_keys = [pdf_store.make_key(data, os.path.join("templates", template), TEACHER_INFO_PATH)
+                 for data, template in zip(lesson_datas, templates)]
+    key = hashlib.sha256(("binder:" + ",".join(page_keys)).encode()).hexdigest()
+    if pdf_store.get_path(key):
+        log.debug("⚡ PDF store HIT for binder %s... (skipped render)", key[:16])
+        return key
+
+    # One Chromium pass per run of consecutive journals sharing a template
+    parts = []
+    for template, group in groupby(zip(templates, lesson_datas), key=lambda pair: pair[0]):
+        documents = [render_lesson_html(data) for _, data in group]
+        parts.append(render_pdf_bytes(combine_html(documents)))
+    pdf_store.put(key, merge_pdfs(parts))
+    log.info("📚 Binder rendered: %d journals in %d pass(es)", len(lessons), len(parts))
+    return key
@@ -0,0 +1,494 @@
+"""
+Per-process pool of warm headless Chromium browsers.
+Launching Chromium costs far more than rendering a journal, so each gunicorn
+worker keeps a few browsers (and one page per browser) alive between requests.
+Pages never touch the network except for BROWSER_ALLOWED_HOSTS (the Google
+Fonts stylesheet of the mind map): every other request is aborted, since
+templates arrive with their CSS and fonts inlined.
+
+AsyncBrowserPool is the same pool for the ASGI mode (asgi.py): it drives
+playwright.async_api on the worker's event loop, so a request waiting for a
+page holds no thread.
+"""
+import asyncio
+import atexit
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+
+from observability import get_logger
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+BROWSER_MAX_RENDERS = int(os.getenv("BROWSER_MAX_RENDERS", "200"))
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "400"))
+BROWSER_RSS_CHECK_EVERY = int(os.getenv("BROWSER_RSS_CHECK_EVERY", "10"))  # renders between RSS samples
+BROWSER_RENDER_TIMEOUT = float(os.getenv("BROWSER_RENDER_TIMEOUT", "120"))
+BROWSER_ALLOWED_HOSTS = frozenset(
+    host.strip() for host in os.getenv("BROWSER_ALLOWED_HOSTS", "fonts.googleapis.com,fonts.gstatic.com").split(",")
+    if host.strip()
+)
+BROWSER_LAUNCH_ARGS = ["--lang=ar"]
+
+log = get_logger(__name__)
+
+
+def request_allowed(url: str) -> bool:
+    """Whether a page may fetch url (an https URL on BROWSER_ALLOWED_HOSTS)."""
+    parts = urlsplit(url)
+    return parts.scheme == "https" and parts.hostname in BROWSER_ALLOWED_HOSTS
+
+
+def _pid_rss_mb(pid: int) -> float:
+    """Resident set size of a process in MB (0 when /proc is unavailable)."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+
+class _BrowserSlot(threading.Thread):
+    """
+    One Chromium process and its page, owned by a single thread.
+
+    Playwright's sync API objects may only be used from the thread that
+    created them, so every render on this browser is executed here.
+    """
+
+    def __init__(self, pool: "BrowserPool", index: int):
+        super().__init__(name=f"browser-slot-{index}", daemon=True)
+        self.pool = pool
+        self.index = index
+        self.playwright = None
+        self.browser = None
+        self.page = None
+        self.renders = 0
+        self.launches = 0
+        self.rss_mb = 0.0
+
+    def run(self) -> None:
+        try:
+            with sync_playwright() as p:
+                self.playwright = p
+                self._serve()
+        except Exception as e:
+            # Driver failed to start or died: fail queued renders instead of
+            # leaving callers blocked; the pool replaces this slot on next use.
+            log.error("❌ Browser slot %d crashed: %s", self.index, e)
+            while True:
+                try:
+                    job = self.pool._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None and job[1].set_running_or_notify_cancel():
+                    job[1].set_exception(e)
+
+    def _serve(self) -> None:
+        while True:
+            job = self.pool._jobs.get()
+            if job is None:
+                break
+            fn, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                page = self._checkout_page()
+                result = fn(page)
+            except Exception as e:
+                # A failed render can leave the page in an unknown state
+                self._close_browser()
+                self.pool._count("render_errors")
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+                self.renders += 1
+                self.pool._count("renders")
+                self._maybe_recycle()
+        self._close_browser()
+
+    def _launch(self) -> None:
+        self.browser = self.playwright.chromium.launch(headless=True, args=BROWSER_LAUNCH_ARGS)
+        self.page = self.browser.new_page()
+        self.page.route("**/*", self._block_request)
+        self.renders = 0
+        self.launches += 1
+        self.pool._count("launches")
+        log.info("🚀 Browser slot %d launched Chromium", self.index)
+
+    def _block_request(self, route) -> None:
+        if request_allowed(route.request.url):
+            route.continue_()
+            return
+        # A fetch that can't complete would stall page.pdf until it times out
+        log.warning("🚫 Blocked render request: %s", route.request.url[:80])
+        self.pool._count("blocked_requests")
+        route.abort()
+
+    def _healthy(self) -> bool:
+        """Cheap liveness probe: connected browser, open page, working JS."""
+        if self.browser is None or self.page is None:
+            return False
+        if not self.browser.is_connected() or self.page.is_closed():
+            return False
+        try:
+            return self.page.evaluate("1 + 1") == 2
+        except Exception:
+            return False
+
+    def _checkout_page(self):
+        if not self._healthy():
+            if self.browser is not None:
+                log.warning("⚠️  Browser slot %d failed health check, relaunching", self.index)
+                self.pool._count("health_failures")
+                self._close_browser()
+            self._launch()
+        return self.page
+
+    def _measure_rss_mb(self) -> float:
+        """Sum the RSS of every Chromium process (browser, GPU, renderers)."""
+        try:
+            cdp = self.browser.new_browser_cdp_session()
+            info = cdp.send("SystemInfo.getProcessInfo")
+            cdp.detach()
+        except Exception:
+            return 0.0
+        return sum(_pid_rss_mb(proc["id"]) for proc in info.get("processInfo", []))
+
+    def _maybe_recycle(self) -> None:
+        reason = None
+        if self.renders >= self.pool.max_renders:
+            reason = f"{self.renders} renders"
+        elif self.pool.max_rss_mb > 0 and self.renders % BROWSER_RSS_CHECK_EVERY == 0:
+            # A CDP round trip plus a /proc read per Chromium process: sampled, not per render
+            self.rss_mb = self._measure_rss_mb()
+            if self.rss_mb >= self.pool.max_rss_mb:
+                reason = f"{self.rss_mb:.0f} MB RSS"
+        if reason:
+            log.info("♻️  Recycling browser slot %d after %s", self.index, reason)
+            self.pool._count("recycles")
+            self._close_browser()
+
+    def _close_browser(self) -> None:
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Exception as e:
+                log.error("❌ Error closing browser in slot %d: %s", self.index, e)
+        self.browser = None
+        self.page = None
+        self.rss_mb = 0.0
+
+
+class BrowserPool:
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_renders: int = BROWSER_MAX_RENDERS,
+                 max_rss_mb: int = BROWSER_MAX_RSS_MB):
+        """
+        Initialize the pool. Browsers are launched lazily on first use.
+
+        Args:
+            size: Number of Chromium processes (and concurrent renders)
+            max_renders: Recycle a browser after this many renders
+            max_rss_mb: Recycle a browser once its processes exceed this RSS (0 disables)
+        """
+        self.size = max(1, size)
+        self.max_renders = max(1, max_renders)
+        self.max_rss_mb = max_rss_mb
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._slots: List[_BrowserSlot] = []
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self.stats = {
+            "renders": 0,
+            "render_errors": 0,
+            "launches": 0,
+            "recycles": 0,
+            "health_failures": 0,
+            "blocked_requests": 0,
+            "cancelled": 0
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def start(self) -> None:
+        """Start the slot threads for this process (no-op if already running)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads don't survive fork: a pool inherited from the
+                # gunicorn master must be rebuilt in the worker.
+                self._jobs = queue.Queue()
+                self._slots = []
+                self._pid = os.getpid()
+            if not self._slots:
+                self._slots = [_BrowserSlot(self, i) for i in range(self.size)]
+                for slot in self._slots:
+                    slot.start()
+                return
+            for i, slot in enumerate(self._slots):
+                if not slot.is_alive():
+                    self._slots[i] = _BrowserSlot(self, slot.index)
+                    self._slots[i].start()
+
+    def submit(self, fn: Callable[[Any], Any]) -> Future:
+        """
+        Schedule fn(page) on the next free warm page.
+
+        Returns:
+            Future resolving to fn's return value
+        """
+        self.start()
+        future: Future = Future()
+        self._jobs.put((fn, future))
+        return future
+
+    def run(self, fn: Callable[[Any], Any], timeout: Optional[float] = BROWSER_RENDER_TIMEOUT) -> Any:
+        """Run fn(page) on a warm page and wait for its result."""
+        future = self.submit(fn)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Nobody is waiting any more: a render still queued must not run for a caller that is gone
+            if future.cancel():
+                self._count("cancelled")
+            raise
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Close every browser and stop the slot threads."""
+        with self._lock:
+            if self._pid != os.getpid() or not self._slots:
+                return
+            slots, self._slots = self._slots, []
+            for _ in slots:
+                self._jobs.put(None)
+        for slot in slots:
+            slot.join(timeout=timeout)
+        log.info("🛑 Browser pool shut down")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get pool statistics.
+
+        Returns:
+            Dictionary with render counts and per-slot state
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            slots = list(self._slots) if self._pid == os.getpid() else []
+        stats.update({
+            "size": self.size,
+            "queued": self._jobs.qsize(),
+            "slots": [
+                {
+                    "index": slot.index,
+                    "alive": slot.is_alive(),
+                    "browser_running": slot.browser is not None,
+                    "renders_since_launch": slot.renders,
+                    "launches": slot.launches,
+                    "rss_mb": round(slot.rss_mb, 1)
+                }
+                for slot in slots
+            ]
+        })
+        return stats
+
+
+class _AsyncBrowserSlot:
+    """One Chromium process and its page, used by one render at a time (async API)."""
+
+    def __init__(self, pool: "AsyncBrowserPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.browser = None
+        self.page = None
+        self.renders = 0
+        self.launches = 0
+        self.rss_mb = 0.0
+
+    async def _launch(self) -> None:
+        self.browser = await self.pool._playwright.chromium.launch(headless=True, args=BROWSER_LAUNCH_ARGS)
+        self.page = await self.browser.new_page()
+        await self.page.route("**/*", self._block_request)
+        self.renders = 0
+        self.launches += 1
+        self.pool._count("launches")
+        log.info("🚀 Async browser slot %d launched Chromium", self.index)
+
+    async def _block_request(self, route) -> None:
+        if request_allowed(route.request.url):
+            await route.continue_()
+            return
+        log.warning("🚫 Blocked render request: %s", route.request.url[:80])
+        self.pool._count("blocked_requests")
+        await route.abort()
+
+    async def _healthy(self) -> bool:
+        if self.browser is None or self.page is None:
+            return False
+        if not self.browser.is_connected() or self.page.is_closed():
+            return False
+        try:
+            return await self.page.evaluate("1 + 1") == 2
+        except Exception:
+            return False
+
+    async def checkout_page(self):
+        if not await self._healthy():
+            if self.browser is not None:
+                log.warning("⚠️  Async browser slot %d failed health check, relaunching", self.index)
+                self.pool._count("health_failures")
+                await self.close_browser()
+            await self._launch()
+        return self.page
+
+    async def _measure_rss_mb(self) -> float:
+        try:
+            cdp = await self.browser.new_browser_cdp_session()
+            info = await cdp.send("SystemInfo.getProcessInfo")
+            await cdp.detach()
+        except Exception:
+            return 0.0
+        return sum(_pid_rss_mb(proc["id"]) for proc in info.get("processInfo", []))
+
+    async def maybe_recycle(self) -> None:
+        reason = None
+        if self.renders >= self.pool.max_renders:
+            reason = f"{self.renders} renders"
+        elif self.pool.max_rss_mb > 0 and self.renders % BROWSER_RSS_CHECK_EVERY == 0:
+            self.rss_mb = await self._measure_rss_mb()
+            if self.rss_mb >= self.pool.max_rss_mb:
+                reason = f"{self.rss_mb:.0f} MB RSS"
+        if reason:
+            log.info("♻️  Recycling async browser slot %d after %s", self.index, reason)
+            self.pool._count("recycles")
+            await self.close_browser()
+
+    async def close_browser(self) -> None:
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Exception as e:
+                log.error("❌ Error closing browser in async slot %d: %s", self.index, e)
+        self.browser = None
+        self.page = None
+        self.rss_mb = 0.0
+
+
+class AsyncBrowserPool:
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_renders: int = BROWSER_MAX_RENDERS,
+                 max_rss_mb: int = BROWSER_MAX_RSS_MB):
+        """
+        Initialize the pool. The Playwright driver starts on first use, on
+        the running event loop; browsers are launched lazily per slot.
+
+        Args:
+            size: Number of Chromium processes (and concurrent renders)
+            max_renders: Recycle a browser after this many renders
+            max_rss_mb: Recycle a browser once its processes exceed this RSS (0 disables)
+        """
+        self.size = max(1, size)
+        self.max_renders = max(1, max_renders)
+        self.max_rss_mb = max_rss_mb
+        self._playwright = None
+        self._slots: List[_AsyncBrowserSlot] = []
+        self._free: Optional[asyncio.Queue] = None
+        self._waiting = 0
+        self._start_lock = asyncio.Lock()
+        self._lock = threading.Lock()
+        self.stats = {
+            "renders": 0,
+            "render_errors": 0,
+            "launches": 0,
+            "recycles": 0,
+            "health_failures": 0,
+            "blocked_requests": 0
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    async def start(self) -> None:
+        """Start the Playwright driver on the current loop (no-op if already running)."""
+        async with self._start_lock:
+            if self._playwright is not None:
+                return
+            self._playwright = await async_playwright().start()
+            self._slots = [_AsyncBrowserSlot(self, i) for i in range(self.size)]
+            self._free = asyncio.Queue()
+            for slot in self._slots:
+                self._free.put_nowait(slot)
+
+    async def run(self, fn: Callable[[Any], Awaitable[Any]], timeout: Optional[float] = BROWSER_RENDER_TIMEOUT) -> Any:
+        """Await fn(page) on the next free warm page (waiting for a page counts against timeout)."""
+        await self.start()
+        return await asyncio.wait_for(self._run(fn), timeout)
+
+    async def _run(self, fn: Callable[[Any], Awaitable[Any]]) -> Any:
+        self._waiting += 1
+        try:
+            slot = await self._free.get()
+        finally:
+            self._waiting -= 1
+        try:
+            page = await slot.checkout_page()
+            result = await fn(page)
+        except BaseException:
+            # A failed or cancelled render can leave the page in an unknown state
+            await slot.close_browser()
+            self._count("render_errors")
+            raise
+        else:
+            slot.renders += 1
+            self._count("renders")
+            await slot.maybe_recycle()
+            return result
+        finally:
+            self._free.put_nowait(slot)
+
+    async def shutdown(self) -> None:
+        """Close every browser and stop the Playwright driver."""
+        if self._playwright is None:
+            return
+        for slot in self._slots:
+            await slot.close_browser()
+        await self._playwright.stop()
+        self._playwright = None
+        self._slots = []
+        log.info("🛑 Async browser pool shut down")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({
+            "size": self.size,
+            "queued": self._waiting,
+            "slots": [
+                {
+                    "index": slot.index,
+                    "browser_running": slot.browser is not None,
+                    "renders_since_launch": slot.renders,
+                    "launches": slot.launches,
+                    "rss_mb": round(slot.rss_mb, 1)
+                }
+                for slot in self._slots
+            ]
+        })
+        return stats
+
+
+# Global pool instance (one per gunicorn worker)
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
+
+# Used instead of browser_pool by the ASGI mode's native routes
+async_browser_pool = AsyncBrowserPool()
@@ -1,74 +1,383 @@
 """
-Simple in-memory cache for AI responses.
+Two-tier cache for AI responses.
 Reduces OpenAI API costs and improves response times for repeated lessons.
+
+- Memory tier: bounded LRU per process, with byte-size accounting.
+- Disk tier: SQLite database in WAL mode, shared by every gunicorn worker
+  and kept across restarts. clear() bumps a generation counter stored there;
+  every worker drops its memory tier when it sees the counter change.
 """
 import hashlib
 import json
+import os
+import sqlite3
+import threading
 import time
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+from content_fingerprint import NORMALIZATION_VERSION, content_digest, normalize_content, minhash_signature, similarity, lsh_buckets
+from observability import get_logger, span
+
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "data/cache.sqlite3")
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))  # 32 MB
+# "normalized": key on folded slide text (see content_fingerprint.py); "raw": byte-for-byte
+CACHE_KEY_MODE = os.getenv("CACHE_KEY_MODE", "normalized")
+# Opt-in: on a miss, reuse the most similar cached lesson (flagged "derived")
+CACHE_NEAR_DUPLICATE = os.getenv("CACHE_NEAR_DUPLICATE", "0") == "1"
+CACHE_NEAR_DUPLICATE_THRESHOLD = float(os.getenv("CACHE_NEAR_DUPLICATE_THRESHOLD", "0.85"))
+# Expired entries stay this long as the get_stale fallback, then cleanup_expired deletes them
+CACHE_STALE_GRACE_SECONDS = int(os.getenv("CACHE_STALE_GRACE_SECONDS", str(30 * 86400)))
+CACHE_CLEANUP_INTERVAL = float(os.getenv("CACHE_CLEANUP_INTERVAL", "3600"))
+
+log = get_logger(__name__)
+
+
+class MemoryTier:
+    """In-process LRU keyed by cache key, bounded by total payload bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, payload: str, timestamp: float) -> None:
+        size = len(payload.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self.entries[key] = (payload, timestamp)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0].encode())
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def cleanup_expired(self, cutoff: float) -> int:
+        with self._lock:
+            expired = [k for k, (_, ts) in self.entries.items() if ts < cutoff]
+            for key in expired:
+                self._discard(key)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SQLiteTier:
+    """Persistent key/value table shared across processes (WAL mode)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process (never reuse across fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lesson_cache ("
+                "key TEXT PRIMARY KEY, data TEXT NOT NULL, timestamp REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS lesson_cache_timestamp ON lesson_cache (timestamp)")
+            # MinHash signatures and LSH buckets for near-duplicate lookups
+            conn.execute("CREATE TABLE IF NOT EXISTS lesson_signatures (key TEXT PRIMARY KEY, signature BLOB NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lesson_lsh (bucket TEXT NOT NULL, key TEXT NOT NULL, "
+                "PRIMARY KEY (bucket, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        row = self._conn().execute(
+            "SELECT data, timestamp FROM lesson_cache WHERE key = ?", (key,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, payload: str, timestamp: float) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO lesson_cache (key, data, timestamp) VALUES (?, ?, ?)",
+            (key, payload, timestamp)
+        )
+
+    def set_signature(self, key: str, signature: bytes, buckets: List[str]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("INSERT OR REPLACE INTO lesson_signatures (key, signature) VALUES (?, ?)", (key, signature))
+            conn.executemany("INSERT OR IGNORE INTO lesson_lsh (bucket, key) VALUES (?, ?)",
+                             [(bucket, key) for bucket in buckets])
+
+    def candidates(self, buckets: List[str]) -> List[Tuple[str, bytes]]:
+        """(key, signature) of every entry sharing at least one LSH bucket."""
+        placeholders = ",".join("?" * len(buckets))
+        return self._conn().execute(
+            "SELECT key, signature FROM lesson_signatures WHERE key IN "
+            f"(SELECT key FROM lesson_lsh WHERE bucket IN ({placeholders}))", buckets
+        ).fetchall()
+
+    def _drop_orphan_signatures(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM lesson_signatures WHERE key NOT IN (SELECT key FROM lesson_cache)")
+        conn.execute("DELETE FROM lesson_lsh WHERE key NOT IN (SELECT key FROM lesson_cache)")
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM lesson_cache WHERE key = ?", (key,))
+        conn.execute("DELETE FROM lesson_signatures WHERE key = ?", (key,))
+        conn.execute("DELETE FROM lesson_lsh WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            for table in ("lesson_cache", "lesson_signatures", "lesson_lsh"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute(
+                "INSERT INTO cache_meta (name, value) VALUES ('generation', 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + 1"
+            )
+
+    def generation(self) -> int:
+        """Number of clear() calls so far, across all processes."""
+        row = self._conn().execute("SELECT value FROM cache_meta WHERE name = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def cleanup_expired(self, cutoff: float) -> int:
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM lesson_cache WHERE timestamp < ?", (cutoff,)).rowcount
+        if removed:
+            self._drop_orphan_signatures(conn)
+        return removed
+
+    def count_signatures(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM lesson_signatures").fetchone()[0]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM lesson_cache").fetchone()[0]
+
 
 class LessonCache:
-    def __init__(self, ttl_seconds: int = 86400):  # 24 hours default
+    def __init__(self, ttl_seconds: int = 86400,  # 24 hours default
+                 max_memory_bytes: int = CACHE_MEMORY_MAX_BYTES,
+                 db_path: str = CACHE_DB_PATH,
+                 key_mode: str = CACHE_KEY_MODE,
+                 near_duplicate: bool = CACHE_NEAR_DUPLICATE,
+                 near_duplicate_threshold: float = CACHE_NEAR_DUPLICATE_THRESHOLD,
+                 stale_grace_seconds: int = CACHE_STALE_GRACE_SECONDS):
         """
         Initialize the cache.
-        
+
         Args:
             ttl_seconds: Time-to-live for cache entries in seconds (default: 24 hours)
+            max_memory_bytes: Byte budget of the in-process LRU tier
+            db_path: SQLite file backing the shared tier
+            key_mode: "normalized" (folded slide text) or "raw" (byte-for-byte)
+            near_duplicate: On a miss, return the most similar cached lesson
+            near_duplicate_threshold: Minimum estimated similarity (0-1) for that
+            stale_grace_seconds: How long expired entries are kept for get_stale
         """
-        self.cache: Dict[str, Dict[str, Any]] = {}
+        if key_mode not in ("normalized", "raw"):
+            raise ValueError(f"Unknown cache key mode: {key_mode}")
+        self.memory = MemoryTier(max_memory_bytes)
+        self.disk = SQLiteTier(db_path)
         self.ttl_seconds = ttl_seconds
+        self.key_mode = key_mode
+        self.near_duplicate = near_duplicate
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.stale_grace_seconds = stale_grace_seconds
+        self._stats_lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._generation = 0
         self.stats = {
             "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "stale_hits": 0,
+            "derived_hits": 0,
             "misses": 0,
             "total_requests": 0
         }
-    
+
+    def _count(self, *names: str) -> None:
+        with self._stats_lock:
+            for name in names:
+                self.stats[name] += 1
+
     def _generate_key(self, content: str, language: str, subject: str, session: str) -> str:
         """
         Generate a unique cache key based on lesson content and parameters.
-        
+        In "normalized" mode the content is folded first, so decks that only
+        differ in spacing, punctuation or slide numbers share a key.
+
         Args:
             content: Lesson content text
             language: Language (fr/ar)
             subject: Subject name
             session: Session number
-            
+
         Returns:
             SHA256 hash as cache key
         """
-        key_data = f"{content}|{language}|{subject}|{session}"
+        if self.key_mode == "normalized":
+            key_data = f"normalized{NORMALIZATION_VERSION}:{content_digest(content)}|{language}|{subject}|{session}"
+        else:
+            key_data = f"{content}|{language}|{subject}|{session}"
         return hashlib.sha256(key_data.encode()).hexdigest()
-    
+
+    def _lookup_keys(self, content: str, language: str, subject: str, session: str) -> List[str]:
+        """Primary key, then the raw key entries written before normalized keys existed."""
+        key = self._generate_key(content, language, subject, session)
+        if self.key_mode != "normalized":
+            return [key]
+        legacy = hashlib.sha256(f"{content}|{language}|{subject}|{session}".encode()).hexdigest()
+        return [key, legacy]
+
+    def make_key(self, content: str, language: str, subject: str, session: str) -> str:
+        """Public cache key for a lesson (used to coalesce in-flight AI calls)."""
+        return self._generate_key(content, language, subject, session)
+
+    @span("cache_get")
     def get(self, content: str, language: str, subject: str, session: str) -> Optional[Dict[str, Any]]:
         """
         Retrieve cached lesson data if available and not expired.
-        
+        Checks the memory tier first, then the shared disk tier, then (when
+        near-duplicate mode is on) the most similar cached lesson.
+
         Returns:
-            Cached lesson data or None if not found/expired
+            Cached lesson data or None if not found/expired. Near-duplicate
+            results carry "derived": True and "derived_similarity".
         """
-        self.stats["total_requests"] += 1
-        key = self._generate_key(content, language, subject, session)
-        
-        if key in self.cache:
-            entry = self.cache[key]
-            # Check if entry has expired
-            if time.time() - entry["timestamp"] < self.ttl_seconds:
-                self.stats["hits"] += 1
-                print(f"✅ Cache HIT for key: {key[:16]}...")
-                return entry["data"]
-            else:
-                # Remove expired entry
-                del self.cache[key]
-                print(f"⏰ Cache EXPIRED for key: {key[:16]}...")
-        
-        self.stats["misses"] += 1
-        print(f"❌ Cache MISS for key: {key[:16]}...")
+        return self._get(content, language, subject, session, self._count)
+
+    def peek(self, content: str, language: str, subject: str, session: str) -> Optional[Dict[str, Any]]:
+        """get() without touching the hit/miss counters (single-flight re-checks after a counted miss)."""
+        return self._get(content, language, subject, session, lambda *names: None)
+
+    def _get(self, content: str, language: str, subject: str, session: str,
+             count: Callable[..., None]) -> Optional[Dict[str, Any]]:
+        count("total_requests")
+        key, *legacy_keys = self._lookup_keys(content, language, subject, session)
+        now = time.time()
+        self._sync_generation()
+
+        entry = self.memory.get(key)
+        if entry is not None:
+            if now - entry[1] < self.ttl_seconds:
+                count("hits", "memory_hits")
+                log.debug("✅ Cache HIT (memory) for key: %s...", key[:16])
+                return json.loads(entry[0])
+            self.memory.delete(key)
+
+        entry = self.disk.get(key)
+        for legacy_key in legacy_keys:
+            if entry is not None:
+                break
+            entry = self.disk.get(legacy_key)
+            if entry is not None:
+                # Re-file under the current key; the timestamp (and so the TTL) is kept
+                self.disk.set(key, entry[0], entry[1])
+                self._store_signature(key, content, language, subject, session)
+        if entry is not None:
+            if now - entry[1] < self.ttl_seconds:
+                count("hits", "disk_hits")
+                self.memory.set(key, entry[0], entry[1])
+                log.debug("✅ Cache HIT (disk) for key: %s...", key[:16])
+                return json.loads(entry[0])
+            # Expired entries stay on disk as a fallback (see get_stale)
+            # until cleanup_expired() removes them.
+            log.info("⏰ Cache EXPIRED for key: %s...", key[:16])
+
+        if self.near_duplicate:
+            derived = self._get_near_duplicate(key, content, language, subject, session, now, count)
+            if derived is not None:
+                return derived
+
+        count("misses")
+        log.info("❌ Cache MISS for key: %s...", key[:16])
         return None
-    
+
+    def _get_near_duplicate(self, key: str, content: str, language: str, subject: str, session: str,
+                            now: float, count: Callable[..., None]) -> Optional[Dict[str, Any]]:
+        """Unexpired lesson_data of the most similar deck above the threshold, flagged as derived."""
+        signature = minhash_signature(normalize_content(content))
+        buckets = lsh_buckets(signature, f"{language}|{subject}|{session}")
+        best_key, best_similarity = None, 0.0
+        for candidate_key, candidate_signature in self.disk.candidates(buckets):
+            if candidate_key == key:
+                continue
+            score = similarity(signature, candidate_signature)
+            if score >= self.near_duplicate_threshold and score > best_similarity:
+                entry = self.disk.get(candidate_key)
+                if entry is not None and now - entry[1] < self.ttl_seconds:
+                    best_key, best_similarity, best_entry = candidate_key, score, entry
+        if best_key is None:
+            return None
+        count("hits", "derived_hits")
+        log.info("🧬 Cache NEAR-DUPLICATE HIT for key: %s... (from %s..., similarity %.2f)",
+                 key[:16], best_key[:16], best_similarity)
+        data = json.loads(best_entry[0])
+        data["derived"] = True
+        data["derived_similarity"] = round(best_similarity, 3)
+        return data
+
+    def _store_signature(self, key: str, content: str, language: str, subject: str, session: str) -> None:
+        signature = minhash_signature(normalize_content(content))
+        self.disk.set_signature(key, signature, lsh_buckets(signature, f"{language}|{subject}|{session}"))
+
+    def get_stale(self, content: str, language: str, subject: str, session: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve lesson data even if expired (fallback when OpenAI is unavailable).
+
+        Returns:
+            Cached lesson data or None if never cached
+        """
+        keys = self._lookup_keys(content, language, subject, session)
+        self._sync_generation()
+        entry = self.memory.get(keys[0])
+        for key in keys:
+            entry = entry or self.disk.get(key)
+        if entry is None:
+            return None
+        self._count("stale_hits")
+        log.warning("♻️  Cache STALE HIT for key: %s...", keys[0][:16])
+        return json.loads(entry[0])
+
+    @span("cache_set")
     def set(self, content: str, language: str, subject: str, session: str, data: Dict[str, Any]) -> None:
         """
-        Store lesson data in cache.
-        
+        Store lesson data in both tiers.
+
         Args:
             content: Lesson content text
             language: Language (fr/ar)
@@ -77,53 +386,102 @@ class LessonCache:
             data: Lesson data to cache
         """
         key = self._generate_key(content, language, subject, session)
-        self.cache[key] = {
-            "data": data,
-            "timestamp": time.time()
-        }
-        print(f"💾 Cached lesson data for key: {key[:16]}...")
-    
+        payload = json.dumps(data, ensure_ascii=False)
+        timestamp = time.time()
+        self.disk.set(key, payload, timestamp)
+        self.memory.set(key, payload, timestamp)
+        # Signatures are kept in every mode so near-duplicate lookups can be switched on later
+        self._store_signature(key, content, language, subject, session)
+        log.info("💾 Cached lesson data for key: %s...", key[:16])
+        self._maybe_cleanup()
+
+    def _maybe_cleanup(self) -> None:
+        """cleanup_expired() if this process hasn't run it for CACHE_CLEANUP_INTERVAL seconds."""
+        now = time.monotonic()
+        with self._stats_lock:
+            if self._last_cleanup and now - self._last_cleanup < CACHE_CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = now
+        try:
+            self.cleanup_expired()
+        except sqlite3.Error as e:
+            log.error("❌ Cache cleanup failed: %s", e)
+
+    def _sync_generation(self) -> None:
+        """Drop the memory tier if another worker cleared the cache since we last looked."""
+        generation = self.disk.generation()
+        if generation != self._generation:
+            self.memory.clear()
+            self._generation = generation
+
     def clear(self) -> None:
-        """Clear all cache entries."""
-        self.cache.clear()
-        print("🗑️  Cache cleared")
-    
+        """
+        Clear all cache entries: the shared disk tier, this worker's memory
+        tier and, on their next lookup, every other worker's.
+        """
+        self.disk.clear()
+        self.memory.clear()
+        self._generation = self.disk.generation()
+        log.info("🗑️  Cache cleared")
+
     def get_stats(self) -> Dict[str, Any]:
         """
         Get cache statistics.
-        
+        Request counters are per worker process; tier sizes are current.
+
         Returns:
             Dictionary with hit rate and counts
         """
-        hit_rate = (self.stats["hits"] / self.stats["total_requests"] * 100) if self.stats["total_requests"] > 0 else 0
+        with self._stats_lock:
+            stats = dict(self.stats)
+        hit_rate = (stats["hits"] / stats["total_requests"] * 100) if stats["total_requests"] > 0 else 0
+        disk_size = self.disk.count()
         return {
-            "hits": self.stats["hits"],
-            "misses": self.stats["misses"],
-            "total_requests": self.stats["total_requests"],
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "total_requests": stats["total_requests"],
             "hit_rate_percent": round(hit_rate, 2),
-            "cache_size": len(self.cache)
+            "stale_hits": stats["stale_hits"],
+            "cache_size": disk_size,
+            "key_mode": self.key_mode,
+            "near_duplicate": {
+                "enabled": self.near_duplicate,
+                "threshold": self.near_duplicate_threshold,
+                "hits": stats["derived_hits"],
+                "signatures": self.disk.count_signatures()
+            },
+            "worker_pid": os.getpid(),
+            "tiers": {
+                "memory": {
+                    "hits": stats["memory_hits"],
+                    "entries": len(self.memory),
+                    "bytes": self.memory.bytes,
+                    "max_bytes": self.memory.max_bytes,
+                    "evictions": self.memory.evictions
+                },
+                "disk": {
+                    "hits": stats["disk_hits"],
+                    "entries": disk_size,
+                    "path": self.disk.path
+                }
+            }
         }
-    
+
     def cleanup_expired(self) -> int:
         """
-        Remove all expired entries from cache.
-        
+        Remove entries expired for longer than the stale grace window from both tiers.
+
         Returns:
-            Number of entries removed
-        """
-        current_time = time.time()
-        expired_keys = [
-            key for key, entry in self.cache.items()
-            if current_time - entry["timestamp"] >= self.ttl_seconds
-        ]
-        
-        for key in expired_keys:
-            del self.cache[key]
-        
-        if expired_keys:
-            print(f"🧹 Cleaned up {len(expired_keys)} expired cache entries")
-        
-        return len(expired_keys)
+            Number of entries removed from the shared tier
+        """
+        cutoff = time.time() - self.ttl_seconds - self.stale_grace_seconds
+        self.memory.cleanup_expired(cutoff)
+        removed = self.disk.cleanup_expired(cutoff)
+
+        if removed:
+            log.info("🧹 Cleaned up %d expired cache entries", removed)
+
+        return removed
 
 # Global cache instance
 lesson_cache = LessonCache(ttl_seconds=86400)  # 24 hours
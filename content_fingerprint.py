@@ -0,0 +1,130 @@
+"""
+Fingerprints of slide text for the AI cache keys.
+normalize_content folds the differences a re-export introduces: spacing,
+blank-line runs, punctuation, case, slide numbers and repeated lines. Math
+operators are kept, so "3 + 4" and "3 - 4" stay different. It also drops
+the fixed deck chrome every export carries (slide labels, media and
+slideshow instructions, pictogram legends). With that, a re-saved deck keeps
+the same cache key. For revisions that change
+real content (a `_V2` deck with one slide edited), MinHash signatures over
+word shingles estimate how similar two decks are. LSH band buckets let the
+cache find likely near-duplicates without comparing against every entry.
+"""
+import functools
+import hashlib
+import random
+import re
+import unicodedata
+from array import array
+from typing import List
+
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # 4 rows per band: decks ~0.85 similar share a bucket with >99% probability
+SHINGLE_WORDS = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240901)  # fixed: signatures are stored and compared across processes
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+# Bumped whenever normalize_content changes, so old keys are not matched against new text
+NORMALIZATION_VERSION = 2
+
+# Operators change what an exercise says ("12 - 5" vs "12 + 5"), so they are kept as tokens
+_OPERATORS = "+\\-×÷*/=<>≤≥≠±%√^"
+_OPERATOR = re.compile(f"[{_OPERATORS}]")
+_SEPARATORS = re.compile(f"[^\\w{_OPERATORS}]+|_+")
+_BULLET = re.compile(r"^[-*]\s+")
+_SLIDE_LABEL = re.compile(r"(?:(?:slide|diapositive|page|الشريحة|شريحة) ?)?\d+(?: / \d+)?")
+
+# Deck chrome: instructions to the teacher about the slideshow itself, identical on every deck
+_FIXED_BOILERPLATE = (
+    "Il convient de lancer le mode diaporama pour la diffusion de la leçon en classe",
+    "Fin du média. Passer au slide suivant",
+    "Média en cours de diffusion",
+    "Diffusion d’un média",
+    "Lecture de la vidéo.",
+    "Pictogrammes",
+    "أيقونات توجيهية",
+    "(ة)خاص بالأستاذ",
+    "المرور للشريحة الموالية بعد عرض الفيديو",
+    "عرض فيديو",
+)
+
+
+def _fold_line(line: str) -> str:
+    line = _BULLET.sub("", line.strip())
+    line = _OPERATOR.sub(r" \g<0> ", _SEPARATORS.sub(" ", line))
+    return " ".join(line.split())
+
+
+_BOILERPLATE_LINES = {_fold_line(unicodedata.normalize("NFKC", line).casefold()) for line in _FIXED_BOILERPLATE}
+
+
+def normalize_content(content: str) -> str:
+    """
+    Canonical form of slide text: NFKC, case-folded, punctuation turned into
+    single spaces, math operators kept as separate tokens. Empty lines,
+    slide numbers and labels, fixed deck boilerplate and repeated lines are
+    dropped.
+    """
+    text = unicodedata.normalize("NFKC", content).replace("\u2212", "-").casefold()
+    lines, seen = [], set()
+    for line in text.split("\n"):
+        line = _fold_line(line)
+        if not any(c.isalnum() for c in line) or _SLIDE_LABEL.fullmatch(line):
+            continue
+        if line in _BOILERPLATE_LINES or line in seen:
+            continue
+        seen.add(line)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+@functools.lru_cache(maxsize=1024)
+def content_digest(content: str) -> str:
+    """SHA256 of the normalized content, memoized: the same decks are looked up again and again."""
+    return hashlib.sha256(normalize_content(content).encode()).hexdigest()
+
+
+def _stable_hash(text: str) -> int:
+    # hash() is salted per process; signatures must match across workers
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def shingles(normalized: str, size: int = SHINGLE_WORDS) -> List[int]:
+    """Hashes of the overlapping `size`-word windows in each line."""
+    hashes = set()
+    for line in normalized.split("\n"):
+        words = line.split()
+        if len(words) <= size:
+            hashes.add(_stable_hash(line))
+            continue
+        for i in range(len(words) - size + 1):
+            hashes.add(_stable_hash(" ".join(words[i:i + size])))
+    return list(hashes)
+
+
+def minhash_signature(normalized: str) -> bytes:
+    """MinHash signature (MINHASH_PERMUTATIONS unsigned 64-bit values, packed)."""
+    hashes = shingles(normalized) or [0]
+    return array("Q", (min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)).tobytes()
+
+
+def similarity(signature_a: bytes, signature_b: bytes) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    a, b = array("Q", signature_a), array("Q", signature_b)
+    if len(a) != len(b) or not a:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def lsh_buckets(signature: bytes, scope: str) -> List[str]:
+    """One bucket id per band. Only decks within the same scope (language/subject/session) can collide."""
+    values = array("Q", signature)
+    rows = len(values) // LSH_BANDS
+    buckets = []
+    for band in range(LSH_BANDS):
+        chunk = values[band * rows:(band + 1) * rows].tobytes()
+        buckets.append(hashlib.blake2b(f"{scope}|{band}|".encode() + chunk, digest_size=8).hexdigest())
+    return buckets
@@ -0,0 +1,349 @@
+"""
+Local stand-in for the OpenAI chat completions API, for offline testing.
+It answers /v1/chat/completions with a valid lesson_data JSON built from the
+prompt (same steps, same metadata) after a configurable delay, streamed as
+SSE chunks when the request asks for stream=True. It can inject errors
+(429 / 5xx) and malformed completions at a given rate. /v1/files and
+/v1/batches implement enough of the Batch API for openai_batch.py; a batch
+completes `latency` seconds after it is created, or ends with `batch_status`
+(e.g. failed, expired) and no output file.
+
+Usage:
+    python fake_openai.py --port 8765 --latency 2 --error-rate 0.2 --error-status 503
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake gunicorn app:app
+
+Behaviour can be changed at runtime:
+    curl -X POST localhost:8765/_control -d '{"latency": 5, "error_rate": 1}'
+"""
+import argparse
+import email.parser
+import email.policy
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+
+def _prompt_steps(prompt: str) -> List[str]:
+    """Steps listed after 'EXACTLY these lesson steps' in the prompt."""
+    match = re.search(r"EXACTLY these lesson steps in this order:\n((?:- .*\n)+)", prompt)
+    if not match:
+        return ["Step 1", "Step 2"]
+    return [line[2:].strip() for line in match.group(1).splitlines()]
+
+
+def _prompt_field(prompt: str, name: str) -> str:
+    match = re.search(rf'"{name}": "([^"]*)"', prompt)
+    return match.group(1) if match else ""
+
+
+def fake_lesson_json(prompt: str, malformed: bool = False) -> str:
+    """A well-formed completion for one of process_with_ai's prompts (or one whose last step lacks its icon)."""
+    lesson_data = {
+        "subject": _prompt_field(prompt, "subject"),
+        "level": _prompt_field(prompt, "level"),
+        "period": _prompt_field(prompt, "period"),
+        "week": _prompt_field(prompt, "week"),
+        "session": _prompt_field(prompt, "session"),
+        "objective": "Objectif généré hors ligne",
+        "steps": [
+            {"name": name, "duration": "10min", "icon": "📝", "content": f"Les élèves travaillent : {name}."}
+            for name in _prompt_steps(prompt)
+        ]
+    }
+    if malformed:
+        del lesson_data["steps"][-1]["icon"]
+    return json.dumps({"lesson_data": lesson_data}, ensure_ascii=False)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status: int) -> None:
+        payload = json.dumps({"error": {"message": f"Injected error {status}", "type": "fake_error"}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, completion: Dict[str, Any], piece: int = 24) -> None:
+        """Send a completion as chat.completion.chunk SSE events, usage last."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        content = completion["choices"][0]["message"]["content"]
+        base = {k: completion[k] for k in ("id", "created", "model")}
+        base["object"] = "chat.completion.chunk"
+        for i in range(0, len(content), piece):
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": content[i:i + piece]}, "finish_reason": None}])
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+        final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        self.wfile.write(f"data: {json.dumps(final)}\n\n".encode())
+        usage = dict(base, choices=[], usage=completion["usage"])
+        self.wfile.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode())
+        self.wfile.flush()
+
+    def _upload_file(self, raw: bytes) -> None:
+        """POST /v1/files (multipart/form-data with `file` and `purpose`)."""
+        head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(head + raw)
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = (part.get_filename(), part.get_payload(decode=True))
+        filename, data = fields.get("file", ("upload.jsonl", b""))
+        purpose = (fields.get("purpose") or (None, b"batch"))[1].decode()
+        self._send_json(200, self.server.add_file(data, filename, purpose))
+
+    def do_GET(self) -> None:
+        path = self.path.rstrip("/")
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", path)
+        if match and match.group(1) in self.server.files:
+            payload = self.server.files[match.group(1)]["data"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", path)
+        if match and match.group(1) in self.server.batches:
+            self._send_json(200, self.server.batches[match.group(1)])
+            return
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        path = self.path.rstrip("/")
+        if path == "/v1/files":
+            self._upload_file(raw)
+            return
+        body = json.loads(raw or b"{}")
+        if path == "/v1/batches":
+            batch = self.server.create_batch(body)
+            self._send_json(200 if batch else 400, batch or {"error": {"message": "Unknown input_file_id"}})
+            return
+        if path == "/_control":
+            self._send_json(200, self.server.configure(**body))
+            return
+        if path.endswith("/chat/completions"):
+            self.server.pause()
+            status = self.server.injected_error()
+            if status:
+                self._send_error(status)
+                return
+            if body.get("stream"):
+                self._send_stream(self.server.completion(body))
+            else:
+                self._send_json(200, self.server.completion(body))
+            return
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float, jitter: float, error_rate: float, error_status: int,
+                 malformed_rate: float = 0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.chunk_delay = 0.01
+        self.batch_status = "completed"
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients hanging up early (timeouts, rejected streams) are expected here
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def configure(self, **settings: Any) -> Dict[str, Any]:
+        names = ("latency", "jitter", "error_rate", "error_status", "malformed_rate", "chunk_delay", "batch_status")
+        for name in names:
+            if name in settings:
+                setattr(self, name, type(getattr(self, name))(settings[name]))
+        return {name: getattr(self, name) for name in names}
+
+    def pause(self) -> None:
+        with self._lock:
+            self.requests += 1
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def injected_error(self) -> int:
+        """Status code to fail this request with, or 0."""
+        if self.error_rate and random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return self.error_status
+        return 0
+
+    def add_file(self, data: bytes, filename: str, purpose: str) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        meta = {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        self.files[file_id] = dict(meta, data=data)
+        return meta
+
+    def create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        source = self.files.get(body.get("input_file_id"))
+        if source is None:
+            return None
+        lines = [json.loads(line) for line in source["data"].splitlines() if line.strip()]
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}",
+            "object": "batch",
+            "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "errors": None,
+            "input_file_id": source["id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "completed_at": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+            "metadata": body.get("metadata")
+        }
+        self.batches[batch["id"]] = batch
+        threading.Thread(target=self._run_batch, args=(batch, lines), daemon=True).start()
+        return batch
+
+    def _run_batch(self, batch: Dict[str, Any], lines: List[Dict[str, Any]]) -> None:
+        time.sleep(self.latency)
+        if self.batch_status != "completed":
+            batch["errors"] = {"object": "list", "data": [{"code": self.batch_status, "message": "Injected"}]}
+            batch["request_counts"]["failed"] = len(lines)
+            batch["status"] = self.batch_status
+            return
+        output, errors = [], []
+        for line in lines:
+            status = self.injected_error()
+            record = {"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": line["custom_id"]}
+            if status:
+                errors.append(dict(record, response={"status_code": status, "body": {
+                    "error": {"message": f"Injected error {status}", "type": "fake_error"}}}, error=None))
+                batch["request_counts"]["failed"] += 1
+            else:
+                output.append(dict(record, response={"status_code": 200, "body": self.completion(line["body"])},
+                                   error=None))
+                batch["request_counts"]["completed"] += 1
+        to_jsonl = lambda records: "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode()
+        batch["output_file_id"] = self.add_file(to_jsonl(output), "output.jsonl", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self.add_file(to_jsonl(errors), "errors.jsonl", "batch_output")["id"]
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+    def completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = body.get("messages", [{}])[-1].get("content", "")
+        content = fake_lesson_json(prompt, malformed=random.random() < self.malformed_rate)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+
+class FakeOpenAIServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, malformed_rate: float = 0.0):
+        """
+        Initialize the server (port 0 picks a free port).
+
+        Args:
+            latency: Seconds to wait before answering each completion
+            jitter: Uniform +/- variation added to latency
+            error_rate: Share of completions answered with error_status
+            error_status: HTTP status for injected errors (429 adds Retry-After)
+            malformed_rate: Share of completions whose last step is missing a field
+        """
+        self.httpd = _Server((host, port), latency, jitter, error_rate, error_status, malformed_rate)
+        self._thread: threading.Thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self) -> int:
+        return self.httpd.requests
+
+    def configure(self, **settings: Any) -> Dict[str, Any]:
+        """Change latency/jitter/error and malformed rates/chunk_delay/batch_status while running."""
+        return self.httpd.configure(**settings)
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of completions that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of completions with a broken step")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.error_status,
+                              args.malformed_rate)
+    print(f"🤖 Fake OpenAI listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
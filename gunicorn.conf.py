@@ -0,0 +1,26 @@
+"""
+Gunicorn settings and server hooks (picked up automatically from the working directory).
+Each worker owns its own warm browser pool; these hooks start it (and compile
+the journal templates) before the first request and close Chromium cleanly
+when the worker exits.
+"""
+import os
+
+# Threaded workers keep answering /lessons and /jobs/<id> while the worker's
+# job threads wait on OpenAI or Chromium.
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+
+def post_worker_init(worker):
+    from browser_pool import browser_pool
+    from template_env import precompile_templates
+    precompile_templates()
+    # ASGI workers (asgi.py) start their async pool in the app's lifespan;
+    # the thread pool is then only started if a Flask route renders
+    if "uvicorn" not in worker.cfg.worker_class_str.lower():
+        browser_pool.start()
+
+
+def worker_exit(server, worker):
+    from browser_pool import browser_pool
+    browser_pool.shutdown()
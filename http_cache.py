@@ -0,0 +1,149 @@
+"""
+Prebuilt, precompressed JSON responses for the read-mostly endpoints.
+/lessons (the whole registry, mostly Arabic text) and /teacher-info only
+change when their file does. Each variant is serialized once per file version
+as compact UTF-8 and compressed once with gzip and, if installed, brotli.
+It is then kept in memory and served with a strong ETag (a digest of the
+body). A repeat request that sends the ETag back gets an empty 304, with no
+JSON encoding and no compression on the request path.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+from flask import Response, current_app, request
+
+from observability import get_logger
+
+log = get_logger(__name__)
+
+try:
+    import brotli
+except ImportError:  # pip install brotli; gzip only without it
+    brotli = None
+    log.warning("⚠️  brotli is not installed, /lessons and /teacher-info are served gzip only (pip install brotli)")
+
+# Seconds browsers may reuse /lessons without revalidating (0: always revalidate, a 304 when unchanged)
+LESSONS_MAX_AGE = int(os.getenv("LESSONS_MAX_AGE", "0"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "9"))  # 11 compresses ~8% better but takes seconds on /lessons
+GZIP_LEVEL = 9
+COMPRESS_MIN_BYTES = 1024
+HTTP_CACHE_VARIANTS = 64  # query-string variants kept per process (LRU)
+
+LESSONS_CACHE_CONTROL = f"public, max-age={LESSONS_MAX_AGE}" if LESSONS_MAX_AGE else "public, no-cache"
+TEACHER_INFO_CACHE_CONTROL = "private, no-cache"
+
+
+class EncodedBody:
+    """One JSON body in every encoding it is offered in."""
+
+    def __init__(self, version: str, raw: bytes, headers: Dict[str, str]):
+        self.version = version
+        self.headers = headers
+        self.etag = hashlib.sha256(raw).hexdigest()[:32]
+        self.encodings = {"identity": raw}
+        if len(raw) >= COMPRESS_MIN_BYTES:
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(raw, quality=BROTLI_QUALITY)
+            self.encodings["gzip"] = gzip.compress(raw, GZIP_LEVEL, mtime=0)
+
+    def etag_for(self, encoding: str) -> str:
+        # Each encoding is its own representation, so it gets its own strong validator
+        return self.etag if encoding == "identity" else f"{self.etag}-{encoding}"
+
+
+class PrecompressedResponses:
+    def __init__(self, max_variants: int = HTTP_CACHE_VARIANTS):
+        """
+        Initialize the cache.
+
+        Args:
+            max_variants: Bodies kept in memory (endpoint x query-string variants)
+        """
+        self.max_variants = max_variants
+        self._bodies: "OrderedDict[Tuple[str, str], EncodedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "builds": 0,
+            "hits": 0,
+            "not_modified": 0,
+            "bytes_sent": 0,
+            "bytes_uncompressed": 0
+        }
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    def get(self, name: str, variant: str, version: str,
+            build: Callable[[], Tuple[Any, Dict[str, str]]]) -> EncodedBody:
+        """
+        The encoded body for (name, variant), rebuilt only when version changes.
+
+        Args:
+            name: Endpoint
+            variant: Normalized query string
+            version: Token that changes whenever the underlying data changes
+            build: Returns (JSON-serializable data, extra response headers)
+        """
+        key = (name, variant)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None and body.version == version:
+                self._bodies.move_to_end(key)
+                self.stats["hits"] += 1
+                return body
+        data, headers = build()
+        raw = (current_app.json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+        body = EncodedBody(version, raw, headers)
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_variants:
+                self._bodies.popitem(last=False)
+            self.stats["builds"] += 1
+        return body
+
+    def respond(self, body: EncodedBody, cache_control: str) -> Response:
+        """200 with the best encoding the client accepts, or 304 if it already has this body."""
+        encoding = self._negotiate(body)
+        headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding", **body.headers}
+        # Any encoding of the same body counts: caches may have stored another one
+        if any(request.if_none_match.contains_weak(body.etag_for(e)) for e in body.encodings):
+            response = Response(status=304, headers=headers)
+            response.set_etag(body.etag_for(encoding))
+            self._count("not_modified")
+            return response
+
+        payload = body.encodings[encoding]
+        response = Response(payload, mimetype="application/json", headers=headers)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.set_etag(body.etag_for(encoding))
+        self._count("bytes_sent", len(payload))
+        self._count("bytes_uncompressed", len(body.encodings["identity"]))
+        return response
+
+    @staticmethod
+    def _negotiate(body: EncodedBody) -> str:
+        accepted = request.accept_encodings
+        for encoding in ("br", "gzip"):
+            if encoding in body.encodings and accepted[encoding] > 0:
+                return encoding
+        return "identity"
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["bodies"] = len(self._bodies)
+        stats["brotli"] = brotli is not None
+        stats["compression_ratio"] = round(stats["bytes_sent"] / stats["bytes_uncompressed"], 3) \
+            if stats["bytes_uncompressed"] else None
+        return stats
+
+
+# Global instance (one per gunicorn worker)
+http_cache = PrecompressedResponses()
@@ -0,0 +1,324 @@
+"""
+Background job queue for slow generations (OpenAI round trip + PDF render).
+Jobs live in a SQLite table shared by every gunicorn worker: submit() inserts
+a `queued` row, and each worker's job threads claim queued rows from it, so
+any worker can report a job's status and a queued job survives the worker
+that accepted it. A running job holds a lease its worker renews every
+JOB_LEASE_SECONDS / 3; if the worker dies the lease runs out and the job is
+claimed again (at most JOB_MAX_ATTEMPTS times). Finished jobs are deleted
+after JOB_RETENTION_SECONDS (checked on submit, at most every
+JOB_CLEANUP_INTERVAL).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from observability import get_logger
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "86400"))
+JOB_CLEANUP_INTERVAL = float(os.getenv("JOB_CLEANUP_INTERVAL", "600"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("done", "failed")
+
+log = get_logger(__name__)
+
+
+class JobQueue:
+    def __init__(self, db_path: str = JOBS_DB_PATH, max_workers: int = JOB_WORKERS):
+        """
+        Initialize the queue (job threads start on start() or the first submit()).
+
+        Args:
+            db_path: SQLite file holding the jobs
+            max_workers: Concurrent jobs per worker process
+        """
+        self.db_path = db_path
+        self.max_workers = max(1, max_workers)
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._local = threading.local()
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self._claimed: Dict[str, float] = {}  # job id -> lease expiry, for jobs this process runs
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.stats = {
+            "submitted": 0,
+            "deduplicated": 0,
+            "completed": 0,
+            "failed": 0,
+            "requeued": 0
+        }
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedupe_key TEXT NOT NULL, "
+                "params TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT, "
+                "owner_pid INTEGER NOT NULL, created REAL NOT NULL, updated REAL NOT NULL, "
+                "lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "attempts" not in columns:
+                # jobs.sqlite3 from before leases; another worker may be migrating it at the same time
+                for column in ("lease_until REAL", "attempts INTEGER NOT NULL DEFAULT 0"):
+                    try:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+                    except sqlite3.OperationalError:
+                        pass
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (status, updated)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, created)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+        """Register the function that runs jobs of this kind (params -> JSON result)."""
+        self.handlers[kind] = handler
+
+    def start(self) -> None:
+        """Start this process's job threads and lease heartbeat (no-op if already running)."""
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._claimed = {}
+            self._threads = [threading.Thread(target=self._work_loop, name=f"job-{i}", daemon=True)
+                             for i in range(self.max_workers)]
+            self._threads.append(threading.Thread(target=self._heartbeat_loop, name="job-lease", daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def submit(self, kind: str, params: Dict[str, Any], dedupe_key: str) -> Dict[str, Any]:
+        """
+        Queue a job, or join an identical job that is already queued/running.
+
+        Args:
+            kind: Registered handler name
+            params: JSON-serializable handler arguments
+            dedupe_key: Jobs with the same key share one execution
+
+        Returns:
+            Job record
+        """
+        if kind not in self.handlers:
+            raise KeyError(f"No handler registered for job kind '{kind}'")
+        self._maybe_cleanup()
+        self.start()
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = conn.execute(
+                "SELECT * FROM jobs WHERE dedupe_key = ? AND status IN (?, ?) ORDER BY created LIMIT 1",
+                (dedupe_key, *ACTIVE_STATUSES)
+            ).fetchone()
+            if existing is not None:
+                conn.execute("COMMIT")
+                self._count("deduplicated")
+                log.info("🔗 Joined in-flight job %s (%s)", existing["id"], kind)
+                return self._to_dict(existing)
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, dedupe_key, params, status, owner_pid, created, updated) "
+                "VALUES (?, ?, ?, ?, 'queued', 0, ?, ?)",
+                (job_id, kind, dedupe_key, json.dumps(params, ensure_ascii=False), now, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("submitted")
+        log.info("📥 Queued job %s (%s)", job_id, kind)
+        self._wake.set()
+        return self.get(job_id)
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """
+        Take the oldest queued job (or one whose worker's lease ran out) that
+        this process has a handler for, and mark it running under our lease.
+        """
+        kinds = tuple(self.handlers)
+        if not kinds:
+            return None
+        conn = self._conn()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT * FROM jobs WHERE kind IN ({', '.join('?' * len(kinds))}) AND "
+                    "(status = 'queued' OR (status = 'running' AND lease_until < ?)) ORDER BY created LIMIT 1",
+                    (*kinds, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["status"] == "running" and row["attempts"] >= JOB_MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, updated = ? WHERE id = ?",
+                        (f"Worker exited before the job finished ({row['attempts']} attempts)", now, row["id"])
+                    )
+                    conn.execute("COMMIT")
+                    self._count("failed")
+                    log.error("❌ Job %s abandoned after %d attempts", row["id"], row["attempts"])
+                    continue
+                lease_until = now + JOB_LEASE_SECONDS
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner_pid = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE id = ?",
+                    (os.getpid(), lease_until, now, row["id"])
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if row["status"] == "running":
+                self._count("requeued")
+                log.warning("♻️  Job %s lost its worker (pid %d), running it again", row["id"], row["owner_pid"])
+            with self._lock:
+                self._claimed[row["id"]] = lease_until
+            return row
+
+    def _work_loop(self) -> None:
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                log.error("❌ Claiming a job failed: %s", e)
+                row = None
+            if row is None:
+                self._wake.wait(JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            # More work may be waiting: let an idle sibling look too
+            self._wake.set()
+            self._run(row)
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(JOB_LEASE_SECONDS / 3)
+            with self._lock:
+                job_ids = list(self._claimed)
+            if not job_ids:
+                continue
+            lease_until = time.time() + JOB_LEASE_SECONDS
+            try:
+                self._conn().execute(
+                    f"UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner_pid = ? "
+                    f"AND id IN ({', '.join('?' * len(job_ids))})",
+                    (lease_until, os.getpid(), *job_ids)
+                )
+            except sqlite3.Error as e:
+                log.error("❌ Renewing job leases failed: %s", e)
+
+    def _run(self, row: sqlite3.Row) -> None:
+        job_id = row["id"]
+        try:
+            result = self.handlers[row["kind"]](json.loads(row["params"]))
+        except Exception as e:
+            log.error("❌ Job %s failed: %s", job_id, e)
+            self._count("failed")
+            self._finish(job_id, status="failed", error=str(e))
+            return
+        self._count("completed")
+        self._finish(job_id, status="done", result=json.dumps(result, ensure_ascii=False))
+        log.info("✅ Job %s done", job_id)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._claimed.pop(job_id, None)
+        updated = self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated = ? "
+            "WHERE id = ? AND status = 'running' AND owner_pid = ?",
+            (status, result, error, time.time(), job_id, os.getpid())
+        ).rowcount
+        if not updated:
+            # Our lease ran out (e.g. the process was suspended) and another worker took the job over
+            log.warning("⚠️  Job %s was taken over by another worker, result dropped", job_id)
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created": row["created"],
+            "updated": row["updated"]
+        }
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a job record.
+
+        Returns:
+            Job record or None if unknown
+        """
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def wait(self, job_id: str, timeout: float, poll_interval: float = 0.25) -> Optional[Dict[str, Any]]:
+        """Long-poll: return once the job is finished or timeout elapses."""
+        deadline = time.time() + timeout
+        job = self.get(job_id)
+        while job is not None and job["status"] not in FINAL_STATUSES and time.time() < deadline:
+            time.sleep(poll_interval)
+            job = self.get(job_id)
+        return job
+
+    def cleanup(self) -> int:
+        """Delete finished jobs older than JOB_RETENTION_SECONDS."""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        return self._conn().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?", (*FINAL_STATUSES, cutoff)
+        ).rowcount
+
+    def _maybe_cleanup(self) -> None:
+        """cleanup() if this process hasn't run it for JOB_CLEANUP_INTERVAL seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_cleanup and now - self._last_cleanup < JOB_CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = now
+        try:
+            removed = self.cleanup()
+        except sqlite3.Error as e:
+            log.error("❌ Job cleanup failed: %s", e)
+            return
+        if removed:
+            log.info("🧹 Removed %d finished jobs older than %ds", removed, JOB_RETENTION_SECONDS)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        counts = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        stats["by_status"] = {status: count for status, count in counts}
+        stats["max_workers"] = self.max_workers
+        return stats
+
+
+# Global job queue instance
+job_queue = JobQueue()
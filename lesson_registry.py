@@ -0,0 +1,119 @@
+"""
+Memory-resident, indexed view of data/lessons.json.
+The file is parsed once per process and re-read only when its mtime/size
+change, so lookups by id never re-parse the whole registry.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from observability import get_logger, span
+
+LESSONS_JSON = "data/lessons.json"
+
+SLOT_FIELDS = ("subject", "level", "period", "week", "session")
+
+log = get_logger(__name__)
+
+
+class LessonRegistry:
+    def __init__(self, json_path: str = LESSONS_JSON):
+        """
+        Initialize the registry (loaded lazily on first access).
+
+        Args:
+            json_path: Path to lessons.json
+        """
+        self.json_path = json_path
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self.lessons: List[Dict[str, Any]] = []
+        self.slim_lessons: List[Dict[str, Any]] = []
+        self.by_id: Dict[int, Dict[str, Any]] = {}
+        self.by_filename: Dict[str, Dict[str, Any]] = {}
+        self.by_slot: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        self.loads = 0
+
+    def _refresh(self) -> None:
+        """Reload and re-index if lessons.json changed since the last load."""
+        try:
+            st = os.stat(self.json_path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp and self.loads:
+            return
+        with self._lock:
+            if stamp == self._stamp and self.loads:
+                return
+            with span("registry_load"):
+                lessons = []
+                if stamp is not None:
+                    try:
+                        with open(self.json_path, "r", encoding="utf-8") as f:
+                            lessons = json.load(f)
+                    except json.JSONDecodeError as e:
+                        # Keep serving the previous version rather than an empty list
+                        log.error("❌ Invalid %s, keeping previous registry: %s", self.json_path, e)
+                        return
+                self._index(lessons)
+            self._stamp = stamp
+            self.loads += 1
+            log.info("📚 Loaded %d lessons from %s", len(lessons), self.json_path)
+
+    def _index(self, lessons: List[Dict[str, Any]]) -> None:
+        by_slot: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for lesson in lessons:
+            by_slot.setdefault(self._slot_key(lesson), []).append(lesson)
+        self.lessons = lessons
+        self.slim_lessons = [{k: v for k, v in l.items() if k != "content"} for l in lessons]
+        self.by_id = {l["id"]: l for l in lessons}
+        self.by_filename = {l.get("filename"): l for l in lessons}
+        self.by_slot = by_slot
+
+    @staticmethod
+    def _slot_key(lesson: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(lesson.get(field, "")) for field in SLOT_FIELDS)
+
+    @property
+    def version(self) -> str:
+        """Opaque token that changes whenever lessons.json changes."""
+        self._refresh()
+        return f"{self._stamp[0]:x}-{self._stamp[1]:x}" if self._stamp else "empty"
+
+    def all(self, slim: bool = False) -> List[Dict[str, Any]]:
+        """All lessons, optionally without their `content` field."""
+        self._refresh()
+        return self.slim_lessons if slim else self.lessons
+
+    def get(self, lesson_id: int) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        return self.by_id.get(lesson_id)
+
+    def get_by_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        return self.by_filename.get(filename)
+
+    def find(self, slim: bool = False, **filters: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Lessons matching the given subject/level/period/week/session filters.
+        A fully specified slot is an index lookup; partial filters scan the list.
+
+        Returns:
+            Matching lessons in registry order
+        """
+        self._refresh()
+        wanted = {k: str(v) for k, v in filters.items() if k in SLOT_FIELDS and v not in (None, "")}
+        if len(wanted) == len(SLOT_FIELDS):
+            matches = self.by_slot.get(tuple(wanted[f] for f in SLOT_FIELDS), [])
+        else:
+            matches = [l for l in self.lessons
+                       if all(str(l.get(k, "")) == v for k, v in wanted.items())]
+        if slim:
+            return [{k: v for k, v in l.items() if k != "content"} for l in matches]
+        return matches
+
+
+# Global registry instance
+lesson_registry = LessonRegistry()
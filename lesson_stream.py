@@ -0,0 +1,203 @@
+"""
+Structured output and incremental parsing for the lesson_data completion.
+The JSON schema below is sent as the OpenAI response_format, so the model
+can only produce the lesson_data shape. While the completion streams in,
+StepStreamParser picks each finished object out of lesson_data.steps,
+validates it, and hands it on straight away. A broken response is caught at
+the first bad step instead of after the whole paid call.
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+STEP_FIELDS = ("name", "duration", "icon", "content")
+# Text allowed before the opening brace (e.g. a ```json fence) before we give up
+MAX_PREAMBLE_CHARS = 200
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+
+class MalformedOutputError(ValueError):
+    """The completion does not match the lesson_data structure."""
+
+
+def lesson_response_format(step_names: List[str]) -> Dict[str, Any]:
+    """
+    response_format for a strict json_schema completion.
+
+    Args:
+        step_names: Expected step names; when given, the model can only use these
+    """
+    name_schema: Dict[str, Any] = {"type": "string"}
+    if step_names:
+        name_schema["enum"] = list(dict.fromkeys(step_names))
+    step_schema = {
+        "type": "object",
+        "properties": {
+            "name": name_schema,
+            "duration": {"type": "string"},
+            "icon": {"type": "string"},
+            "content": {"type": "string"}
+        },
+        "required": list(STEP_FIELDS),
+        "additionalProperties": False
+    }
+    meta_fields = ("subject", "level", "period", "week", "session", "objective")
+    lesson_schema = {
+        "type": "object",
+        "properties": {**{f: {"type": "string"} for f in meta_fields},
+                       "steps": {"type": "array", "items": step_schema}},
+        "required": [*meta_fields, "steps"],
+        "additionalProperties": False
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "lesson_journal",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {"lesson_data": lesson_schema},
+                "required": ["lesson_data"],
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+def validate_step(step: Any, index: int) -> Dict[str, str]:
+    """Check one step object; raises MalformedOutputError."""
+    if not isinstance(step, dict):
+        raise MalformedOutputError(f"Step {index} is not an object")
+    for field in STEP_FIELDS:
+        if not isinstance(step.get(field), str):
+            raise MalformedOutputError(f"Step {index} has no valid '{field}'")
+    return step
+
+
+def parse_lesson_json(raw: str) -> Dict[str, Any]:
+    """
+    Parse a complete completion into lesson_data, tolerating code fences and
+    text around the JSON object.
+
+    Raises:
+        MalformedOutputError: not a JSON object with lesson_data.steps
+    """
+    text = _FENCE.sub("", raw.strip())
+    start = text.find("{")
+    if start < 0:
+        raise MalformedOutputError("No JSON object in completion")
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, start)
+    except json.JSONDecodeError as e:
+        raise MalformedOutputError(f"Invalid JSON: {e}") from e
+    lesson_data = data.get("lesson_data") if isinstance(data, dict) else None
+    if not isinstance(lesson_data, dict):
+        raise MalformedOutputError("Missing lesson_data")
+    steps = lesson_data.get("steps")
+    if not isinstance(steps, list) or not steps:
+        raise MalformedOutputError("Steps are missing or empty")
+    for i, step in enumerate(steps):
+        validate_step(step, i)
+    return lesson_data
+
+
+class StepStreamParser:
+    """
+    Character-level JSON scanner fed with streamed text deltas.
+    It tracks object keys to find the array at lesson_data.steps and emits
+    each step as soon as its closing brace arrives.
+    """
+
+    def __init__(self, on_step: Optional[Callable[[int, Dict[str, str]], None]] = None,
+                 max_steps: Optional[int] = None):
+        self.on_step = on_step
+        self.max_steps = max_steps
+        self.buffer = ""
+        self.steps: List[Dict[str, str]] = []
+        self._pos = 0
+        self._started = False
+        # Container stack entries: [kind, current key, expecting key]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._step_start: Optional[int] = None
+
+    def feed(self, delta: str) -> None:
+        """Consume the next piece of completion text; raises MalformedOutputError."""
+        self.buffer += delta
+        buf = self.buffer
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                elif self._pos >= MAX_PREAMBLE_CHARS:
+                    raise MalformedOutputError("Completion does not start with a JSON object")
+                else:
+                    self._pos += 1
+                    continue
+            if self._in_string:
+                self._scan_string_char(ch)
+            else:
+                self._scan_structural_char(ch)
+            self._pos += 1
+
+    def _scan_string_char(self, ch: str) -> None:
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            top = self._stack[-1] if self._stack else None
+            if top and top[0] == "{" and top[2]:
+                top[1] = json.loads(self.buffer[self._string_start:self._pos + 1])
+
+    def _scan_structural_char(self, ch: str) -> None:
+        if ch == '"':
+            self._in_string = True
+            self._string_start = self._pos
+        elif ch == "{":
+            if self._in_steps_array() and self._step_start is None:
+                self._step_start = self._pos
+            self._stack.append(["{", None, True])
+        elif ch == "[":
+            is_steps = self._current_key() == "steps" and self._parent_key() == "lesson_data"
+            self._stack.append(["steps" if is_steps else "[", None, False])
+        elif ch in "}]":
+            if not self._stack:
+                raise MalformedOutputError("Unbalanced JSON in completion")
+            self._stack.pop()
+            if ch == "}" and self._step_start is not None and self._in_steps_array():
+                self._emit(self.buffer[self._step_start:self._pos + 1])
+                self._step_start = None
+        elif ch == ":":
+            if self._stack and self._stack[-1][0] == "{":
+                self._stack[-1][2] = False
+        elif ch == ",":
+            if self._stack and self._stack[-1][0] == "{":
+                self._stack[-1][2] = True
+
+    def _in_steps_array(self) -> bool:
+        return bool(self._stack) and self._stack[-1][0] == "steps"
+
+    def _current_key(self) -> Optional[str]:
+        return self._stack[-1][1] if self._stack and self._stack[-1][0] == "{" else None
+
+    def _parent_key(self) -> Optional[str]:
+        return self._stack[-2][1] if len(self._stack) > 1 and self._stack[-2][0] == "{" else None
+
+    def _emit(self, text: str) -> None:
+        index = len(self.steps)
+        try:
+            step = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise MalformedOutputError(f"Step {index} is not valid JSON: {e}") from e
+        validate_step(step, index)
+        if self.max_steps is not None and index >= self.max_steps:
+            raise MalformedOutputError(f"More than {self.max_steps} steps")
+        self.steps.append(step)
+        if self.on_step:
+            self.on_step(index, step)
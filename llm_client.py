@@ -0,0 +1,392 @@
+"""
+Resilient wrapper around the OpenAI chat completions call.
+
+- Explicit timeout on every call; a streamed completion must also finish
+  within LLM_STREAM_DEADLINE_SECONDS, however steadily its chunks trickle in
+- Retries with jittered exponential backoff on 429, 5xx, timeouts and
+  connection errors (Retry-After is honoured)
+- Token-bucket rate limiter shared by all gunicorn workers (lock file),
+  charged for every attempt including retries
+- Circuit breaker: after repeated failures, calls fail fast until a cool-down
+  has passed, then one trial call decides whether to close it again
+- Optional output check: a consumer reads the response (or the chunks of a
+  streamed one as they arrive) and can reject it, which triggers a retry
+
+AsyncResilientLLM does the same for openai.AsyncOpenAI (the ASGI mode in
+asgi.py), waiting with asyncio.sleep instead of blocking a thread.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Sequence, Tuple, Type
+
+import openai
+
+from observability import get_logger
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_STREAM_DEADLINE_SECONDS = float(os.getenv("LLM_STREAM_DEADLINE_SECONDS", "180"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "20"))
+LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "60"))
+LLM_RATE_BURST = float(os.getenv("LLM_RATE_BURST", "10"))
+LLM_RATE_STATE_PATH = os.getenv("LLM_RATE_STATE_PATH", "data/locks/llm-rate.json")
+LLM_BATCH_RATE_STATE_PATH = os.getenv("LLM_BATCH_RATE_STATE_PATH", "data/locks/llm-rate-batch.json")
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "60"))
+
+log = get_logger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OpenAI while the circuit breaker is open."""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when no rate-limit token became available in time."""
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class SharedTokenBucket:
+    """
+    Token bucket whose state lives in a small JSON file guarded by flock,
+    so every worker process draws from the same budget.
+    """
+
+    def __init__(self, path: str = LLM_RATE_STATE_PATH, rate_per_minute: float = LLM_RATE_PER_MINUTE,
+                 burst: float = LLM_RATE_BURST):
+        self.path = path
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = max(1.0, burst)
+
+    def _take(self) -> float:
+        """Take a token if available. Returns 0 on success, else seconds to wait."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except json.JSONDecodeError:
+                    state = {}
+                now = time.time()
+                tokens = state.get("tokens", self.burst)
+                tokens = min(self.burst, tokens + (now - state.get("updated", now)) * self.rate_per_second)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / self.rate_per_second
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "updated": now}))
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, timeout: float) -> float:
+        """
+        Block until a token is available.
+
+        Returns:
+            Seconds spent waiting
+        """
+        if self.rate_per_second <= 0:
+            return 0.0
+        start = time.monotonic()
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return time.monotonic() - start
+            if time.monotonic() - start + wait > timeout:
+                raise RateLimitTimeout(f"No OpenAI rate-limit token within {timeout:.0f}s")
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: float) -> float:
+        """acquire() for the event loop: flock and file I/O run on a thread, waits are asyncio.sleep."""
+        if self.rate_per_second <= 0:
+            return 0.0
+        start = time.monotonic()
+        while True:
+            # Another worker may hold the lock: never block the loop on it
+            wait = await asyncio.to_thread(self._take)
+            if wait == 0:
+                return time.monotonic() - start
+            if time.monotonic() - start + wait > timeout:
+                raise RateLimitTimeout(f"No OpenAI rate-limit token within {timeout:.0f}s")
+            await asyncio.sleep(wait)
+
+
+class CombinedBuckets:
+    """Several token buckets charged together: an attempt needs a token from each."""
+
+    def __init__(self, buckets: Sequence[SharedTokenBucket]):
+        self.buckets = list(buckets)
+
+    def acquire(self, timeout: float) -> float:
+        start = time.monotonic()
+        for bucket in self.buckets:
+            bucket.acquire(timeout=max(0.0, timeout - (time.monotonic() - start)))
+        return time.monotonic() - start
+
+    async def acquire_async(self, timeout: float) -> float:
+        start = time.monotonic()
+        for bucket in self.buckets:
+            await bucket.acquire_async(timeout=max(0.0, timeout - (time.monotonic() - start)))
+        return time.monotonic() - start
+
+
+class _DeadlineStream:
+    """
+    A chunk stream that raises APITimeoutError once the completion has run
+    past its deadline. The per-read timeout alone lets a server that sends a
+    chunk every few seconds hold the caller indefinitely.
+    """
+
+    def __init__(self, stream: Any, deadline: float):
+        self._stream = stream
+        self._deadline = deadline
+
+    def _check(self) -> None:
+        if time.monotonic() > self._deadline:
+            raise openai.APITimeoutError(request=self._stream.response.request)
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._check()
+            yield chunk
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._check()
+            yield chunk
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.time() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            raise CircuitOpenError("OpenAI circuit breaker is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    log.error("🔌 OpenAI circuit breaker OPEN after %d failures", self.failures)
+                self.state = "open"
+                self.opened_at = time.time()
+
+
+class ResilientLLM:
+    def __init__(self, client: openai.OpenAI, timeout: float = LLM_TIMEOUT_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES, bucket: SharedTokenBucket = None,
+                 breaker: CircuitBreaker = None, stream_deadline: float = LLM_STREAM_DEADLINE_SECONDS):
+        """
+        Wrap an OpenAI client.
+
+        Args:
+            client: OpenAI client (its own retries are disabled here)
+            timeout: Per-attempt timeout in seconds (for a stream: between chunks)
+            max_retries: Retries after the first attempt
+            stream_deadline: Longest one streamed attempt may take in total
+        """
+        self.client = client.with_options(max_retries=0, timeout=timeout)
+        self.timeout = timeout
+        self.stream_deadline = stream_deadline
+        self.max_retries = max_retries
+        self.bucket = bucket or SharedTokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "output_retries": 0,
+            "failures": 0,
+            "fast_failures": 0,
+            "rate_limit_wait_seconds": 0.0
+        }
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        # Full jitter spreads retries from concurrent workers apart
+        return max(_retry_after(error), random.uniform(0, delay))
+
+    def chat(self, consume: Callable[[Any], Any] = None,
+             retry_on: Tuple[Type[Exception], ...] = (), **kwargs: Any):
+        """
+        client.chat.completions.create with timeout, retries, rate limit and breaker.
+
+        Args:
+            consume: If given, consume(response) is returned instead of the
+                response; with stream=True it receives the open chunk stream
+            retry_on: Exceptions raised by consume that mean "bad output, ask
+                again" (retried at once; they don't count against the breaker)
+
+        Raises:
+            CircuitOpenError: breaker open, no call made
+            openai.OpenAIError: last error once retries are exhausted
+        """
+        if kwargs.get("stream"):
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        self._count("calls")
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("fast_failures")
+            raise
+        try:
+            for attempt in range(self.max_retries + 1):
+                # Every attempt pays a token: retries after a 429/5xx must slow down, not bypass the limit
+                self._count("rate_limit_wait_seconds", self.bucket.acquire(timeout=self.timeout))
+                self._count("attempts")
+                try:
+                    deadline = time.monotonic() + self.stream_deadline
+                    response = self.client.chat.completions.create(**kwargs)
+                    if kwargs.get("stream"):
+                        with response:
+                            stream = _DeadlineStream(response, deadline)
+                            response = consume(stream) if consume else list(stream)
+                    elif consume is not None:
+                        response = consume(response)
+                except retry_on as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self._count("output_retries")
+                    log.warning("🔁 Unusable OpenAI output (%s), retry %d", e, attempt + 1)
+                    continue
+                except Exception as e:
+                    if not _is_retryable(e) or attempt == self.max_retries:
+                        raise
+                    delay = self._backoff(attempt, e)
+                    self._count("retries")
+                    log.warning("🔁 OpenAI call failed (%s), retry %d in %.1fs", type(e).__name__, attempt + 1, delay)
+                    time.sleep(delay)
+                    continue
+                self.breaker.record_success()
+                return response
+        except Exception as e:
+            self._record_outcome(e)
+            raise
+
+    def _record_outcome(self, error: Exception) -> None:
+        self._count("failures")
+        if _is_retryable(error) or isinstance(error, RateLimitTimeout):
+            self.breaker.record_failure()
+        else:
+            # Client-side errors (bad request, auth, bad output) don't say anything about upstream health
+            self.breaker.record_success()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["rate_limit_wait_seconds"] = round(stats["rate_limit_wait_seconds"], 2)
+        stats["breaker"] = {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures
+        }
+        return stats
+
+
+class AsyncResilientLLM(ResilientLLM):
+    """
+    ResilientLLM for openai.AsyncOpenAI. Pass the sync wrapper's bucket and
+    breaker so both modes in one process share the same budget and state.
+    """
+
+    async def chat(self, consume: Callable[[Any], Awaitable[Any]] = None,
+                   retry_on: Tuple[Type[Exception], ...] = (), **kwargs: Any):
+        """
+        Awaitable ResilientLLM.chat. consume(response) is a coroutine; with
+        stream=True it receives the open async chunk stream.
+        """
+        if kwargs.get("stream"):
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        self._count("calls")
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("fast_failures")
+            raise
+        try:
+            for attempt in range(self.max_retries + 1):
+                # Every attempt pays a token: retries after a 429/5xx must slow down, not bypass the limit
+                self._count("rate_limit_wait_seconds", await self.bucket.acquire_async(timeout=self.timeout))
+                self._count("attempts")
+                try:
+                    deadline = time.monotonic() + self.stream_deadline
+                    response = await self.client.chat.completions.create(**kwargs)
+                    if kwargs.get("stream"):
+                        async with response:
+                            stream = _DeadlineStream(response, deadline)
+                            response = await consume(stream) if consume else [c async for c in stream]
+                    elif consume is not None:
+                        response = await consume(response)
+                except retry_on as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self._count("output_retries")
+                    log.warning("🔁 Unusable OpenAI output (%s), retry %d", e, attempt + 1)
+                    continue
+                except Exception as e:
+                    if not _is_retryable(e) or attempt == self.max_retries:
+                        raise
+                    delay = self._backoff(attempt, e)
+                    self._count("retries")
+                    log.warning("🔁 OpenAI call failed (%s), retry %d in %.1fs", type(e).__name__, attempt + 1, delay)
+                    await asyncio.sleep(delay)
+                    continue
+                self.breaker.record_success()
+                return response
+        except Exception as e:
+            self._record_outcome(e)
+            raise
@@ -0,0 +1,348 @@
+"""
+Stage timings, Prometheus metrics and logging.
+span("openai") times one stage of a request. Each measurement goes into a
+per-worker histogram and into the current request's Server-Timing header.
+Every gunicorn worker writes its metrics to METRICS_DIR every few seconds,
+and /metrics adds all the workers' files together. Log records go through a
+queue: the request thread only enqueues, and a background thread formats
+them and writes them to stdout.
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+METRICS_DIR = os.getenv("METRICS_DIR", "data/metrics")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+# Seconds; from a cache lookup (sub-millisecond) to a slow OpenAI call
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Files of workers that exited are dropped after this long
+DEAD_WORKER_RETENTION_SECONDS = 3600
+
+
+# ---------------------------
+# LOGGING
+# ---------------------------
+class TextFormatter(logging.Formatter):
+    """`time LEVEL [pid] logger: message key=value ...`"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(process)d] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the record's `fields` merged in."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+            **(getattr(record, "fields", None) or {})
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_log_handler: Optional[QueueHandler] = None
+_log_listener: Optional[QueueListener] = None
+
+
+def _start_listener() -> None:
+    global _log_listener
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    _log_handler.queue = queue.SimpleQueue()
+    _log_listener = QueueListener(_log_handler.queue, output)
+    _log_listener.start()
+
+
+def _stop_listener() -> None:
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+def setup_logging() -> None:
+    """Route every logger through one queue to a background writer (idempotent)."""
+    global _log_handler
+    if _log_handler is not None:
+        return
+    _log_handler = QueueHandler(queue.SimpleQueue())
+    root = logging.getLogger()
+    root.addHandler(_log_handler)
+    root.setLevel(LOG_LEVEL)
+    # The OpenAI client logs every HTTP request at INFO
+    for name in ("httpx", "httpx2"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    _start_listener()
+    atexit.register(_stop_listener)
+    # The writer thread does not survive fork (gunicorn workers, extraction pool)
+    os.register_at_fork(after_in_child=_start_listener)
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(name)
+
+
+log = get_logger(__name__)
+
+
+# ---------------------------
+# METRICS
+# ---------------------------
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(self.labelnames, labels)
+        with metrics.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            series[0][index] += 1
+            series[1] += value
+            metrics.dirty = True
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = _label_key(self.labelnames, labels)
+        with metrics.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+            metrics.dirty = True
+
+
+class MetricsRegistry:
+    """This worker's metrics, plus the snapshot files that combine all workers."""
+
+    def __init__(self, directory: str = METRICS_DIR, flush_seconds: float = METRICS_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.metrics: List[Any] = []
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Histogram:
+        metric = Histogram(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def start(self) -> None:
+        """Start this worker's flusher thread (idempotent, per process)."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except OSError as e:
+                log.warning("⚠️  Could not write metrics snapshot: %s", e)
+
+    def _snapshot(self, mark_clean: bool = False) -> Dict[str, Any]:
+        with self.lock:
+            if mark_clean:
+                self.dirty = False
+            return {metric.name: [[list(key), [list(value[0]), value[1]] if isinstance(value, list) else value]
+                                  for key, value in metric.series.items()]
+                    for metric in self.metrics}
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    def flush(self, force: bool = False) -> None:
+        """Write this worker's snapshot (atomically) if anything changed."""
+        if not (self.dirty or force):
+            return
+        snapshot = self._snapshot(mark_clean=True)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self._path(os.getpid()))
+
+    def _load_all(self) -> List[Dict[str, Any]]:
+        snapshots = [self._snapshot()]
+        own = self._path(os.getpid())
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return snapshots
+        for name in names:
+            if not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.directory, name)
+            if path == own:
+                continue
+            try:
+                if not _pid_alive(int(name[7:-5])) and time.time() - os.path.getmtime(path) > DEAD_WORKER_RETENTION_SECONDS:
+                    os.remove(path)
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        """Prometheus text exposition of every worker's metrics, summed."""
+        merged: Dict[str, Dict[Tuple[str, ...], Any]] = {metric.name: {} for metric in self.metrics}
+        for snapshot in self._load_all():
+            for name, series in snapshot.items():
+                if name not in merged:
+                    continue
+                for key, value in series:
+                    key = tuple(key)
+                    current = merged[name].get(key)
+                    if current is None:
+                        merged[name][key] = value
+                    elif isinstance(value, list):
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                    else:
+                        merged[name][key] = current + value
+
+        lines = []
+        for metric in self.metrics:
+            kind = "histogram" if isinstance(metric, Histogram) else "counter"
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            for key, value in sorted(merged[metric.name].items()):
+                labels = [f'{n}="{_escape(v)}"' for n, v in zip(metric.labelnames, key)]
+                if kind == "counter":
+                    lines.append(f"{metric.name}{_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*metric.buckets, "+Inf"), value[0]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{metric.name}_bucket{_labels(labels + [le])} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(labels)} {value[1]}")
+                lines.append(f"{metric.name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: List[str]) -> str:
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram("raida_stage_duration_seconds", "Time spent per pipeline stage", ("stage",))
+request_seconds = metrics.histogram("raida_http_request_duration_seconds", "HTTP request latency",
+                                    ("method", "endpoint", "status"))
+openai_tokens = metrics.counter("raida_openai_tokens_total", "OpenAI tokens reported in response.usage", ("kind",))
+
+
+def record_token_usage(prompt_tokens: int, completion_tokens: int) -> None:
+    openai_tokens.inc(prompt_tokens or 0, kind="prompt")
+    openai_tokens.inc(completion_tokens or 0, kind="completion")
+
+
+# ---------------------------
+# SPANS & SERVER-TIMING
+# ---------------------------
+_request_timings: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextlib.contextmanager
+def span(stage: str):
+    """Time a block (or, as a decorator, a function) as one pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def start_request_timing() -> None:
+    """Collect this thread's spans for the request now starting."""
+    _request_timings.set([])
+
+
+def server_timing_header(total_seconds: float) -> Optional[str]:
+    """Server-Timing value for the current request: one entry per stage (summed), then total."""
+    timings = _request_timings.get()
+    _request_timings.set(None)
+    if not SERVER_TIMING or timings is None:
+        return None
+    stages: Dict[str, List[float]] = {}
+    for stage, elapsed in timings:
+        stages.setdefault(stage, []).append(elapsed)
+    entries = []
+    for stage, values in stages.items():
+        entry = f"{stage};dur={sum(values) * 1000:.2f}"
+        if len(values) > 1:
+            entry += f';desc="{len(values)} calls"'
+        entries.append(entry)
+    entries.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ", ".join(entries)
@@ -0,0 +1,264 @@
+"""
+Offline regeneration through the OpenAI Batch API (half price, 24h window).
+One JSONL request is built for each selected lesson whose AI cache entry is
+missing or expired. The file is submitted, the batch is polled until it
+finishes, and the results are loaded into lesson_cache and the PDF store.
+custom_id is the lesson's cache key (a content hash). Re-running therefore
+sends only what is still missing, and an interrupted run picks up the batch
+it already submitted. The state file keeps what each custom_id was built
+from, so a collect run with other filters (or none) still loads every result.
+
+Usage:
+    python openai_batch.py --period 3            # submit, wait, load
+    python openai_batch.py --period 3 --no-wait  # submit only (e.g. nightly cron)
+    python openai_batch.py                       # collect a pending batch
+"""
+import argparse
+import copy
+import json
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+from cache import lesson_cache
+from browser_pool import browser_pool
+from lesson_stream import MalformedOutputError, parse_lesson_json
+from observability import get_logger, record_token_usage
+from pdf_generator import (client, build_lesson_request, finalize_lesson_data, build_lesson_pdf,
+                           lesson_language, load_lessons_data, select_lessons, apply_lesson_fields)
+from preprocess_data import write_json_atomic
+from prompt_condense import prompt_stats
+
+BATCH_STATE_PATH = os.getenv("OPENAI_BATCH_STATE", "data/openai_batch.json")
+BATCH_DIR = os.getenv("OPENAI_BATCH_DIR", "data/openai_batches")
+BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", "30"))
+FINAL_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+# A batch that ended like this without any result file is submitted again by the next run
+RESUBMIT_BATCH_STATUSES = ("failed", "expired", "cancelled")
+
+log = get_logger(__name__)
+
+
+def lesson_key(lesson: Dict[str, Any]) -> str:
+    """Cache key of a lesson's AI result (content, language, subject, session)."""
+    language = lesson_language(lesson["subject"])
+    return lesson_cache.make_key(lesson["content"], language, lesson["subject"], str(lesson["session"]))
+
+
+def _cached(lesson: Dict[str, Any]):
+    language = lesson_language(lesson["subject"])
+    return lesson_cache.get(lesson["content"], language, lesson["subject"], str(lesson["session"]))
+
+
+def group_by_key(lessons: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Lessons sharing slide content (same key) need a single request."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for lesson in lessons:
+        groups.setdefault(lesson_key(lesson), []).append(lesson)
+    return groups
+
+
+def build_batch_lines(groups: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """One /v1/chat/completions request line per key without a valid (non-derived) cache entry."""
+    lines = []
+    for key, lessons in groups.items():
+        lesson = lessons[0]
+        cached = _cached(lesson)
+        if cached and not cached.get("derived"):
+            continue
+        request, _ = build_lesson_request(lesson["subject"], lesson["level"], lesson["period"], lesson["week"],
+                                          lesson["session"], lesson["content"], lesson_language(lesson["subject"]))
+        lines.append({"custom_id": key, "method": "POST", "url": "/v1/chat/completions", "body": request})
+    return lines
+
+
+def submit_batch(lines: List[Dict[str, Any]], groups: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Upload the JSONL file and create the batch. Returns the saved state."""
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    input_path = os.path.join(BATCH_DIR, f"input-{int(time.time())}.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    with open(input_path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions",
+                                  completion_window="24h", metadata={"source": "lesson-journal"})
+    state = {
+        "batch_id": batch.id,
+        "input_file_id": input_file.id,
+        "input_path": input_path,
+        "keys": [line["custom_id"] for line in lines],
+        # What each result is cached under, independent of the filters of the collecting run
+        "requests": {line["custom_id"]: {field: groups[line["custom_id"]][0][field]
+                                         for field in ("title", "subject", "session", "content")}
+                     for line in lines},
+        "submitted_at": time.time(),
+        "collected": False
+    }
+    write_json_atomic(BATCH_STATE_PATH, state)
+    log.info("📤 Submitted batch %s (%d requests)", batch.id, len(lines))
+    return state
+
+
+def load_state() -> Dict[str, Any]:
+    if not os.path.exists(BATCH_STATE_PATH):
+        return {}
+    with open(BATCH_STATE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def wait_for_batch(batch_id: str, poll_seconds: float = BATCH_POLL_SECONDS):
+    """Poll until the batch reaches a final status."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts:
+            log.info("⏳ Batch %s: %s (%d/%d done, %d failed)", batch_id, batch.status, counts.completed, counts.total, counts.failed)
+        if batch.status in FINAL_BATCH_STATUSES:
+            return batch
+        time.sleep(poll_seconds)
+
+
+def _read_jsonl(file_id: str) -> List[Dict[str, Any]]:
+    if not file_id:
+        return []
+    text = client.files.content(file_id).text
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _lesson_data_from_record(record: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """(lesson_data, None) for a good result line, (None, reason) otherwise."""
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        error = record.get("error") or response.get("body", {}).get("error") or {}
+        return None, f"HTTP {response.get('status_code')}: {error.get('message', 'request failed')}"
+    body = response["body"]
+    if body.get("usage"):
+        prompt_stats.record_usage(body["usage"].get("prompt_tokens", 0))
+        record_token_usage(body["usage"].get("prompt_tokens", 0), body["usage"].get("completion_tokens", 0))
+    try:
+        return parse_lesson_json(body["choices"][0]["message"]["content"] or ""), None
+    except (MalformedOutputError, KeyError, IndexError) as e:
+        return None, str(e)
+
+
+def submitted_groups(state: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Registry lessons (any filter) whose key was sent in the batch of `state`."""
+    keys = set(state.get("keys", []))
+    return {key: lessons for key, lessons in group_by_key(load_lessons_data()).items() if key in keys}
+
+
+def load_results(batch, state: Dict[str, Any], groups: Dict[str, List[Dict[str, Any]]],
+                 render: bool = True) -> Dict[str, int]:
+    """
+    Write every good result into the AI cache, then into the PDF store.
+
+    Args:
+        batch: Finished batch
+        state: Saved submit state (custom_id -> the lesson fields the request was built from)
+        groups: Lessons to render afterwards, by key
+
+    Returns:
+        Counts of loaded/failed/unknown results
+    """
+    requests = state.get("requests", {})
+    counts = {"loaded": 0, "failed": 0, "unknown": 0}
+    for record in _read_jsonl(batch.output_file_id) + _read_jsonl(batch.error_file_id):
+        lesson = requests.get(record["custom_id"])
+        if lesson is None and groups.get(record["custom_id"]):
+            lesson = groups[record["custom_id"]][0]  # state written before "requests" was recorded
+        if lesson is None:
+            log.warning("⚠️  Result %s matches no submitted lesson, dropped", record["custom_id"])
+            counts["unknown"] += 1
+            continue
+        lesson_data, reason = _lesson_data_from_record(record)
+        if lesson_data is None:
+            log.error("❌ %s: %s", lesson["title"], reason)
+            counts["failed"] += 1
+            continue
+        finalize_lesson_data(lesson_data, lesson["subject"], lesson["session"])
+        lesson_cache.set(lesson["content"], lesson_language(lesson["subject"]), lesson["subject"],
+                         str(lesson["session"]), lesson_data)
+        counts["loaded"] += 1
+    if render:
+        render_cached(groups)
+    return counts
+
+
+def render_cached(groups: Dict[str, List[Dict[str, Any]]]) -> int:
+    """Put the PDF of every cached lesson in the store (store hits are free)."""
+    rendered = 0
+    for lessons in groups.values():
+        for lesson in lessons:
+            cached = _cached(lesson)
+            if not cached:
+                continue
+            lesson_data = copy.deepcopy(cached)
+            apply_lesson_fields(lesson_data, lesson["title"], lesson["subject"], lesson["level"],
+                                lesson["period"], lesson["week"], lesson["session"])
+            try:
+                build_lesson_pdf(lesson_data)
+                rendered += 1
+            except Exception as e:
+                log.error("❌ PDF for %s failed: %s", lesson["title"], e)
+    return rendered
+
+
+def run_openai_batch(lessons: List[Dict[str, Any]], render: bool = True, wait: bool = True,
+                     poll_seconds: float = BATCH_POLL_SECONDS) -> Dict[str, Any]:
+    """
+    Collect a pending batch if there is one, otherwise submit a new batch for
+    the lessons that still need AI data.
+    """
+    groups = group_by_key(lessons)
+    state = load_state()
+    if not state.get("batch_id") or state.get("collected") or state.get("status") in RESUBMIT_BATCH_STATUSES:
+        lines = build_batch_lines(groups)
+        if not lines:
+            log.info("✅ Every selected lesson is already cached, nothing to submit")
+            return {"submitted": 0, "rendered": render_cached(groups) if render else 0}
+        state = submit_batch(lines, groups)
+        if not wait:
+            return {"submitted": len(lines), "batch_id": state["batch_id"]}
+    else:
+        log.info("🔁 Resuming batch %s", state["batch_id"])
+
+    batch = wait_for_batch(state["batch_id"], poll_seconds)
+    # Render what this batch covered too, even if the current filters leave it out
+    groups = {**submitted_groups(state), **groups}
+    if batch.status in RESUBMIT_BATCH_STATUSES and not (batch.output_file_id or batch.error_file_id):
+        errors = [error.message for error in (batch.errors.data or [])] if batch.errors else []
+        log.error("❌ Batch %s ended %s without results%s, the next run submits it again",
+                  batch.id, batch.status, f": {'; '.join(errors)}" if errors else "")
+        state.update(collected=False, status=batch.status)
+        write_json_atomic(BATCH_STATE_PATH, state)
+        return {"batch_id": batch.id, "status": batch.status}
+    counts = load_results(batch, state, groups, render)
+    state.update(collected=True, status=batch.status, counts=counts)
+    write_json_atomic(BATCH_STATE_PATH, state)
+    return dict(counts, batch_id=batch.id, status=batch.status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate lesson data through the OpenAI Batch API")
+    parser.add_argument("--subject", help="substring match, e.g. 'math', 'français', 'arabe'")
+    parser.add_argument("--level")
+    parser.add_argument("--period")
+    parser.add_argument("--weeks", help="week or inclusive range, e.g. '3' or '1-4'")
+    parser.add_argument("--no-wait", action="store_true", help="submit and exit; a later run collects the results")
+    parser.add_argument("--no-pdf", action="store_true", help="only load the AI cache")
+    parser.add_argument("--poll", type=float, default=BATCH_POLL_SECONDS, help="seconds between status checks")
+    args = parser.parse_args()
+
+    lessons = select_lessons(load_lessons_data(), args.subject, args.level, args.period, args.weeks)
+    log.info("📘 Selected %d lessons", len(lessons))
+    try:
+        result = run_openai_batch(lessons, render=not args.no_pdf, wait=not args.no_wait, poll_seconds=args.poll)
+    finally:
+        browser_pool.shutdown()
+    log.info("🏁 OpenAI batch: %s", result)
+
+
+if __name__ == "__main__":
+    main()
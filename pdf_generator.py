@@ -1,12 +1,26 @@
 import os
+import copy
+import asyncio
 import json
+import argparse
 import datetime
-from openai import OpenAI
-from jinja2 import Environment, FileSystemLoader
-from playwright.sync_api import sync_playwright
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, AsyncOpenAI, OpenAIError
 from dotenv import load_dotenv
 from preprocess_data import extract_metadata_from_filename
 from cache import lesson_cache
+from browser_pool import browser_pool, async_browser_pool
+from template_env import jinja_env
+from pdf_store import pdf_store
+from artifact_store import artifact_store
+from singleflight import SingleFlight
+from prompt_condense import condense_content, prompt_stats
+from llm_client import (ResilientLLM, AsyncResilientLLM, CircuitOpenError, RateLimitTimeout, CombinedBuckets,
+                        SharedTokenBucket, LLM_BATCH_RATE_STATE_PATH)
+from lesson_stream import StepStreamParser, MalformedOutputError, lesson_response_format, parse_lesson_json
+from observability import get_logger, span, record_token_usage
 
 load_dotenv()
 
@@ -16,8 +30,20 @@ load_dotenv()
 TEACHER_SUBJECT = os.getenv("TEACHER_SUBJECT", "French")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "outputs_pdfs") # Changed default to reflect PDFs
 PPTX_DIR = "./lessons"
+TEACHER_INFO_PATH = os.path.join(os.path.dirname(__file__), ".", "teacherInfo.json")
+MINDMAP_TEMPLATE = "template_mindmap.html"
+MINDMAP_PNG_WIDTH = int(os.getenv("MINDMAP_PNG_WIDTH", "1240"))
+# Schema-constrained JSON (response_format) and streamed completions
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") == "1"
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+llm = ResilientLLM(client)
+# ASGI mode (asgi.py): same retries, shared rate limit and circuit breaker
+async_llm = AsyncResilientLLM(AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")), bucket=llm.bucket, breaker=llm.breaker)
+ai_singleflight = SingleFlight("ai")
+
+log = get_logger(__name__)
 
 # ---------------------------
 # HELPERS
@@ -57,7 +83,7 @@ def get_lesson_steps(subject, session):
         return LESSON_STEPS["français"].get(sess_str, [])
     
     elif "math" in subj_lower:
-        print(f"DEBUG: Math session check. Session: '{sess_str}'")
+        log.debug("Math session check. Session: '%s'", sess_str)
         try:
             if sess_str == "5":
                 return LESSON_STEPS["mathématiques"]["5"]
@@ -65,7 +91,7 @@ def get_lesson_steps(subject, session):
                 return LESSON_STEPS["mathématiques"].get("5", LESSON_STEPS["mathématiques"]["default"])
             return LESSON_STEPS["mathématiques"]["default"]
         except KeyError as e:
-            print(f"ERROR: KeyError accessing LESSON_STEPS for math session {sess_str}: {e}")
+            log.error("KeyError accessing LESSON_STEPS for math session %s: %s", sess_str, e)
             return LESSON_STEPS["mathématiques"]["default"]
         
     elif "arabe" in subj_lower:
@@ -73,22 +99,69 @@ def get_lesson_steps(subject, session):
         
     return []
 
-def process_with_ai(title, subject, level, period, week, session, content):
-    """Send PPTX content to AI and return structured JSON with lesson data."""
-    print(f"Processing with AI... Subject: {subject}, Session: {session}")
-    
-    # Determine language and prompt based on subject
+def lesson_language(subject):
+    """Prompt/cache language for a subject: Arabic for math and Arabic, French otherwise."""
     subj_lower = subject.lower()
     is_math = "math" in subj_lower
     is_arabe = "arabe" in subj_lower
-    language = "Arabic" if (is_math or is_arabe) else "French"
+    return "Arabic" if (is_math or is_arabe) else "French"
+
+def apply_lesson_fields(lesson_data, title, subject, level, period, week, session):
+    """
+    Stamp the requesting lesson's title and slot onto lesson_data. A cached
+    (or near-duplicate) result may come from another deck of another week.
+    """
+    lesson_data["title"] = title
+    lesson_data["subject"] = subject
+    for field, value in (("level", level), ("period", period), ("week", week), ("session", session)):
+        lesson_data[field] = str(value)
+    return lesson_data
+
+def process_with_ai(title, subject, level, period, week, session, content, on_step=None):
+    """
+    Send PPTX content to AI and return structured JSON with lesson data.
+    on_step(index, step) is called for each step as it streams in (only when
+    this call makes the OpenAI request; a retried completion restarts at index 0).
+    """
+    log.info("Processing with AI... Subject: %s, Session: %s", subject, session)
+    
+    # Determine language and prompt based on subject
+    language = lesson_language(subject)
     
     # 🔍 Check cache first
     cached_data = lesson_cache.get(content, language, subject, str(session))
     if cached_data:
-        print(f"⚡ Returning cached lesson data (saved API call!)")
-        return cached_data
-    
+        log.info("⚡ Returning cached lesson data (saved API call!)")
+        return apply_lesson_fields(cached_data, title, subject, level, period, week, session)
+
+    # 🔗 Coalesce identical misses: one OpenAI call, everyone else waits for it
+    key = lesson_cache.make_key(content, language, subject, str(session))
+    lesson_data = ai_singleflight.do(
+        key,
+        lambda: _generate_lesson_data(subject, level, period, week, session, content, language, on_step),
+        recheck=lambda: lesson_cache.peek(content, language, subject, str(session))
+    )
+    if not lesson_data:
+        return None
+
+    # Followers share the leader's dict, so give each caller its own copy
+    lesson_data = copy.deepcopy(lesson_data)
+
+    return apply_lesson_fields(lesson_data, title, subject, level, period, week, session)
+
+def build_lesson_request(subject, level, period, week, session, content, language):
+    """
+    Build the chat.completions request for one lesson.
+
+    Returns:
+        (request kwargs, expected step names)
+    """
+    # ✂️ Condense slide text: drop boilerplate/duplicate lines, respect the token budget
+    prompt_content, condense_info = condense_content(content, subject, session)
+    log.info("✂️  Prompt content: %d → %d tokens (-%d boilerplate, -%d duplicate lines)",
+             condense_info["tokens_before"], condense_info["tokens_after"],
+             condense_info["removed_boilerplate"], condense_info["removed_duplicates"])
+
     # Get specific steps
     specific_steps = get_lesson_steps(subject, session)
     steps_instruction = ""
@@ -170,7 +243,7 @@ Rules:
 - Do not add explanations before or after the JSON
 
 Lesson slides content:
-{content}
+{prompt_content}
 """
     else:
         # French prompt
@@ -235,80 +308,119 @@ Rules:
 - Use Moroccan French teaching style (action-based, classroom-focused)
 
 Lesson slides content:
-{content}
+{prompt_content}
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.2,
-        messages=[
+    request = {
+        "model": "gpt-4o-mini",
+        "temperature": 0.2,
+        "messages": [
             {"role": "system", "content": f"You generate structured JSON for a teacher's lesson journal in {language}."},
             {"role": "user", "content": prompt}
         ]
-    )
-
-    raw_result = response.choices[0].message.content.strip()
+    }
+    if LLM_STRUCTURED_OUTPUT:
+        request["response_format"] = lesson_response_format(specific_steps)
+    return request, specific_steps
+
+def finalize_lesson_data(lesson_data, subject, session):
+    """Fill in a fallback objective when the AI left a placeholder."""
+    if not lesson_data.get("objective") or lesson_data["objective"] in ["......", "Objectif de la leçon", "هدف الدرس"]:
+        log.warning("⚠️  Objective is missing or placeholder. Using fallback.")
+        lesson_data["objective"] = f"Lesson on {subject} - Session {session}"
+    return lesson_data
 
+def get_cached_lesson_data(title, subject, level, period, week, session, content):
+    """lesson_data from the AI cache (expired entries included), never calling OpenAI. None if never generated."""
+    language = lesson_language(subject)
+    lesson_data = lesson_cache.get(content, language, subject, str(session)) or \
+        lesson_cache.get_stale(content, language, subject, str(session))
+    if not lesson_data:
+        return None
+    return apply_lesson_fields(lesson_data, title, subject, level, period, week, session)
+
+def _generate_lesson_data(subject, level, period, week, session, content, language, on_step=None):
+    """Call OpenAI and validate the JSON. Caches and returns lesson_data (None on failure)."""
+    request, specific_steps = build_lesson_request(subject, level, period, week, session, content, language)
+
+    def read_completion(response):
+        """Parse (and, when streaming, validate step by step) one completion."""
+        if not LLM_STREAM:
+            if response.usage:
+                _record_usage(response.usage)
+            return parse_lesson_json(response.choices[0].message.content or "")
+        parser = StepStreamParser(on_step, max_steps=len(specific_steps) or None)
+        for chunk in response:
+            if chunk.usage:
+                _record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parser.feed(chunk.choices[0].delta.content)
+        return parse_lesson_json(parser.buffer)
 
-    # Try parsing JSON output
     try:
-        raw_result = raw_result.replace("None", "null")
-        data = json.loads(raw_result)
-        lesson_data = data["lesson_data"]
-        
-        # Validate required fields
-        if not lesson_data.get("objective") or lesson_data["objective"] in ["......", "Objectif de la leçon", "هدف الدرس"]:
-            print("⚠️  Warning: Objective is missing or placeholder. Using fallback.")
-            lesson_data["objective"] = f"Lesson on {subject} - Session {session}"
-        
-        if not lesson_data.get("steps") or not isinstance(lesson_data["steps"], list):
-            print("❌ Error: Steps are missing or invalid")
-            return None
-        
-        if len(lesson_data["steps"]) == 0:
-            print("❌ Error: No steps extracted")
-            return None
-        
-        print(f"✅ Successfully extracted {len(lesson_data.get('steps', []))} lesson steps")
-        
-        # 💾 Store in cache for future use
-        lesson_cache.set(content, language, subject, str(session), lesson_data)
-        
-    except json.JSONDecodeError as e:
-        print("❌ Invalid JSON received:", e)
-        print("Raw output:\n", raw_result)
-        return None
-    except KeyError as e:
-        print(f"❌ Missing required field: {e}")
-        return None
+        with span("openai"):
+            lesson_data = llm.chat(consume=read_completion, retry_on=(MalformedOutputError,),
+                                   stream=LLM_STREAM, **request)
+    except (CircuitOpenError, RateLimitTimeout, OpenAIError, MalformedOutputError) as e:
+        return _stale_lesson_data(e, subject, session, content, language)
+    return _store_lesson_data(lesson_data, subject, session, content, language)
+
+def _record_usage(usage):
+    prompt_stats.record_usage(usage.prompt_tokens)
+    record_token_usage(usage.prompt_tokens, usage.completion_tokens)
+
+def _stale_lesson_data(error, subject, session, content, language):
+    """After a failed OpenAI call: serve an expired cache entry rather than nothing."""
+    log.error("❌ No usable OpenAI completion: %s", error)
+    stale_data = lesson_cache.get_stale(content, language, subject, str(session))
+    if stale_data:
+        log.warning("♻️  Serving stale cached lesson data")
+    return stale_data
+
+def _store_lesson_data(lesson_data, subject, session, content, language):
+    finalize_lesson_data(lesson_data, subject, session)
+    log.info("✅ Successfully extracted %d lesson steps", len(lesson_data.get("steps", [])))
+
+    # 💾 Store in cache for future use
+    lesson_cache.set(content, language, subject, str(session), lesson_data)
 
-    # Inject title and subject into lesson_data
-    lesson_data["title"] = title
-    lesson_data["subject"] = subject
-    
     return lesson_data
 
 
+_teacher_info_file = {"stamp": None, "info": None}
+_teacher_info_lock = threading.Lock()
+
+def load_teacher_info_file():
+    """Parsed teacherInfo.json, re-read only when its mtime/size change (None if missing)."""
+    try:
+        st = os.stat(TEACHER_INFO_PATH)
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _teacher_info_lock:
+        if _teacher_info_file["stamp"] != stamp:
+            with open(TEACHER_INFO_PATH, "r", encoding="utf-8") as f:
+                _teacher_info_file["info"] = json.load(f)
+            _teacher_info_file["stamp"] = stamp
+        return _teacher_info_file["info"]
+
 def get_teacher_info(language="fr", subject_name=""):
     """Load teacher info from JSON based on language, removing blank optional fields."""
-    teacher_info_path = os.path.join(os.path.dirname(__file__), ".", "teacherInfo.json")
     final_info = {}
     
-    if os.path.exists(teacher_info_path):
-        try:
-            with open(teacher_info_path, "r", encoding="utf-8") as f:
-                info = json.load(f)
-                if isinstance(info, list) and len(info) > 0:
-                    raw_data = info[0].get(language, {})
-                    
-                    # exclude 'Matière'/'المادة' from file to strictly use document info
-                    keys_to_exclude = ["Matière", "المادة"]
-                    
-                    for k, v in raw_data.items():
-                        if k not in keys_to_exclude and v and str(v).strip():
-                            final_info[k] = v
-        except Exception as e:
-            print(f"❌ Error loading teacher info: {e}")
+    try:
+        info = load_teacher_info_file()
+        if isinstance(info, list) and len(info) > 0:
+            raw_data = info[0].get(language, {})
+            
+            # exclude 'Matière'/'المادة' from file to strictly use document info
+            keys_to_exclude = ["Matière", "المادة"]
+            
+            for k, v in raw_data.items():
+                if k not in keys_to_exclude and v and str(v).strip():
+                    final_info[k] = v
+    except Exception as e:
+        log.error("❌ Error loading teacher info: %s", e)
             
     # Auto-inject Subject if not manually set (though user requested manual setting from document)
     if language == "ar":
@@ -318,7 +430,12 @@ def get_teacher_info(language="fr", subject_name=""):
         
     return final_info
 
-def generate_pdf_from_lesson_data(lesson_data, pdf_filename):
+def select_template(lesson_data):
+    """Pick the journal template for a lesson.
+
+    Returns:
+        (template_name, lang_key, display_subject)
+    """
     # Select template based on subject
     subject = lesson_data.get("subject", "français").lower()
     
@@ -326,82 +443,342 @@ def generate_pdf_from_lesson_data(lesson_data, pdf_filename):
     if "math" in subject or "رياضيات" in subject:
         template_name = "template_math.html"
         lang_key = "ar"
-        print("📐 Using Math template (Arabic)")
+        log.debug("📐 Using Math template (Arabic)")
     elif "arabe" in subject or "عربية" in subject:
         template_name = "template_arabe.html"
         lang_key = "ar"
-        print("🌙 Using Arabic template")
+        log.debug("🌙 Using Arabic template")
     else:
         template_name = "template_french.html"
         lang_key = "fr"
-        print("📚 Using French template")
+        log.debug("📚 Using French template")
     
-    # Load teacher info
     # Pass the detected subject name for display
     display_subject = "الرياضيات" if ("math" in subject or "رياضيات" in subject) else \
                       "اللغة العربية" if ("arabe" in subject or "عربية" in subject) else \
                       "Français"
-                      
+    return template_name, lang_key, display_subject
+
+@span("render_html")
+def render_lesson_html(lesson_data):
+    """Render the journal HTML for lesson_data (template chosen by subject)."""
+    template_name, lang_key, display_subject = select_template(lesson_data)
     teacher_data = get_teacher_info(lang_key, display_subject)
 
-    # 1️⃣ Render HTML with Jinja2
-    env = Environment(loader=FileSystemLoader("templates"))
-    template = env.get_template(template_name)
-    html_content = template.render(lesson_data=lesson_data, teacher_data=teacher_data)
-
-    # 2️⃣ Save temporary HTML file
-    os.makedirs("temp_html", exist_ok=True)
-    html_path = os.path.join("temp_html", "temp.html")
-    with open(html_path, "w", encoding="utf-8") as f:
-        f.write(html_content)
-
-    # 3️⃣ Define PDF output path
-    os.makedirs("output_pdfs", exist_ok=True)
-    pdf_path = os.path.join("output_pdfs", pdf_filename)
-
-    # 4️⃣ Render and export with Playwright (headless Chromium)
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True, args=["--lang=ar"])
-        page = browser.new_page()
-        page.goto(f"file://{os.path.abspath(html_path)}")
-        page.pdf(
-            path=pdf_path,
+    template = jinja_env.get_template(template_name)
+    return template.render(lesson_data=lesson_data, teacher_data=teacher_data)
+
+@span("render_html")
+def render_mindmap_html(lesson_data):
+    """Render the mind-map HTML for lesson_data."""
+    return jinja_env.get_template(MINDMAP_TEMPLATE).render(lesson_data=lesson_data)
+
+def _load_html(page, html_content):
+    # Fonts and CSS are inlined by template_env and the pool blocks every
+    # request, so only font decoding needs waiting for, not the network
+    page.set_content(html_content, wait_until="domcontentloaded")
+    page.evaluate("async () => { await document.fonts.ready; }")
+
+@span("page_pdf")
+def render_pdf_bytes(html_content):
+    """Print in-memory HTML to PDF bytes on a warm pooled page."""
+    def render(page):
+        _load_html(page, html_content)
+        return page.pdf(
             format="A4",
             print_background=True,
             margin={"top": "1cm", "bottom": "1cm", "left": "1cm", "right": "1cm"}
         )
-        browser.close()
 
-    print(f"✅ PDF created: {pdf_path}")
+    return browser_pool.run(render)
+
+@span("page_png")
+def render_png_bytes(html_content, width=MINDMAP_PNG_WIDTH):
+    """Full-page PNG screenshot of in-memory HTML on a warm pooled page."""
+    def render(page):
+        viewport = page.viewport_size
+        page.set_viewport_size({"width": width, "height": viewport["height"] if viewport else 720})
+        try:
+            _load_html(page, html_content)
+            return page.screenshot(full_page=True, type="png")
+        finally:
+            # Pages are shared with the journal renders
+            if viewport:
+                page.set_viewport_size(viewport)
+
+    return browser_pool.run(render)
+
+def build_lesson_pdf(lesson_data):
+    """Make sure the journal PDF for lesson_data is in the PDF store.
+
+    Returns:
+        Artifact key (also used as the download ETag)
+    """
+    template_name, _, _ = select_template(lesson_data)
+    key = pdf_store.make_key(lesson_data, os.path.join("templates", template_name), TEACHER_INFO_PATH)
+    if pdf_store.get_path(key):
+        log.debug("⚡ PDF store HIT for key: %s... (skipped render)", key[:16])
+        return key
+
+    # 1️⃣ Render HTML with Jinja2 (kept in memory)
+    html_content = render_lesson_html(lesson_data)
+
+    # 2️⃣ Print it on a warm pooled page (headless Chromium)
+    pdf_bytes = render_pdf_bytes(html_content)
+
+    # 3️⃣ Keep the artifact for repeat requests
+    pdf_store.put(key, pdf_bytes)
+    return key
+
+def generate_pdf_from_lesson_data(lesson_data, pdf_filename):
+    key = build_lesson_pdf(lesson_data)
+
+    # Publish under output_pdfs/ for /download_pdf
+    pdf_path = artifact_store.publish(key, pdf_filename)
+
+    log.info("✅ PDF created: %s", pdf_path)
     return pdf_path
 
+def build_mindmap(lesson_data, fmt="pdf"):
+    """Make sure the mind map (PDF or PNG) for lesson_data is in the PDF store. Returns its key."""
+    key = pdf_store.make_key(lesson_data, os.path.join("templates", MINDMAP_TEMPLATE), TEACHER_INFO_PATH)
+    if pdf_store.get_path(key, fmt):
+        log.debug("⚡ PDF store HIT for mind map %s... (skipped render)", key[:16])
+        return key
 
+    html_content = render_mindmap_html(lesson_data)
+    data = render_png_bytes(html_content) if fmt == "png" else render_pdf_bytes(html_content)
+    pdf_store.put(key, data, fmt)
+    return key
 
+def generate_mindmap_from_lesson_data(lesson_data, filename, fmt="pdf"):
+    """Mind map for lesson_data, published under output_pdfs/ like the journal."""
+    key = build_mindmap(lesson_data, fmt)
+    path = artifact_store.publish(key, filename, fmt)
+    log.info("🧠 Mind map created: %s", path)
+    return path
 
 
 # ---------------------------
-# MAIN
+# ASYNC (ASGI mode, see asgi.py)
 # ---------------------------
-if __name__ == "__main__":
-    lessons = load_lessons_data()
-    print(f"📘 Loaded {len(lessons)} lessons from JSON")
+async def process_with_ai_async(title, subject, level, period, week, session, content):
+    """
+    process_with_ai on the event loop: same cache and coalescing, AsyncOpenAI
+    for the call. The SQLite cache and prompt condensing run in threads.
+    """
+    log.info("Processing with AI... Subject: %s, Session: %s", subject, session)
+    language = lesson_language(subject)
+
+    cached_data = await asyncio.to_thread(lesson_cache.get, content, language, subject, str(session))
+    if cached_data:
+        log.info("⚡ Returning cached lesson data (saved API call!)")
+        return apply_lesson_fields(cached_data, title, subject, level, period, week, session)
+
+    key = lesson_cache.make_key(content, language, subject, str(session))
+    lesson_data = await ai_singleflight.do_async(
+        key,
+        lambda: _generate_lesson_data_async(subject, level, period, week, session, content, language),
+        recheck=lambda: lesson_cache.peek(content, language, subject, str(session))
+    )
+    if not lesson_data:
+        return None
 
+    lesson_data = copy.deepcopy(lesson_data)
+    return apply_lesson_fields(lesson_data, title, subject, level, period, week, session)
+
+async def _generate_lesson_data_async(subject, level, period, week, session, content, language):
+    request, specific_steps = await asyncio.to_thread(build_lesson_request, subject, level, period, week,
+                                                      session, content, language)
+
+    async def read_completion(response):
+        if not LLM_STREAM:
+            if response.usage:
+                _record_usage(response.usage)
+            return parse_lesson_json(response.choices[0].message.content or "")
+        parser = StepStreamParser(max_steps=len(specific_steps) or None)
+        async for chunk in response:
+            if chunk.usage:
+                _record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parser.feed(chunk.choices[0].delta.content)
+        return parse_lesson_json(parser.buffer)
+
+    try:
+        with span("openai"):
+            lesson_data = await async_llm.chat(consume=read_completion, retry_on=(MalformedOutputError,),
+                                               stream=LLM_STREAM, **request)
+    except (CircuitOpenError, RateLimitTimeout, OpenAIError, MalformedOutputError) as e:
+        return await asyncio.to_thread(_stale_lesson_data, e, subject, session, content, language)
+    return await asyncio.to_thread(_store_lesson_data, lesson_data, subject, session, content, language)
+
+async def render_pdf_bytes_async(html_content):
+    """render_pdf_bytes on the async browser pool."""
+    async def render(page):
+        await page.set_content(html_content, wait_until="domcontentloaded")
+        await page.evaluate("async () => { await document.fonts.ready; }")
+        return await page.pdf(
+            format="A4",
+            print_background=True,
+            margin={"top": "1cm", "bottom": "1cm", "left": "1cm", "right": "1cm"}
+        )
+
+    with span("page_pdf"):
+        return await async_browser_pool.run(render)
+
+async def build_lesson_pdf_async(lesson_data):
+    """
+    build_lesson_pdf with the render awaited on the async browser pool and the
+    store lookups, template rendering and store write in threads. Returns the
+    artifact key.
+    """
+    template_name, _, _ = select_template(lesson_data)
+    key = await asyncio.to_thread(pdf_store.make_key, lesson_data, os.path.join("templates", template_name),
+                                  TEACHER_INFO_PATH)
+    if await asyncio.to_thread(pdf_store.get_path, key):
+        log.debug("⚡ PDF store HIT for key: %s... (skipped render)", key[:16])
+        return key
+    html_content = await asyncio.to_thread(render_lesson_html, lesson_data)
+    pdf_bytes = await render_pdf_bytes_async(html_content)
+    await asyncio.to_thread(pdf_store.put, key, pdf_bytes)
+    return key
+
+async def generate_pdf_from_lesson_data_async(lesson_data, pdf_filename):
+    key = await build_lesson_pdf_async(lesson_data)
+    pdf_path = await asyncio.to_thread(artifact_store.publish, key, pdf_filename)
+    log.info("✅ PDF created: %s", pdf_path)
+    return pdf_path
+
+
+# ---------------------------
+# BATCH
+# ---------------------------
+def parse_range(value):
+    """'3' -> {'3'}, '1-4' -> {'1', '2', '3', '4'}, None -> None."""
+    if not value:
+        return None
+    if "-" in value:
+        low, high = value.split("-", 1)
+        return {str(n) for n in range(int(low), int(high) + 1)}
+    return {str(int(value))}
+
+def select_lessons(lessons, subject=None, level=None, period=None, weeks=None):
+    """Filter lesson registry entries for a batch run."""
+    week_set = parse_range(weeks)
+    selected = []
     for lesson in lessons:
-        title = lesson["title"]
-        parcours = lesson["parcours"]
-        palier = lesson["palier"]
-        seance = lesson["seance"]
-        content = lesson["content"]
-
-        print("=" * 60)
-        print(f"🚀 Processing: {title} (Palier {palier}, Séance {seance})")
-        print("=" * 60)
-
-        lesson_data = process_with_ai(title, parcours, palier, seance, content)
-
-        if lesson_data:
-            pdf_filename = f"Palier{palier}_Séance{seance}.pdf"
-            generate_pdf_from_lesson_data(lesson_data, pdf_filename)
-            print(f"📄 PDF created → {pdf_filename}")
-        else:
-            print(f"❌ Skipped {title} (invalid AI response)")
+        if subject and subject.lower() not in lesson["subject"].lower():
+            continue
+        if level and str(lesson["level"]) != str(level):
+            continue
+        if period and str(lesson["period"]) != str(period):
+            continue
+        if week_set is not None and str(lesson["week"]) not in week_set:
+            continue
+        if not lesson.get("content", "").strip():
+            log.info("⏭️  Skipping %s (no slide content)", lesson["title"])
+            continue
+        selected.append(lesson)
+    return selected
+
+def load_batch_manifest(manifest_path):
+    """Map lesson id -> last manifest record (JSON lines, last write wins)."""
+    done = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    done[record["id"]] = record
+    return done
+
+def run_batch(lessons, concurrency=4, rate_per_minute=None, manifest_path="data/batch_manifest.jsonl", render=True):
+    """
+    Pre-generate AI data (and PDFs) for many lessons.
+    OpenAI calls run on `concurrency` threads through llm, so every attempt
+    draws from the token bucket shared with the web workers; rate_per_minute
+    (0 or None = no extra limit) additionally caps the batch's own calls with
+    a bucket of its own, LLM_BATCH_RATE_STATE_PATH. PDFs
+    render on the warm browser pool. Lessons recorded as done in the manifest
+    with the same content key are skipped, so an interrupted run resumes.
+
+    Returns:
+        Counts of done/skipped/failed lessons
+    """
+    manifest = load_batch_manifest(manifest_path)
+    if rate_per_minute:
+        # Not a different rate on the shared file: the web workers would refill it at theirs
+        shared = llm.bucket.buckets[0] if isinstance(llm.bucket, CombinedBuckets) else llm.bucket
+        llm.bucket = CombinedBuckets([shared, SharedTokenBucket(LLM_BATCH_RATE_STATE_PATH, rate_per_minute, burst=1)])
+    manifest_lock = threading.Lock()
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+
+    def content_key(lesson):
+        language = lesson_language(lesson["subject"])
+        return lesson_cache.make_key(lesson["content"], language, lesson["subject"], str(lesson["session"]))
+
+    def record(lesson, key, status, pdf_path=None):
+        entry = {"id": lesson["id"], "key": key, "status": status, "pdf_path": pdf_path, "at": time.time()}
+        with manifest_lock:
+            with open(manifest_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            counts[status] += 1
+
+    def work(lesson):
+        key = content_key(lesson)
+        previous = manifest.get(lesson["id"])
+        if previous and previous["status"] == "done" and previous["key"] == key:
+            with manifest_lock:
+                counts["skipped"] += 1
+            return
+
+        log.info("🚀 Processing: %s", lesson["title"])
+        try:
+            lesson_data = process_with_ai(lesson["title"], lesson["subject"], lesson["level"], lesson["period"],
+                                          lesson["week"], lesson["session"], lesson["content"])
+            if not lesson_data:
+                log.error("❌ Skipped %s (invalid AI response)", lesson["title"])
+                record(lesson, key, "failed")
+                return
+            pdf_path = generate_pdf_from_lesson_data(lesson_data, f"{lesson['title']}.pdf") if render else None
+        except Exception as e:
+            log.error("❌ Failed %s: %s", lesson["title"], e)
+            record(lesson, key, "failed")
+            return
+        record(lesson, key, "done", pdf_path)
+
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        list(executor.map(work, lessons))
+    return counts
+
+# ---------------------------
+# MAIN
+# ---------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate lesson journals (AI cache + PDF store) in bulk")
+    parser.add_argument("--subject", help="substring match, e.g. 'math', 'français', 'arabe'")
+    parser.add_argument("--level")
+    parser.add_argument("--period")
+    parser.add_argument("--weeks", help="week or inclusive range, e.g. '3' or '1-4'")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent OpenAI calls")
+    parser.add_argument("--rate", type=float, help="cap on this run's OpenAI calls per minute, on top of the "
+                        "LLM_RATE_PER_MINUTE budget shared with the web workers (default: no extra cap)")
+    parser.add_argument("--browsers", type=int, default=browser_pool.size, help="warm browsers for rendering")
+    parser.add_argument("--manifest", default="data/batch_manifest.jsonl", help="resume manifest (JSON lines)")
+    parser.add_argument("--no-pdf", action="store_true", help="only warm the AI cache")
+    args = parser.parse_args()
+
+    lessons = select_lessons(load_lessons_data(), args.subject, args.level, args.period, args.weeks)
+    log.info("📘 Selected %d lessons", len(lessons))
+
+    browser_pool.size = max(1, args.browsers)
+    try:
+        counts = run_batch(lessons, args.concurrency, args.rate, args.manifest, render=not args.no_pdf)
+    finally:
+        browser_pool.shutdown()
+    log.info("🏁 Batch finished: %d done, %d skipped, %d failed", counts["done"], counts["skipped"], counts["failed"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Content-addressed store for rendered PDFs.
+A journal PDF is fully determined by its lesson_data, the template file (with
+the CSS and fonts inlined into it) and teacherInfo.json, so a repeat request
+can be served without Jinja or Chromium. Mind-map PNGs are kept the same way
+under their own extension. Every template or teacherInfo change leaves a set
+of unreachable files behind, so the store is held under PDF_STORE_MAX_MB by
+evicting the least recently used files.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from observability import get_logger
+from template_env import template_assets, inlining_options
+
+PDF_STORE_DIR = os.getenv("PDF_STORE_DIR", "data/pdf_store")
+PDF_STORE_MAX_BYTES = int(os.getenv("PDF_STORE_MAX_MB", "1024")) * 1024 * 1024
+PDF_STORE_SWEEP_INTERVAL = float(os.getenv("PDF_STORE_SWEEP_INTERVAL", "300"))
+# Files used more recently than this are never evicted (a publish may be about to link them)
+PDF_STORE_MIN_AGE_SECONDS = 600
+
+log = get_logger(__name__)
+
+_digest_memo: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """
+    SHA256 of a file's contents, memoized on (inode, size, mtime).
+
+    Returns:
+        Hex digest, or "missing" if the file does not exist
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+    stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        memo = _digest_memo.get(path)
+        if memo and memo[0] == stamp:
+            return memo[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_memo[path] = (stamp, digest)
+    return digest
+
+
+class PDFStore:
+    def __init__(self, root: str = PDF_STORE_DIR, max_bytes: int = PDF_STORE_MAX_BYTES,
+                 sweep_interval: float = PDF_STORE_SWEEP_INTERVAL):
+        """
+        Initialize the store.
+
+        Args:
+            root: Directory holding <key[:2]>/<key>.pdf (or .png) artifacts
+            max_bytes: Byte quota for root (0 disables eviction)
+            sweep_interval: Minimum seconds between quota checks (run after a put)
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._stats_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evicted": 0
+        }
+
+    def make_key(self, lesson_data: Dict[str, Any], template_path: str, teacher_info_path: str) -> str:
+        """
+        Build the artifact key for a render.
+
+        Args:
+            lesson_data: Lesson data passed to the template
+            template_path: Jinja template file used for the render
+            teacher_info_path: teacherInfo.json injected into the header
+
+        Returns:
+            SHA256 hex digest
+        """
+        key_data = json.dumps({
+            "lesson_data": lesson_data,
+            "template": os.path.basename(template_path),
+            "template_sha256": file_digest(template_path),
+            # Inlined stylesheets and fonts change the PDF as much as the template does
+            "assets_sha256": [file_digest(path) for path in template_assets(template_path)],
+            "inlining": inlining_options(),
+            "teacher_info_sha256": file_digest(teacher_info_path)
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+    def path_for(self, key: str, ext: str = "pdf") -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{ext}")
+
+    def get_path(self, key: str, ext: str = "pdf") -> Optional[str]:
+        """Return the stored artifact path for key (marking it used), or None on a miss."""
+        path = self.path_for(key, ext)
+        try:
+            os.utime(path)  # mtime is the LRU clock
+            hit = True
+        except FileNotFoundError:
+            hit = False
+        with self._stats_lock:
+            self.stats["hits" if hit else "misses"] += 1
+        return path if hit else None
+
+    def put(self, key: str, pdf_bytes: bytes, ext: str = "pdf") -> str:
+        """Atomically store PDF (or `ext`) bytes under key and return the artifact path."""
+        path = self.path_for(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._maybe_sweep()
+        return path
+
+    def _maybe_sweep(self) -> None:
+        if not self.max_bytes:
+            return
+        now = time.monotonic()
+        with self._stats_lock:
+            if self._last_sweep and now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            self.sweep()
+        except OSError as e:
+            log.error("❌ PDF store sweep failed: %s", e)
+
+    def sweep(self) -> int:
+        """
+        Evict the least recently used artifacts until the store fits max_bytes.
+        One process sweeps at a time; the others skip.
+
+        Returns:
+            Number of files removed
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".sweep.lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            try:
+                return self._sweep_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sweep_locked(self) -> int:
+        files, total = [], 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        cutoff = time.time() - PDF_STORE_MIN_AGE_SECONDS
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes or mtime > cutoff:
+                break
+            try:
+                os.remove(path)  # published copies are hard links and stay until artifact_store expires them
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._stats_lock:
+            self.stats["evicted"] += removed
+        if removed:
+            log.info("🧹 PDF store: evicted %d files, %.1f MB left", removed, total / 1024 / 1024)
+        return removed
+
+    def publish(self, key: str, dest_path: str, ext: str = "pdf") -> str:
+        """
+        Expose a stored artifact at dest_path (hard link, copy as fallback).
+        The swap is atomic so a concurrent download never sees a partial file.
+        """
+        src = self.path_for(key, ext)
+        dest_dir = os.path.dirname(dest_path) or "."
+        os.makedirs(dest_dir, exist_ok=True)
+        if os.path.exists(dest_path) and os.path.samefile(src, dest_path):
+            return dest_path
+        tmp_path = os.path.join(dest_dir, f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.link(src, tmp_path)
+        except FileExistsError:
+            pass  # left behind by an earlier publish of this key from this thread
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dest_path)
+        if os.path.exists(tmp_path):
+            # rename() is a no-op when both names already link to the same file
+            os.remove(tmp_path)
+        return dest_path
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate_percent"] = round(stats["hits"] / total * 100, 2) if total else 0
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+# Global store instance
+pdf_store = PDFStore()
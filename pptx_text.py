@@ -0,0 +1,125 @@
+"""
+Fast PPTX text extraction straight from the slide XML.
+Streams ppt/slides/slideN.xml (and the linked notes slides) out of the zip
+with iterparse, so memory stays flat however much media the deck embeds,
+and picks up text in groups, tables and speaker notes.
+"""
+import posixpath
+import re
+import zipfile
+from typing import IO, Dict, List, Optional, Union
+from xml.etree.ElementTree import iterparse
+
+NS_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+NS_P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+NS_R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+NOTES_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+
+_SPACES = re.compile(r"[ \t\u00a0]+")
+
+
+def _normalize(text: str) -> str:
+    """Collapse horizontal whitespace runs and trim."""
+    return _SPACES.sub(" ", text).strip()
+
+
+def _paragraphs(stream: IO[bytes]) -> List[str]:
+    """
+    Non-empty paragraphs of one slide part, in document order.
+    Text inside <a:fld> (slide numbers, dates) is skipped.
+    """
+    paragraphs = []
+    runs: List[str] = []
+    in_field = 0
+    for event, elem in iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == f"{NS_A}fld":
+                in_field += 1
+            continue
+        if tag == f"{NS_A}t":
+            if not in_field and elem.text:
+                runs.append(elem.text)
+        elif tag == f"{NS_A}br":
+            runs.append("\n")
+        elif tag == f"{NS_A}fld":
+            in_field -= 1
+        elif tag == f"{NS_A}p":
+            for line in "".join(runs).split("\n"):
+                line = _normalize(line)
+                if line:
+                    paragraphs.append(line)
+            runs = []
+            elem.clear()
+        elif tag in (f"{NS_P}sp", f"{NS_P}graphicFrame", f"{NS_P}pic"):
+            # Shape finished: drop its subtree to keep memory flat
+            elem.clear()
+    return paragraphs
+
+
+def _rels(zf: zipfile.ZipFile, part: str) -> Dict[str, Dict[str, str]]:
+    """Relationships of a part: rId -> {type, target (resolved zip path)}."""
+    rels_path = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+    try:
+        stream = zf.open(rels_path)
+    except KeyError:
+        return {}
+    rels = {}
+    with stream:
+        for _, elem in iterparse(stream):
+            if elem.tag == f"{NS_REL}Relationship":
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(part), elem.get("Target", "")))
+                rels[elem.get("Id")] = {"type": elem.get("Type", ""), "target": target}
+    return rels
+
+
+def _slide_parts(zf: zipfile.ZipFile) -> List[str]:
+    """Slide part names in presentation order."""
+    names = set(zf.namelist())
+    rels = _rels(zf, "ppt/presentation.xml")
+    ordered: List[str] = []
+    if "ppt/presentation.xml" in names:
+        with zf.open("ppt/presentation.xml") as stream:
+            for _, elem in iterparse(stream):
+                if elem.tag == f"{NS_P}sldId":
+                    rel = rels.get(elem.get(f"{NS_R}id"))
+                    if rel and rel["target"] in names:
+                        ordered.append(rel["target"])
+    if ordered:
+        return ordered
+    # No usable presentation.xml: fall back to numeric file order
+    slides = [n for n in names if re.fullmatch(r"ppt/slides/slide\d+\.xml", n)]
+    return sorted(slides, key=lambda n: int(re.search(r"(\d+)\.xml$", n).group(1)))
+
+
+def extract_slides(source: Union[str, IO[bytes]], include_notes: bool = True) -> List[str]:
+    """
+    Text of every slide, one string per slide (paragraphs joined by newlines).
+
+    Args:
+        source: Path to a .pptx file or a seekable binary file object
+        include_notes: Append the slide's speaker notes to its text
+
+    Returns:
+        List of slide texts in presentation order
+    """
+    slides = []
+    with zipfile.ZipFile(source) as zf:
+        for part in _slide_parts(zf):
+            with zf.open(part) as stream:
+                lines = _paragraphs(stream)
+            if include_notes:
+                notes = _notes_part(zf, part)
+                if notes:
+                    with zf.open(notes) as stream:
+                        lines.extend(_paragraphs(stream))
+            slides.append("\n".join(lines))
+    return slides
+
+
+def _notes_part(zf: zipfile.ZipFile, slide_part: str) -> Optional[str]:
+    for rel in _rels(zf, slide_part).values():
+        if rel["type"] == NOTES_REL_TYPE:
+            return rel["target"]
+    return None
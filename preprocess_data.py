@@ -1,10 +1,25 @@
 import os
 import json
 import re
+import fcntl
+import hashlib
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pptx import Presentation
+from pptx_text import extract_slides
+from observability import get_logger, span
 
 LESSONS_DIR = "lessons"
 OUTPUT_JSON = "data/lessons.json"
+MANIFEST_NAME = "lessons_manifest.json"
+SCAN_INTERVAL_SECONDS = float(os.getenv("LESSONS_SCAN_INTERVAL", "30"))
+SCAN_WORKERS = int(os.getenv("LESSONS_SCAN_WORKERS", str(os.cpu_count() or 2)))
+
+log = get_logger(__name__)
 
 def extract_metadata_from_filename(filename: str):
     """
@@ -68,7 +83,21 @@ def extract_metadata_from_filename(filename: str):
 
     return metadata
 
+@span("extract_text")
 def extract_text_from_pptx(file_path):
+    """
+    Extract slide text from a .pptx path or a seekable binary file object.
+    Reads the slide XML directly (see pptx_text.py): includes tables, groups
+    and speaker notes, with whitespace normalized and empty lines dropped.
+    """
+    try:
+        return "\n".join(slide for slide in extract_slides(file_path) if slide)
+    except Exception as e:
+        log.error("❌ Error reading %s: %s", file_path, e)
+        return ""
+
+def extract_text_from_pptx_legacy(file_path):
+    """Original python-pptx extractor, kept for benchmarks/bench_extract.py."""
     try:
         prs = Presentation(file_path)
         text = []
@@ -78,7 +107,7 @@ def extract_text_from_pptx(file_path):
                     text.append(shape.text)
         return "\n".join(text)
     except Exception as e:
-        print(f"Error reading {file_path}: {e}")
+        log.error("❌ Error reading %s: %s", file_path, e)
         return ""
 
 def extract_objective(content: str):
@@ -90,46 +119,135 @@ def extract_objective(content: str):
             return line.strip()
     return "......"
 
-def update_lessons_registry(lessons_dir: str = LESSONS_DIR, json_path: str = OUTPUT_JSON):
+def file_fingerprint(path: str, previous: dict = None):
+    """
+    (size, mtime, sha256) fingerprint of a deck.
+    The hash is only recomputed when size or mtime moved.
+    """
+    st = os.stat(path)
+    if previous and previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns:
+        return previous
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+
+def load_lessons_manifest(json_path: str = OUTPUT_JSON):
+    """Deck fingerprints by filename: {filename: {size, mtime_ns, sha256}}."""
+    return _load_json(os.path.join(os.path.dirname(json_path) or ".", MANIFEST_NAME), {})
+
+def _load_json(path: str, default):
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            pass
+    return default
+
+def write_json_atomic(path: str, data) -> None:
+    """Write JSON to a temp file in the same directory, then rename over path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _extract_many(paths):
+    """Extract text from several decks, in parallel when there is more than one."""
+    if len(paths) <= 1:
+        return [extract_text_from_pptx(p) for p in paths]
+    workers = min(len(paths), SCAN_WORKERS)
+    # spawn: forking a multi-threaded gunicorn worker is not safe
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return list(pool.map(extract_text_from_pptx, paths))
+    except BrokenProcessPool as e:
+        log.warning("⚠️  Extraction pool failed (%s), extracting serially", e)
+        return [extract_text_from_pptx(p) for p in paths]
+
+@span("registry_scan")
+def update_lessons_registry(lessons_dir: str = LESSONS_DIR, json_path: str = OUTPUT_JSON, blocking: bool = True):
     """
-    Scan lessons directory for new PPTX files and update lessons.json.
+    Scan lessons directory for new or modified PPTX files and update lessons.json.
+    Decks are compared by (size, mtime, sha256) against a manifest; changed
+    decks are re-extracted in a process pool. Writes are atomic and guarded by
+    a lock file so concurrent workers can't corrupt lessons.json.
+
+    Args:
+        blocking: Wait for another process's scan instead of skipping
+
     Returns True if changes were made.
     """
     if not os.path.exists(lessons_dir):
         os.makedirs(lessons_dir, exist_ok=True)
         return False
 
-    # Load existing lessons
-    lessons = []
-    if os.path.exists(json_path):
+    os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+    with open(json_path + ".lock", "a") as lock_file:
         try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                lessons = json.load(f)
-        except json.JSONDecodeError:
-            lessons = []
-    
-    # Get existing filenames
-    existing_filenames = {l.get("filename") for l in lessons}
-    
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        try:
+            return _update_lessons_registry_locked(lessons_dir, json_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _update_lessons_registry_locked(lessons_dir: str, json_path: str) -> bool:
+    manifest_path = os.path.join(os.path.dirname(json_path) or ".", MANIFEST_NAME)
+
+    # Load existing lessons and deck fingerprints
+    lessons = _load_json(json_path, [])
+    manifest = load_lessons_manifest(json_path)
+    by_filename = {l.get("filename"): l for l in lessons}
+
     # Scan directory
     files = sorted([f for f in os.listdir(lessons_dir) if f.endswith(".pptx")])
-    new_files_found = False
+    changed = []
+    manifest_dirty = False
 
     for filename in files:
-        if filename not in existing_filenames:
-            print(f"🔍 New lesson found: {filename}")
-            pptx_path = os.path.join(lessons_dir, filename)
-            
+        pptx_path = os.path.join(lessons_dir, filename)
+        previous = manifest.get(filename)
+        try:
+            fingerprint = file_fingerprint(pptx_path, previous)
+        except OSError as e:
+            log.error("❌ Error reading %s: %s", filename, e)
+            continue
+        if fingerprint is previous:
+            continue
+        manifest[filename] = fingerprint
+        manifest_dirty = True
+
+        if previous is None and filename in by_filename:
+            # Registered before fingerprints existed: adopt it as-is
+            continue
+        if previous is not None and previous.get("sha256") == fingerprint["sha256"]:
+            # Touched but identical content
+            continue
+        if filename in by_filename:
+            log.info("🔄 Modified lesson found: %s", filename)
+        else:
+            log.info("🔍 New lesson found: %s", filename)
+        changed.append(filename)
+
+    if changed:
+        contents = _extract_many([os.path.join(lessons_dir, f) for f in changed])
+        next_id = max([l["id"] for l in lessons], default=0) + 1
+
+        for filename, content in zip(changed, contents):
             try:
-                content = extract_text_from_pptx(pptx_path)
                 meta = extract_metadata_from_filename(filename)
                 objective = extract_objective(content)
                 
-                # Generate new ID
-                new_id = max([l["id"] for l in lessons], default=0) + 1
-                
-                new_lesson = {
-                    "id": new_id,
+                lesson = {
                     "title": meta["title"],
                     "subject": meta["subject"],
                     "level": meta["level"],
@@ -140,24 +258,68 @@ def update_lessons_registry(lessons_dir: str = LESSONS_DIR, json_path: str = OUT
                     "objective": objective,
                     "content": content
                 }
-                
-                lessons.append(new_lesson)
-                new_files_found = True
-                print(f"✅ Added lesson: {filename}")
+
+                existing = by_filename.get(filename)
+                if existing is not None:
+                    existing.update(lesson)
+                    log.info("✅ Updated lesson: %s", filename)
+                else:
+                    lesson = {"id": next_id, **lesson}
+                    next_id += 1
+                    lessons.append(lesson)
+                    by_filename[filename] = lesson
+                    log.info("✅ Added lesson: %s", filename)
             except Exception as e:
-                print(f"❌ Error processing {filename}: {e}")
-
-    if new_files_found:
-        os.makedirs(os.path.dirname(json_path), exist_ok=True)
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(lessons, f, ensure_ascii=False, indent=2)
-        print(f"💾 {json_path} updated")
-        return True
-    
-    return False
+                log.error("❌ Error processing %s: %s", filename, e)
+
+        write_json_atomic(json_path, lessons)
+        log.info("💾 %s updated", json_path)
+
+    if manifest_dirty:
+        write_json_atomic(manifest_path, manifest)
+
+    return bool(changed)
+
+class LessonScanner:
+    """Background thread that polls the lessons directory, off the request path."""
+
+    def __init__(self, interval: float = SCAN_INTERVAL_SECONDS):
+        self.interval = interval
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.last_scan = None
+
+    def start(self) -> None:
+        """Start polling in this process (no-op if already running)."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name="lesson-scanner", daemon=True)
+            self._thread.start()
+
+    def trigger(self) -> None:
+        """Ask for a scan now instead of waiting for the next interval."""
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                # Only one worker scans at a time; the others just skip this round
+                update_lessons_registry(blocking=False)
+                self.last_scan = time.time()
+            except Exception as e:
+                log.error("❌ Lesson scan failed: %s", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+# Global scanner instance
+lesson_scanner = LessonScanner()
 
 def main():
-    print("Scanning for new lessons...")
+    log.info("Scanning for new lessons...")
     update_lessons_registry()
 
 if __name__ == "__main__":
@@ -0,0 +1,286 @@
+"""
+Prompt-size reduction before the OpenAI call.
+Slide text carries the same teacher-instruction boilerplate on every deck
+("تعيين تلميذ(ة) للإجابة", "Organisation de la semaine", ...). This module
+learns those lines from the lesson registry, drops them and duplicate lines,
+and trims what is left to a per-subject/session token budget. Trimming is
+spread over the deck's steps in proportion to their size, so a long deck
+loses the end of every step rather than all of its last steps.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Set, Tuple
+
+from lesson_registry import lesson_registry
+from observability import get_logger
+
+BOILERPLATE_MIN_SHARE = float(os.getenv("BOILERPLATE_MIN_SHARE", "0.4"))
+BOILERPLATE_MIN_LESSONS = int(os.getenv("BOILERPLATE_MIN_LESSONS", "5"))
+BOILERPLATE_MIN_LETTERS = int(os.getenv("BOILERPLATE_MIN_LETTERS", "8"))
+BOILERPLATE_MIN_SESSIONS = int(os.getenv("BOILERPLATE_MIN_SESSIONS", "3"))
+BOILERPLATE_MIN_PERIODS = int(os.getenv("BOILERPLATE_MIN_PERIODS", "2"))
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+
+log = get_logger(__name__)
+
+# Content token budgets; review sessions summarise several lessons and get more room
+TOKEN_BUDGETS = {
+    "français": {"6": PROMPT_TOKEN_BUDGET + 1000},
+    "mathématiques": {"5": PROMPT_TOKEN_BUDGET + 1000, "6": PROMPT_TOKEN_BUDGET + 1000},
+    "langue arabe": {},
+}
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")  # gpt-4o family
+except Exception:  # optional dependency (or no cached BPE file offline)
+    _ENCODING = None
+
+_SPACES = re.compile(r"\s+")
+# Section and step titles ("Séance 2", "Lecture – Texte", "3. Activités...", "- 01 افتتاح الحصة",
+# "ممارسة موجهة"): they repeat on every deck but tell the model how the lesson is structured
+_STEP_HEADER = re.compile(
+    r"^(?:[-–•]?\s*\d+\s*[-.)–]?\s*)?"
+    r"(?:oral|[ée]crit|[ée]criture|lecture|séance|révision|activités|"
+    r"قراءة|(?:ال)?(?:نشاط|حصة|ممارسة|نمذجة|افتتاح|اختتام|مراجعة|مراحل|درس))\b"
+)
+# Questions and prompts ("ماذا نفعل في الخطوة الثانية؟", "Description de la scène.", "... قادرين على:"):
+# the same wording on every deck, but the lines after them only make sense with it
+_PROMPT_LINE = re.compile(
+    r"[?؟:]\s*$|^(?:description|décri[st]|observe|écoute|réponds|complète|"
+    r"ماذا|لماذا|كيف|أين|متى|هل|اقرأ|لاحظ|أجب|صف)\b"
+)
+# Longer steps (or decks without step headers) are trimmed in blocks of this many lines
+SECTION_MAX_LINES = 10
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Token count for gpt-4o-mini: exact with tiktoken when installed,
+    otherwise ~4 UTF-8 bytes per token (Arabic letters are 2 bytes each).
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text.encode("utf-8")) / 4)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Longest prefix of text that fits in `tokens`, cut back to a word boundary when there is one."""
+    if tokens <= 0:
+        return ""
+    if _ENCODING is not None:
+        head = _ENCODING.decode(_ENCODING.encode(text)[:tokens])
+    else:
+        head = text.encode("utf-8")[:tokens * 4].decode("utf-8", "ignore")
+    if len(head) < len(text) and " " in head:
+        head = head.rsplit(" ", 1)[0]
+    return head.strip()
+
+
+def _normalize_line(line: str) -> str:
+    # Tatweel (ـ) only stretches Arabic letters: "اختــتام" is "اختتام"
+    return _SPACES.sub(" ", line.replace("\u0640", "")).strip().casefold()
+
+
+def budget_for(subject: str, session: Any) -> int:
+    """Content token budget for a subject/session pair."""
+    overrides = TOKEN_BUDGETS.get(subject.lower(), {})
+    return overrides.get(str(session), PROMPT_TOKEN_BUDGET)
+
+
+class BoilerplateIndex:
+    """
+    Lines that repeat across a large share of a subject's decks, in at least
+    min_sessions different sessions and in every period the subject has (up
+    to min_periods), rebuilt when the registry changes. Step headers, short
+    lines (slide numbers, "Séance 2") and questions or prompts are never
+    boilerplate: they carry the lesson's structure.
+    """
+
+    def __init__(self, min_share: float = BOILERPLATE_MIN_SHARE, min_lessons: int = BOILERPLATE_MIN_LESSONS,
+                 min_letters: int = BOILERPLATE_MIN_LETTERS, min_sessions: int = BOILERPLATE_MIN_SESSIONS,
+                 min_periods: int = BOILERPLATE_MIN_PERIODS):
+        self.min_share = min_share
+        self.min_lessons = min_lessons
+        self.min_letters = min_letters
+        self.min_sessions = min_sessions
+        self.min_periods = min_periods
+        self._version = None
+        self._lines: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def lines_for(self, subject: str) -> Set[str]:
+        version = lesson_registry.version
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._lines = self._build()
+                    self._version = version
+        return self._lines.get(subject.lower(), set())
+
+    def _build(self) -> Dict[str, Set[str]]:
+        frequency: Dict[str, Counter] = {}
+        sessions: Dict[Tuple[str, str], Set[str]] = {}
+        periods: Dict[Tuple[str, str], Set[str]] = {}
+        subject_periods: Dict[str, Set[str]] = {}
+        decks: Counter = Counter()
+        for lesson in lesson_registry.all():
+            if not lesson.get("content", "").strip():
+                continue
+            subject = lesson["subject"].lower()
+            period, session = str(lesson.get("period", "")), str(lesson.get("session", ""))
+            decks[subject] += 1
+            subject_periods.setdefault(subject, set()).add(period)
+            lines = {_normalize_line(l) for l in lesson["content"].split("\n")}
+            lines.discard("")
+            frequency.setdefault(subject, Counter()).update(lines)
+            for line in lines:
+                sessions.setdefault((subject, line), set()).add(session)
+                periods.setdefault((subject, line), set()).add(period)
+
+        boilerplate = {}
+        for subject, counts in frequency.items():
+            threshold = max(self.min_lessons, self.min_share * decks[subject])
+            min_periods = min(self.min_periods, len(subject_periods[subject]))
+            boilerplate[subject] = {
+                line for line, n in counts.items()
+                if n >= threshold
+                and len(sessions[subject, line]) >= self.min_sessions
+                and len(periods[subject, line]) >= min_periods
+                and self._may_be_boilerplate(line)
+            }
+        log.info("🧹 Boilerplate index: %s", ", ".join(f"{s} {len(b)} lines" for s, b in boilerplate.items()))
+        return boilerplate
+
+    def _may_be_boilerplate(self, line: str) -> bool:
+        if sum(c.isalpha() for c in line) < self.min_letters:
+            return False
+        return not (_STEP_HEADER.match(line) or _PROMPT_LINE.search(line))
+
+
+class PromptStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "tokens_before": 0,
+            "tokens_after": 0,
+            "truncated_calls": 0,
+            "api_prompt_tokens": 0
+        }
+
+    def record(self, info: Dict[str, Any]) -> None:
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["tokens_before"] += info["tokens_before"]
+            self.stats["tokens_after"] += info["tokens_after"]
+            self.stats["truncated_calls"] += int(info["truncated"])
+
+    def record_usage(self, prompt_tokens: int) -> None:
+        with self._lock:
+            self.stats["api_prompt_tokens"] += prompt_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        saved = stats["tokens_before"] - stats["tokens_after"]
+        stats["tokens_saved"] = saved
+        stats["saved_percent"] = round(saved / stats["tokens_before"] * 100, 2) if stats["tokens_before"] else 0
+        stats["tokenizer"] = "tiktoken" if _ENCODING is not None else "estimate"
+        return stats
+
+
+boilerplate_index = BoilerplateIndex()
+prompt_stats = PromptStats()
+
+
+def _sections(lines: List[str]) -> List[List[str]]:
+    """Lines grouped into steps, each starting at a step header, in blocks of at most SECTION_MAX_LINES."""
+    steps: List[List[str]] = [[]]
+    for line in lines:
+        if _STEP_HEADER.match(_normalize_line(line)) and steps[-1]:
+            steps.append([])
+        steps[-1].append(line)
+    return [step[i:i + SECTION_MAX_LINES] for step in steps for i in range(0, len(step), SECTION_MAX_LINES)]
+
+
+def _trim_sections(lines: List[str], budget: int) -> Tuple[List[str], bool]:
+    """
+    Fit lines into budget tokens. Each step keeps its first lines, within a
+    share of the budget proportional to its size; what a step leaves unused
+    goes to the steps after it.
+
+    Returns:
+        (kept lines, whether anything was cut)
+    """
+    costs = [estimate_tokens(line) + 1 for line in lines]  # +1 for the newline
+    total = sum(costs)
+    if total <= budget:
+        return lines, False
+    kept: List[str] = []
+    remaining_budget, remaining_total = budget, total
+    position = 0
+    for section in _sections(lines):
+        section_costs = costs[position:position + len(section)]
+        position += len(section)
+        share = remaining_budget * sum(section_costs) // remaining_total
+        remaining_total -= sum(section_costs)
+        used = 0
+        for i, (line, cost) in enumerate(zip(section, section_costs)):
+            if used + cost <= share:
+                kept.append(line)
+                used += cost
+            elif i == 0:
+                # Keep the part of the first line that still fits: one huge line must not vanish entirely
+                head = truncate_to_tokens(line, share - 1)
+                if head:
+                    kept.append(head)
+                    used += estimate_tokens(head) + 1
+                break
+            else:
+                break
+        remaining_budget -= used
+    return kept, True
+
+
+def condense_content(content: str, subject: str, session: Any) -> Tuple[str, Dict[str, Any]]:
+    """
+    Strip boilerplate and duplicate lines, then trim every step to fit the token budget.
+
+    Returns:
+        (condensed content, info dict with token counts before/after)
+    """
+    boilerplate = boilerplate_index.lines_for(subject)
+    budget = budget_for(subject, session)
+    seen: Set[str] = set()
+    kept = []
+    removed_boilerplate = removed_duplicates = 0
+    for raw in content.split("\n"):
+        key = _normalize_line(raw)
+        if not key:
+            continue
+        if key in boilerplate:
+            removed_boilerplate += 1
+            continue
+        if key in seen:
+            removed_duplicates += 1
+            continue
+        seen.add(key)
+        kept.append(_SPACES.sub(" ", raw).strip())
+
+    kept, truncated = _trim_sections(kept, budget)
+
+    condensed = "\n".join(kept)
+    info = {
+        "tokens_before": estimate_tokens(content),
+        "tokens_after": estimate_tokens(condensed),
+        "budget": budget,
+        "removed_boilerplate": removed_boilerplate,
+        "removed_duplicates": removed_duplicates,
+        "truncated": truncated
+    }
+    prompt_stats.record(info)
+    return condensed, info
@@ -0,0 +1,203 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+The first caller for a key does the work; concurrent callers with the same key
+wait for it instead of repeating the call. Threads in one worker share the
+leader's result directly; other gunicorn workers wait on a lock file and then
+re-check the shared cache the leader has filled. do_async() is the same
+for coroutines on the ASGI event loop; it shares the lock files, so threads,
+coroutines and other workers all coalesce onto one call.
+Each key has its own (empty) lock file, so unrelated calls never wait on each
+other, and a caller waits at most SINGLEFLIGHT_WAIT_SECONDS for another
+worker before running the call itself.
+"""
+import asyncio
+import fcntl
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, IO, Optional
+
+from observability import get_logger
+
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SINGLEFLIGHT_LOCK_DIR", "data/locks")
+# Longer than one OpenAI call with its retries; past it the leader is presumed stuck
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "300"))
+# How often a waiter re-tries a lock file held by another worker
+SINGLEFLIGHT_POLL_SECONDS = 0.05
+
+log = get_logger(__name__)
+
+
+def _try_lock(lock_file: IO) -> bool:
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, name: str, lock_dir: str = SINGLEFLIGHT_LOCK_DIR, wait_seconds: float = SINGLEFLIGHT_WAIT_SECONDS):
+        """
+        Initialize the coalescer.
+
+        Args:
+            name: Subdirectory of lock_dir for this group of keys
+            lock_dir: Directory for cross-process lock files
+            wait_seconds: Longest wait for another worker's call before running fn anyway
+        """
+        self.name = name
+        self.lock_dir = os.path.join(lock_dir, name)
+        self.wait_seconds = wait_seconds
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[str, "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "executed": 0,
+            "coalesced_local": 0,
+            "coalesced_remote": 0,
+            "wait_timeouts": 0
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, f"{key}.lock")
+
+    def _wait_timed_out(self, key: str) -> None:
+        self._count("wait_timeouts")
+        log.warning("⏳ Waited %.0fs for another worker's call, running it here: %s...", self.wait_seconds, key[:16])
+
+    def do(self, key: str, fn: Callable[[], Any], recheck: Callable[[], Any]) -> Any:
+        """
+        Run fn once per key across concurrent callers.
+
+        Args:
+            key: Hex digest identifying the call
+            fn: The expensive call
+            recheck: Looks up the result another worker may have produced
+                (returns None if there is none yet)
+
+        Returns:
+            fn's result (or recheck's, when another worker did the work)
+        """
+        self._count("calls")
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._count("coalesced_local")
+            log.info("🔗 Coalesced onto in-flight call for key: %s...", key[:16])
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fn, recheck)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _lead(self, key: str, fn: Callable[[], Any], recheck: Callable[[], Any]) -> Any:
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(self._lock_path(key), "a") as lock_file:
+            deadline = time.monotonic() + self.wait_seconds
+            locked = _try_lock(lock_file)
+            while not locked and time.monotonic() < deadline:
+                # Another worker holds the lock: wait for it
+                time.sleep(SINGLEFLIGHT_POLL_SECONDS)
+                locked = _try_lock(lock_file)
+            if not locked:
+                self._wait_timed_out(key)
+            try:
+                result = self._recheck_or_run(key, recheck)
+                return result if result is not None else fn()
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _recheck_or_run(self, key: str, recheck: Callable[[], Any]) -> Any:
+        """
+        With the lock held (or the wait given up): the result if another worker
+        already produced it, else None (and the call counts as executed).
+        Checked even when the lock was free: its holder may have released it
+        just before.
+        """
+        result = recheck()
+        if result is not None:
+            self._count("coalesced_remote")
+            log.info("🔗 Reused result from another worker for key: %s...", key[:16])
+            return result
+        self._count("executed")
+        return None
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]], recheck: Callable[[], Any]) -> Any:
+        """
+        do() for coroutines: fn() is awaited, the lock file is polled with
+        asyncio.sleep instead of time.sleep, and recheck runs in a thread.
+        """
+        self._count("calls")
+        future = self._async_calls.get(key)
+        if future is not None:
+            self._count("coalesced_local")
+            log.info("🔗 Coalesced onto in-flight call for key: %s...", key[:16])
+            return await asyncio.shield(future)
+
+        future = self._async_calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._lead_async(key, fn, recheck)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved: no "never retrieved" warning without followers
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._async_calls[key]
+        return result
+
+    async def _lead_async(self, key: str, fn: Callable[[], Awaitable[Any]], recheck: Callable[[], Any]) -> Any:
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(self._lock_path(key), "a") as lock_file:
+            deadline = time.monotonic() + self.wait_seconds
+            locked = _try_lock(lock_file)
+            while not locked and time.monotonic() < deadline:
+                await asyncio.sleep(SINGLEFLIGHT_POLL_SECONDS)
+                locked = _try_lock(lock_file)
+            if not locked:
+                self._wait_timed_out(key)
+            try:
+                result = await asyncio.to_thread(self._recheck_or_run, key, recheck)
+                return result if result is not None else await fn()
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["coalesced"] = stats["coalesced_local"] + stats["coalesced_remote"]
+        stats["in_flight"] = len(self._calls) + len(self._async_calls)
+        return stats
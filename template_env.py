@@ -0,0 +1,167 @@
+"""
+Shared Jinja environment for the journal templates.
+There is one Environment per process. Templates are compiled once, with the
+bytecode shared between workers on disk, and then kept in memory.
+Auto-reload is only on in debug. The loader inlines local stylesheets and
+fonts into the template source, so the rendered HTML is a self-contained
+shell and rendering never reads a file. Fonts are subset to Latin, Arabic and
+emoji when fontTools is installed.
+"""
+import base64
+import functools
+import io
+import os
+import re
+from typing import Tuple
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from observability import get_logger
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", "data/jinja_cache")
+JINJA_AUTO_RELOAD = os.getenv("JINJA_AUTO_RELOAD", os.getenv("FLASK_DEBUG", "0")) == "1"
+
+FONT_SUBSET = os.getenv("FONT_SUBSET", "1") == "1"
+
+log = get_logger(__name__)
+
+FONT_MIME_TYPES = {".ttf": "font/ttf", ".otf": "font/otf", ".woff": "font/woff", ".woff2": "font/woff2"}
+CSS_FONT_FORMATS = {"font/ttf": "truetype", "font/otf": "opentype", "font/woff": "woff", "font/woff2": "woff2"}
+FONT_MAGIC = (b"\x00\x01\x00\x00", b"OTTO", b"true", b"wOFF", b"wOF2")
+# Glyphs kept when subsetting: Latin (French), punctuation, Arabic with its
+# presentation forms, and the emoji blocks used for step icons
+FONT_SUBSET_UNICODES = [
+    *range(0x20, 0x7F), *range(0xA0, 0x180), *range(0x2000, 0x2070), 0x20AC,
+    *range(0x600, 0x700), *range(0x750, 0x780), *range(0x8A0, 0x900),
+    *range(0xFB50, 0xFE00), *range(0xFE70, 0xFF00),
+    *range(0x2600, 0x27C0), *range(0x1F300, 0x1FB00), 0xFE0F, 0x200D,
+]
+
+try:
+    from fontTools import subset as font_subset
+    from fontTools.ttLib import TTFont
+except ImportError:  # optional dependency: fonts are inlined whole
+    font_subset = None
+    if FONT_SUBSET:
+        log.warning("⚠️  fontTools is not installed, inlining fonts whole (pip install fonttools)")
+
+_FONT_URL = re.compile(r"""url\((['"]?)([^'"():]+\.(?:ttf|otf|woff2?))\1\)(\s*format\((['"]?)[\w-]+\4\))?""")
+_STYLESHEET = re.compile(r"""<link\s+rel=["']stylesheet["']\s+href=["']([^"':]+\.css)["']\s*/?>""")
+
+
+def subset_font(data: bytes) -> bytes:
+    """Keep only FONT_SUBSET_UNICODES (with all layout features, for Arabic shaping) as WOFF."""
+    font = TTFont(io.BytesIO(data))
+    options = font_subset.Options()
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=FONT_SUBSET_UNICODES)
+    subsetter.subset(font)
+    font.flavor = "woff"
+    output = io.BytesIO()
+    font.save(output)
+    return output.getvalue()
+
+
+class NotAFontError(ValueError):
+    """A template references a font file whose content is not a font."""
+
+
+@functools.lru_cache(maxsize=32)
+def _font_data_uri(path: str, mtime_ns: int) -> Tuple[str, str]:
+    """(base64 data URI, mime type) of a font file, cached per file version."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(FONT_MAGIC):
+        # A saved web page or a truncated download would silently render in a fallback font
+        log.error("❌ %s is not a font file", path)
+        raise NotAFontError(f"{path} is not a TTF/OTF/WOFF font (starts with {data[:16]!r})")
+    mime = FONT_MIME_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+    if FONT_SUBSET and font_subset is not None:
+        try:
+            subset = subset_font(data)
+            log.info("🔤 Subset %s: %d KB → %d KB", os.path.basename(path), len(data) // 1024, len(subset) // 1024)
+            data, mime = subset, "font/woff"
+        except Exception as e:
+            log.warning("⚠️  Could not subset %s: %s", path, e)
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}", mime
+
+
+def inline_assets(source: str, base_dir: str) -> str:
+    """
+    Replace <link rel="stylesheet"> tags and relative font URLs with their content.
+    Remote URLs and missing files are left untouched.
+
+    Raises:
+        NotAFontError: A referenced font file exists but is not a font
+    """
+    def stylesheet(match):
+        path = os.path.normpath(os.path.join(base_dir, match.group(1)))
+        if not os.path.isfile(path):
+            return match.group(0)
+        with open(path, "r", encoding="utf-8") as f:
+            return f"<style>\n{f.read()}\n</style>"
+
+    def font(match):
+        path = os.path.normpath(os.path.join(base_dir, match.group(2)))
+        if not os.path.isfile(path):
+            return match.group(0)
+        uri, mime = _font_data_uri(path, os.stat(path).st_mtime_ns)
+        return f"url('{uri}') format('{CSS_FONT_FORMATS.get(mime, 'truetype')}')"
+
+    return _FONT_URL.sub(font, _STYLESHEET.sub(stylesheet, source))
+
+
+@functools.lru_cache(maxsize=64)
+def _referenced_assets(path: str, mtime_ns: int, base_dir: str) -> Tuple[str, ...]:
+    """Stylesheets and fonts a template (or an inlined stylesheet) pulls in, resolved like inline_assets."""
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    found = []
+    for match in _STYLESHEET.finditer(source):
+        css = os.path.normpath(os.path.join(base_dir, match.group(1)))
+        if os.path.isfile(css):
+            found += [css, *_referenced_assets(css, os.stat(css).st_mtime_ns, base_dir)]
+    for match in _FONT_URL.finditer(source):
+        font = os.path.normpath(os.path.join(base_dir, match.group(2)))
+        if os.path.isfile(font):
+            found.append(font)
+    return tuple(dict.fromkeys(found))
+
+
+def template_assets(template_path: str) -> Tuple[str, ...]:
+    """Files inlined into template_path when it is loaded (its CSS and fonts, not the template itself)."""
+    path = os.path.abspath(template_path)
+    return _referenced_assets(path, os.stat(path).st_mtime_ns, os.path.dirname(path))
+
+
+def inlining_options() -> str:
+    """Settings that change the inlined bytes of the same files (font subsetting)."""
+    return f"subset={int(FONT_SUBSET and font_subset is not None)}"
+
+
+class InliningLoader(FileSystemLoader):
+    """FileSystemLoader that serves templates with their CSS and fonts inlined."""
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        return inline_assets(source, os.path.dirname(filename)), filename, uptodate
+
+
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+jinja_env = Environment(
+    loader=InliningLoader(TEMPLATES_DIR),
+    auto_reload=JINJA_AUTO_RELOAD,
+    bytecode_cache=FileSystemBytecodeCache(JINJA_CACHE_DIR)
+)
+
+
+def precompile_templates() -> int:
+    """Load (compile) every HTML template now instead of on the first render."""
+    names = jinja_env.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in names:
+        jinja_env.get_template(name)
+    log.info("🧩 Precompiled %d templates", len(names))
+    return len(names)
@@ -0,0 +1,50 @@
+"""
+Test setup: every store lives in a scratch directory and OpenAI is the local
+fake server (fake_openai.py). Both are set up here, before any app module is
+imported, because those modules read their paths and client settings at
+import time.
+
+    pip install pytest && python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.common import isolate_state  # noqa: E402
+from fake_openai import FakeOpenAIServer  # noqa: E402
+
+STATE_DIR = tempfile.mkdtemp(prefix="lesson-tests-")
+isolate_state(STATE_DIR)
+
+FAKE_OPENAI = FakeOpenAIServer().start()
+FAKE_OPENAI.configure(chunk_delay=0)
+os.environ.update({
+    "OPENAI_BASE_URL": FAKE_OPENAI.base_url,
+    "OPENAI_API_KEY": "fake",
+    "LOG_LEVEL": "WARNING",
+    "LLM_BACKOFF_BASE_SECONDS": "0.01",
+    "LLM_BACKOFF_MAX_SECONDS": "0.05",
+})
+os.chdir(REPO_ROOT)
+
+
+@pytest.fixture
+def fake_openai():
+    """The shared fake OpenAI server, reset to instant, error-free answers after each test."""
+    yield FAKE_OPENAI
+    FAKE_OPENAI.configure(latency=0, jitter=0, error_rate=0, error_status=503, malformed_rate=0, chunk_delay=0,
+                          batch_status="completed")
+
+
+@pytest.fixture
+def state_dir():
+    return STATE_DIR
+
+
+def pytest_sessionfinish(session, exitstatus):
+    FAKE_OPENAI.stop()
@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+
+from artifact_store import ArtifactStore
+from pdf_store import pdf_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path / "output_pdfs"), str(tmp_path / "artifacts.sqlite3"),
+                         ttl_seconds=60, max_bytes=0)
+
+
+def stored(n, size=1000):
+    key = f"{n:02x}" * 32
+    pdf_store.put(key, b"x" * size)
+    return key
+
+
+def idle(store, filename, seconds):
+    store._conn().execute("UPDATE artifacts SET accessed = ? WHERE name = ?", (time.time() - seconds, filename))
+
+
+def test_publish_then_open(store):
+    path = store.publish(stored(0xa0), "Leçon 1.pdf")
+    assert os.path.samefile(path, pdf_store.path_for("a0" * 32))
+    assert store.open("Leçon 1.pdf") == path
+    assert store.open("Leçon 2.pdf") is None
+    stats = store.get_stats()
+    assert (stats["published"], stats["hits"], stats["misses"], stats["files"]) == (1, 1, 1, 1)
+
+
+def test_idle_artifacts_expire_and_downloads_refresh_them(store):
+    store.publish(stored(0xa1), "old.pdf")
+    store.publish(stored(0xa2), "used.pdf")
+    idle(store, "old.pdf", 120)
+    idle(store, "used.pdf", 120)
+    store.open("used.pdf")
+
+    assert store.sweep() == {"expired": 1, "evicted": 0}
+    assert store.open("old.pdf") is None and store.open("used.pdf")
+    assert os.path.isfile(pdf_store.path_for("a1" * 32))  # still in the PDF store: republishing is free
+
+
+def test_quota_evicts_least_recently_downloaded(tmp_path):
+    store = ArtifactStore(str(tmp_path / "output_pdfs"), str(tmp_path / "artifacts.sqlite3"),
+                          ttl_seconds=3600, max_bytes=2500)
+    for n, name in enumerate(("a.pdf", "b.pdf", "c.pdf")):
+        store.publish(stored(0xb0 + n), name)
+        idle(store, name, 30 - n)
+    store.open("a.pdf")
+
+    assert store.sweep() == {"expired": 0, "evicted": 1}
+    assert [name for name in ("a.pdf", "b.pdf", "c.pdf") if store.open(name)] == ["a.pdf", "c.pdf"]
+
+
+def test_files_published_before_the_index_get_a_ttl(store):
+    os.makedirs(store.root, exist_ok=True)
+    path = store.path_for("legacy.pdf")
+    with open(path, "wb") as f:
+        f.write(b"%PDF")
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert store.sweep()["expired"] == 1
+    assert not os.path.exists(path)
+
+
+def test_hidden_temp_files_are_not_served(store):
+    os.makedirs(store.root, exist_ok=True)
+    with open(store.path_for(".abc.tmp"), "wb") as f:
+        f.write(b"%PDF")
+    assert store.open(".abc.tmp") is None
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import threading
+
+import asgi
+import pdf_generator
+from benchmarks.common import stub_chromium
+from lesson_registry import lesson_registry
+
+
+async def call(method, path, query=b"", headers=()):
+    """One request through asgi.app: (status, headers, body)."""
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "root_path": "",
+             "headers": list(headers), "http_version": "1.1", "scheme": "http",
+             "server": ("testserver", 80), "client": ("127.0.0.1", 1234)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.app(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return start["status"], dict(start["headers"]), body
+
+
+def lesson_id():
+    return next(lesson["id"] for lesson in lesson_registry.all() if lesson["content"].strip())
+
+
+def test_flask_routes_go_through_the_bridge():
+    status, headers, body = asyncio.run(call("GET", "/lessons", b"slim=1"))
+    assert status == 200 and headers[b"content-type"] == b"application/json"
+    assert len(json.loads(body)) == len(lesson_registry.all())
+
+
+def test_native_generation_keeps_blocking_steps_off_the_loop(fake_openai, monkeypatch):
+    stub_chromium(0)
+    on_loop = {}
+    for label, module, name in (("registry", lesson_registry, "get"), ("cache", pdf_generator.lesson_cache, "get"),
+                                ("template", pdf_generator, "render_lesson_html"),
+                                ("pdf_store", pdf_generator.pdf_store, "put"),
+                                ("publish", pdf_generator.artifact_store, "publish")):
+        def recorded(*args, _original=getattr(module, name), _label=label, **kwargs):
+            on_loop[_label] = threading.current_thread() is threading.main_thread()
+            return _original(*args, **kwargs)
+        monkeypatch.setattr(module, name, recorded)
+
+    monkeypatch.setattr(pdf_generator.pdf_store, "get_path", lambda key: None)  # render even if stored
+    pdf_generator.lesson_cache.clear()
+    status, headers, body = asyncio.run(call("POST", f"/generate_from_id/{lesson_id()}"))
+    assert status == 200, body
+    result = json.loads(body)
+    assert result["lesson_data"]["steps"] and result["pdf_path"]
+    assert on_loop == dict.fromkeys(("registry", "cache", "template", "pdf_store", "publish"), False)
+
+
+def test_only_plain_generations_are_native():
+    def native(method="POST", path="/generate_from_id/7", query=b"", headers=()):
+        return asgi._native_generate_id({"method": method, "path": path, "query_string": query,
+                                         "headers": list(headers)})
+
+    assert native() == 7
+    assert native(query=b"async=1") is None
+    assert native(query=b"format=pdf") is None
+    assert native(headers=[(b"prefer", b"respond-async")]) is None
+    assert native(method="GET") is None
+    assert native(path="/generate_from_id/7/stream") is None
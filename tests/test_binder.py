@@ -0,0 +1,85 @@
+import io
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+import binder
+from binder import BinderError, binder_filename, build_binder_pdf, combine_html, sort_lessons
+from cache import lesson_cache
+from lesson_registry import lesson_registry
+from pdf_store import pdf_store
+
+DOCUMENT = ("<html><head><style>body {{ color: red; }}</style></head>"
+            "<body class='journal'><h1>{title}</h1></body></html>")
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """HTML documents printed by the binder; each prints one blank page per journal."""
+    printed = []
+
+    def render_pdf_bytes(html_content):
+        printed.append(html_content)
+        writer = PdfWriter()
+        for _ in range(html_content.count('class="binder-page"')):
+            writer.add_blank_page(595, 842)
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue()
+    monkeypatch.setattr(binder, "render_pdf_bytes", render_pdf_bytes)
+    return printed
+
+
+def lessons_of(subject, week, count):
+    found = [l for l in lesson_registry.find(subject=subject, period="1", week=week) if l["content"].strip()]
+    return sort_lessons(found)[:count]
+
+
+def test_sort_lessons_in_teaching_order():
+    lessons = [{"subject": "français", "level": "5", "period": "1", "week": "10", "session": "1"},
+               {"subject": "français", "level": "5", "period": "1", "week": "9", "session": "2"},
+               {"subject": "français", "level": "5", "period": "1", "week": "9", "session": "1"}]
+    assert [(l["week"], l["session"]) for l in sort_lessons(lessons)] == [("9", "1"), ("9", "2"), ("10", "1")]
+
+
+def test_binder_filename():
+    assert binder_filename([{"title": "A"}]) == "A.pdf"
+    assert binder_filename([{"title": "A"}, {"title": "B"}, {"title": "C"}]) == "A - C.pdf"
+
+
+def test_combine_html_keeps_one_head_and_a_page_per_document():
+    html = combine_html([DOCUMENT.format(title="Un"), DOCUMENT.format(title="Deux")])
+    assert html.count("<style>body") == 1 and binder.PAGE_BREAK_CSS in html
+    assert html.count('<section class="binder-page">') == 2
+    assert html.index("<h1>Un</h1>") < html.index("<h1>Deux</h1>")
+
+
+def test_one_pass_per_template_and_a_merged_pdf(fake_openai, renders):
+    lessons = lessons_of("mathématiques", "2", 2) + lessons_of("français", "2", 1)
+    key = build_binder_pdf(lessons)
+    assert len(renders) == 2
+    assert [html.count('class="binder-page"') for html in renders] == [2, 1]
+    with open(pdf_store.path_for(key), "rb") as f:
+        assert len(PdfReader(f).pages) == 3
+
+    assert build_binder_pdf(lessons) == key
+    assert len(renders) == 2  # store hit
+
+
+def test_ai_failures_name_the_lessons(monkeypatch, renders):
+    lessons = lessons_of("français", "3", 2)
+    monkeypatch.setattr(binder, "process_with_ai", lambda title, *args: None)
+    with pytest.raises(BinderError, match=lessons[0]["title"]):
+        build_binder_pdf(lessons)
+    assert renders == []
+
+
+def test_binder_route_by_selector(fake_openai, renders):
+    lesson_cache.clear()
+    from app import app
+    client = app.test_client()
+    response = client.get("/binder?subject=mathématiques&period=1&week=5")
+    assert response.status_code == 200 and response.mimetype == "application/pdf"
+    assert len(PdfReader(io.BytesIO(response.data)).pages) == len(lessons_of("mathématiques", "5", 60))
+    assert client.get("/binder").status_code == 400
+    assert client.get("/binder?lesson_ids=999999").status_code == 404
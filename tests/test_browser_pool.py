@@ -0,0 +1,42 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+import browser_pool
+from browser_pool import BrowserPool, _BrowserSlot
+
+
+def test_timed_out_renders_are_cancelled_before_they_run():
+    pool = BrowserPool(size=1)
+    pool.start = lambda: None  # no slot threads: every render stays queued
+    with pytest.raises(FutureTimeoutError):
+        pool.run(lambda page: "pdf", timeout=0.01)
+    fn, future = pool._jobs.get_nowait()
+    assert future.cancelled()
+    assert not future.set_running_or_notify_cancel()  # what _serve checks before rendering
+    assert pool.stats["cancelled"] == 1
+
+
+def test_rss_is_sampled_not_measured_after_every_render(monkeypatch):
+    monkeypatch.setattr(browser_pool, "BROWSER_RSS_CHECK_EVERY", 5)
+    pool = BrowserPool(size=1, max_renders=1000, max_rss_mb=400)
+    slot = _BrowserSlot(pool, 0)
+    measured = []
+    slot._measure_rss_mb = lambda: measured.append(slot.renders) or 100.0
+    for _ in range(12):
+        slot.renders += 1
+        slot._maybe_recycle()
+    assert measured == [5, 10]
+
+
+def test_oversized_browser_is_recycled_at_the_next_sample(monkeypatch):
+    monkeypatch.setattr(browser_pool, "BROWSER_RSS_CHECK_EVERY", 2)
+    pool = BrowserPool(size=1, max_renders=1000, max_rss_mb=400)
+    slot = _BrowserSlot(pool, 0)
+    slot._measure_rss_mb = lambda: 500.0
+    closed = []
+    slot._close_browser = lambda: closed.append(slot.renders)
+    for _ in range(3):
+        slot.renders += 1
+        slot._maybe_recycle()
+    assert closed == [2] and pool.stats["recycles"] == 1
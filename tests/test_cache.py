@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from cache import LessonCache, MemoryTier
+
+CONTENT = "Le nombre décimal\nCalcule 3,5 + 2,25"
+LESSON = {"title": "Le nombre décimal", "steps": [{"name": "Calcul"}]}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    tier = MemoryTier(max_bytes=10)
+    tier.set("a", "aaaa", 0)
+    tier.set("b", "bbbb", 0)
+    tier.get("a")
+    tier.set("c", "cccc", 0)
+    assert tier.get("b") is None and tier.get("a") and tier.get("c")
+    assert tier.bytes == 8 and tier.evictions == 1
+    tier.set("huge", "x" * 11, 0)
+    assert tier.get("huge") is None
+
+
+def test_workers_share_the_disk_tier(db_path):
+    first, second = LessonCache(db_path=db_path), LessonCache(db_path=db_path)
+    first.set(CONTENT, "fr", "math", "1", LESSON)
+    assert second.get(CONTENT, "fr", "math", "1") == LESSON
+    assert second.get(CONTENT, "fr", "math", "1") == LESSON
+    assert second.stats["disk_hits"] == 1 and second.stats["memory_hits"] == 1
+    assert second.get(CONTENT, "fr", "math", "2") is None
+
+
+def test_expired_entries_are_only_served_as_stale(db_path):
+    cache = LessonCache(ttl_seconds=1, db_path=db_path)
+    cache.set(CONTENT, "fr", "math", "1", LESSON)
+    key = cache.make_key(CONTENT, "fr", "math", "1")
+    cache.disk.set(key, cache.disk.get(key)[0], time.time() - 10)
+    cache.memory.clear()
+    assert cache.get(CONTENT, "fr", "math", "1") is None
+    assert cache.get_stale(CONTENT, "fr", "math", "1") == LESSON
+
+
+def test_cleanup_keeps_stale_entries_for_the_grace_window(db_path):
+    cache = LessonCache(ttl_seconds=1, db_path=db_path, stale_grace_seconds=60)
+    cache.set(CONTENT, "fr", "math", "1", LESSON)
+    cache.set(CONTENT, "fr", "math", "2", LESSON)
+    old = cache.make_key(CONTENT, "fr", "math", "2")
+    cache.disk.set(old, cache.disk.get(old)[0], time.time() - 120)
+    assert cache.cleanup_expired() == 1
+    assert cache.get_stale(CONTENT, "fr", "math", "1") == LESSON
+    assert cache.disk.get(old) is None
+
+
+def test_clear_reaches_every_workers_memory_tier(db_path):
+    first, second = LessonCache(db_path=db_path), LessonCache(db_path=db_path)
+    first.set(CONTENT, "fr", "math", "1", LESSON)
+    assert second.get(CONTENT, "fr", "math", "1") == LESSON
+    assert len(second.memory) == 1
+    first.clear()
+    assert second.get(CONTENT, "fr", "math", "1") is None
+    assert len(second.memory) == 0
+    second.set(CONTENT, "fr", "math", "1", LESSON)
+    assert second.get(CONTENT, "fr", "math", "1") == LESSON
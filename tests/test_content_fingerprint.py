@@ -0,0 +1,53 @@
+from content_fingerprint import content_digest, lsh_buckets, minhash_signature, normalize_content, similarity
+
+DECK = """Diapositive 1
+Le nombre décimal
+Il convient de lancer le mode diaporama pour la diffusion de la leçon en classe
+- Calcule : 3,5 + 2,25 = ?
+Compare 4,7 et 4,07 : lequel est le plus grand ?
+Range les nombres 0,5 ; 0,05 ; 5 dans l'ordre croissant.
+Pictogrammes
+2 / 12
+Le nombre décimal
+Activité : mesurer la longueur de la table avec une règle graduée en centimètres.
+Trace écrite : un nombre décimal a une partie entière et une partie décimale."""
+
+
+def test_case_whitespace_and_punctuation_are_folded():
+    assert normalize_content("  Le  Nombre, décimal !\n") == normalize_content("le nombre décimal")
+
+
+def test_math_operators_are_kept():
+    assert content_digest("3 + 2 = 5") != content_digest("3 - 2 = 5")
+    assert content_digest("4 × 2") != content_digest("4 ÷ 2")
+    assert normalize_content("3−2") == normalize_content("3 - 2")
+
+
+def test_slide_labels_boilerplate_and_repeats_are_dropped():
+    lines = normalize_content(DECK).split("\n")
+    assert "diapositive 1" not in lines and "2 12" not in lines
+    assert not any("diaporama" in line or line == "pictogrammes" for line in lines)
+    assert lines.count("le nombre décimal") == 1
+    assert "calcule 3 5 + 2 25 = ?" not in lines and "calcule 3 5 + 2 25 =" in lines
+
+
+def test_digest_ignores_reexport_noise():
+    reexport = DECK.replace("Diapositive 1", "Slide 1").replace("2 / 12", "Page 2") + "\n\n• Pictogrammes"
+    assert content_digest(reexport) == content_digest(DECK)
+
+
+def test_near_duplicates_are_similar_and_different_decks_are_not():
+    edited = DECK.replace("longueur de la table", "longueur du cahier")
+    other = "Les fractions\nPartage une pizza en 4 parts égales.\nColorie 3/4 de la figure.\nLis la fraction 2/5."
+    signature = minhash_signature(normalize_content(DECK))
+    assert similarity(signature, minhash_signature(normalize_content(edited))) > 0.7
+    assert similarity(signature, minhash_signature(normalize_content(other))) < 0.2
+    assert similarity(signature, signature) == 1.0
+
+
+def test_lsh_buckets_collide_for_near_duplicates_within_a_scope_only():
+    edited = DECK.replace("dans l'ordre croissant", "dans l'ordre décroissant")
+    signature = minhash_signature(normalize_content(DECK))
+    edited_signature = minhash_signature(normalize_content(edited))
+    assert set(lsh_buckets(signature, "fr|math|1")) & set(lsh_buckets(edited_signature, "fr|math|1"))
+    assert not set(lsh_buckets(signature, "fr|math|1")) & set(lsh_buckets(signature, "fr|math|2"))
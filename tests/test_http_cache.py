@@ -0,0 +1,38 @@
+import gzip
+import json
+
+import pytest
+
+from benchmarks.common import stub_chromium
+
+
+@pytest.fixture(scope="module")
+def client():
+    stub_chromium(0)
+    from app import app
+    return app.test_client()
+
+
+def test_lessons_list_is_served_with_validators(client):
+    response = client.get("/lessons?slim=1")
+    assert response.status_code == 200
+    assert json.loads(response.data)[0]["id"]
+    assert client.get("/lessons?slim=1", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_compressed_body_decodes_to_the_same_json(client):
+    plain = client.get("/lessons?slim=1")
+    compressed = client.get("/lessons?slim=1", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+
+
+def test_unknown_parameters_reuse_the_built_body(client):
+    from http_cache import http_cache
+    client.get("/lessons?slim=1&page=1&per_page=5")
+    builds = http_cache.stats["builds"]
+    response = client.get("/lessons?per_page=5&_=123&page=1&slim=true")
+    assert http_cache.stats["builds"] == builds
+    assert len(json.loads(response.data)) == 5
+    assert int(response.headers["X-Total-Count"]) >= 5
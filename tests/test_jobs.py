@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+import pytest
+
+import jobs
+from benchmarks.common import stub_chromium
+from jobs import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), max_workers=2)
+
+
+def test_submit_runs_the_job(queue):
+    queue.register("echo", lambda params: {"echo": params["text"]})
+    job = queue.submit("echo", {"text": "bonjour"}, "k1")
+    assert job["status"] in ("queued", "running")
+    done = queue.wait(job["job_id"], timeout=5, poll_interval=0.01)
+    assert done["status"] == "done" and done["result"] == {"echo": "bonjour"}
+    assert done["attempts"] == 1
+
+
+def test_identical_jobs_share_one_execution(queue):
+    release = threading.Event()
+    calls = []
+    queue.register("slow", lambda params: calls.append(1) or release.wait(5))
+    first = queue.submit("slow", {}, "same")
+    second = queue.submit("slow", {}, "same")
+    assert second["job_id"] == first["job_id"]
+    release.set()
+    assert queue.wait(first["job_id"], timeout=5, poll_interval=0.01)["status"] == "done"
+    assert calls == [1] and queue.stats["deduplicated"] == 1
+
+
+def test_handler_errors_fail_the_job(queue):
+    queue.register("boom", lambda params: 1 / 0)
+    job = queue.wait(queue.submit("boom", {}, "k")["job_id"], timeout=5, poll_interval=0.01)
+    assert job["status"] == "failed" and "division" in job["error"]
+
+
+def test_queued_jobs_outlive_the_worker_that_accepted_them(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    accepting = JobQueue(db_path)
+    accepting.register("echo", lambda params: params)
+    accepting.start = lambda: None  # a worker that is recycled before its threads pick the job up
+    job_id = accepting.submit("echo", {"n": 1}, "k")["job_id"]
+
+    other = JobQueue(db_path)
+    other.register("echo", lambda params: params)
+    other.start()
+    assert other.wait(job_id, timeout=5, poll_interval=0.01)["result"] == {"n": 1}
+
+
+def test_jobs_of_dead_workers_are_run_again_once_their_lease_expires(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(db_path)
+    queue.register("echo", lambda params: params)
+    conn = queue._conn()
+    now = time.time()
+    conn.execute(
+        "INSERT INTO jobs (id, kind, dedupe_key, params, status, owner_pid, created, updated, lease_until, attempts) "
+        "VALUES ('orphan', 'echo', 'k', '{\"n\": 2}', 'running', 999999, ?, ?, ?, 1)", (now, now, now - 1)
+    )
+    conn.execute(
+        "INSERT INTO jobs (id, kind, dedupe_key, params, status, owner_pid, created, updated, lease_until, attempts) "
+        "VALUES ('leased', 'echo', 'k2', '{}', 'running', 999999, ?, ?, ?, 1)", (now, now, now + 60)
+    )
+    queue.start()
+    job = queue.wait("orphan", timeout=5, poll_interval=0.01)
+    assert job["status"] == "done" and job["attempts"] == 2
+    assert queue.stats["requeued"] == 1
+    assert queue.get("leased")["status"] == "running"
+
+
+def test_jobs_that_keep_losing_their_worker_are_failed(queue):
+    queue.register("echo", lambda params: params)
+    now = time.time()
+    queue._conn().execute(
+        "INSERT INTO jobs (id, kind, dedupe_key, params, status, owner_pid, created, updated, lease_until, attempts) "
+        "VALUES ('crashy', 'echo', 'k', '{}', 'running', 999999, ?, ?, ?, ?)", (now, now, now - 1, jobs.JOB_MAX_ATTEMPTS)
+    )
+    queue.start()
+    job = queue.wait("crashy", timeout=5, poll_interval=0.01)
+    assert job["status"] == "failed" and "attempts" in job["error"]
+
+
+def test_async_generation_against_the_fake_server(fake_openai):
+    stub_chromium(0)
+    from app import app
+    client = app.test_client()
+    lesson_id = json.loads(client.get("/lessons?slim=1").data)[-1]["id"]
+    client.post("/cache/clear")
+    fake_openai.configure(latency=0.3)
+    first = client.post(f"/generate_from_id/{lesson_id}?async=1")
+    second = client.post(f"/generate_from_id/{lesson_id}", headers={"Prefer": "respond-async"})
+    assert first.status_code == second.status_code == 202
+    job_id = json.loads(first.data)["job_id"]
+    assert json.loads(second.data)["job_id"] == job_id
+    job = json.loads(client.get(f"/jobs/{job_id}?wait=10").data)
+    assert job["status"] == "done"
+    assert job["result"]["lesson_data"]["steps"] and job["result"]["pdf_path"]
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from lesson_registry import LessonRegistry
+
+
+def lesson(lesson_id, week, session, subject="mathématiques"):
+    return {"id": lesson_id, "title": f"Leçon {lesson_id}", "subject": subject, "level": "5", "period": "1",
+            "week": str(week), "session": str(session), "filename": f"lesson_{lesson_id}.pptx",
+            "content": f"slides {lesson_id}"}
+
+
+def write(path, lessons, mtime_ns=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(lessons, f, ensure_ascii=False)
+    if mtime_ns:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def registry_path(tmp_path):
+    path = str(tmp_path / "lessons.json")
+    write(path, [lesson(1, 1, 1), lesson(2, 1, 2), lesson(3, 2, 1, subject="français")], mtime_ns=10**18)
+    return path
+
+
+def test_lookups(registry_path):
+    registry = LessonRegistry(registry_path)
+    assert registry.get(2)["title"] == "Leçon 2"
+    assert registry.get(99) is None
+    assert registry.get_by_filename("lesson_3.pptx")["id"] == 3
+    assert "content" not in registry.all(slim=True)[0] and registry.all()[0]["content"] == "slides 1"
+    assert registry.loads == 1
+
+
+def test_find_by_full_slot_and_by_partial_filters(registry_path):
+    registry = LessonRegistry(registry_path)
+    assert [l["id"] for l in registry.find(subject="mathématiques", level=5, period=1, week=1, session=2)] == [2]
+    assert [l["id"] for l in registry.find(week="1")] == [1, 2]
+    assert [l["id"] for l in registry.find(subject="français", week=None)] == [3]
+    assert "content" not in registry.find(slim=True, week="2")[0]
+
+
+def test_reloads_only_when_the_file_changes(registry_path):
+    registry = LessonRegistry(registry_path)
+    version = registry.version
+    registry.get(1)
+    assert registry.loads == 1
+
+    write(registry_path, [lesson(1, 1, 1), lesson(4, 3, 1)], mtime_ns=10**18 + 1)
+    assert registry.get(4)["title"] == "Leçon 4"
+    assert registry.get(2) is None
+    assert registry.loads == 2 and registry.version != version
+
+
+def test_invalid_json_keeps_the_previous_lessons(registry_path):
+    registry = LessonRegistry(registry_path)
+    registry.get(1)
+    with open(registry_path, "w") as f:
+        f.write('[{"id": 1, ')
+    assert registry.get(1)["title"] == "Leçon 1"
+
+
+def test_missing_file_is_an_empty_registry(tmp_path):
+    registry = LessonRegistry(str(tmp_path / "missing.json"))
+    assert registry.all() == [] and registry.version == "empty"
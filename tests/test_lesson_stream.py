@@ -0,0 +1,107 @@
+import json
+import random
+
+import pytest
+
+from lesson_stream import MalformedOutputError, StepStreamParser, parse_lesson_json
+
+STEPS = [
+    {"name": "Oral – Dialogue", "duration": "10min", "icon": "🗣️", "content": "Les élèves {jouent} le dialogue."},
+    {"name": "Lecture", "duration": "15min", "icon": "📖", "content": 'Lire "à voix haute" : }]{[ \\ fin'},
+    {"name": "النمذجة", "duration": "10min", "icon": "📝", "content": "ينتبهون للشرح\nثم يجيبون"},
+]
+COMPLETION = json.dumps({"lesson_data": {
+    "subject": "français", "level": "5", "period": "1", "week": "2", "session": "4",
+    "objective": "Lire {un texte}", "meta": {"steps": [{"not": "a step"}]},
+    "steps": STEPS
+}}, ensure_ascii=False)
+
+
+def feed_in_chunks(parser, text, sizes):
+    pos = 0
+    for size in sizes:
+        parser.feed(text[pos:pos + size])
+        pos += size
+    parser.feed(text[pos:])
+
+
+def test_whole_completion_emits_every_step():
+    parser = StepStreamParser()
+    parser.feed(COMPLETION)
+    assert parser.steps == STEPS
+
+
+def test_one_character_at_a_time():
+    emitted = []
+    parser = StepStreamParser(on_step=lambda index, step: emitted.append((index, step["name"])))
+    for ch in COMPLETION:
+        parser.feed(ch)
+    assert emitted == [(i, step["name"]) for i, step in enumerate(STEPS)]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chunk_boundaries(seed):
+    rng = random.Random(seed)
+    parser = StepStreamParser()
+    feed_in_chunks(parser, COMPLETION, [rng.randint(1, 40) for _ in range(len(COMPLETION))])
+    assert parser.steps == STEPS
+
+
+def test_step_is_emitted_as_soon_as_it_closes():
+    emitted = []
+    parser = StepStreamParser(on_step=lambda index, step: emitted.append(index))
+    first = json.dumps(STEPS[0], ensure_ascii=False)
+    first_end = COMPLETION.index(first) + len(first)
+    parser.feed(COMPLETION[:first_end])
+    assert emitted == [0]
+
+
+def test_nested_steps_key_outside_lesson_data_is_ignored():
+    parser = StepStreamParser()
+    parser.feed(COMPLETION)
+    assert {"not": "a step"} not in parser.steps
+
+
+def test_code_fence_preamble_is_skipped():
+    parser = StepStreamParser()
+    parser.feed("```json\n" + COMPLETION + "\n```")
+    assert len(parser.steps) == len(STEPS)
+
+
+def test_text_without_json_is_rejected():
+    parser = StepStreamParser()
+    with pytest.raises(MalformedOutputError):
+        parser.feed("Je ne peux pas répondre. " * 20)
+
+
+def test_step_missing_a_field_is_rejected_at_that_step():
+    broken = COMPLETION.replace('"icon": "📖", ', "")
+    emitted = []
+    parser = StepStreamParser(on_step=lambda index, step: emitted.append(index))
+    with pytest.raises(MalformedOutputError, match="Step 1"):
+        parser.feed(broken)
+    assert emitted == [0]
+
+
+def test_more_steps_than_expected_is_rejected():
+    parser = StepStreamParser(max_steps=2)
+    with pytest.raises(MalformedOutputError, match="More than 2 steps"):
+        parser.feed(COMPLETION)
+
+
+def test_unbalanced_json_is_rejected():
+    parser = StepStreamParser()
+    with pytest.raises(MalformedOutputError):
+        parser.feed('{"lesson_data": {}}}')
+
+
+def test_parse_lesson_json_matches_the_stream():
+    lesson_data = parse_lesson_json("```json\n" + COMPLETION + "\n```")
+    assert lesson_data["steps"] == STEPS
+    assert lesson_data["objective"] == "Lire {un texte}"
+
+
+@pytest.mark.parametrize("raw", ["", "pas de json", '{"lesson_data": {"steps": []}}', '{"other": 1}', '{"lesson_data":'])
+def test_parse_lesson_json_rejects_bad_completions(raw):
+    with pytest.raises(MalformedOutputError):
+        parse_lesson_json(raw)
@@ -0,0 +1,236 @@
+import asyncio
+import fcntl
+import os
+import time
+
+import openai
+import pytest
+
+from llm_client import (AsyncResilientLLM, CircuitBreaker, CircuitOpenError, CombinedBuckets, RateLimitTimeout,
+                        ResilientLLM, SharedTokenBucket)
+
+MESSAGES = [{"role": "user", "content": "Bonjour"}]
+
+
+@pytest.fixture
+def bucket_path(tmp_path):
+    return str(tmp_path / "llm-rate.json")
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == "half_open" and breaker.trial_in_flight
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_trial_success_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_trial_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_bucket_serves_the_burst_then_asks_to_wait(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate_per_minute=60, burst=3)
+    assert [bucket._take() for _ in range(3)] == [0, 0, 0]
+    assert bucket._take() == pytest.approx(1.0, abs=0.05)
+
+
+def test_bucket_refills_over_time(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate_per_minute=6000, burst=1)
+    assert bucket._take() == 0
+    assert bucket.acquire(timeout=1) < 0.1
+
+
+def test_bucket_timeout_raises(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate_per_minute=1, burst=1)
+    bucket.acquire(timeout=1)
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(timeout=1)
+
+
+def test_buckets_on_the_same_path_share_one_budget(bucket_path):
+    first = SharedTokenBucket(bucket_path, rate_per_minute=60, burst=2)
+    second = SharedTokenBucket(bucket_path, rate_per_minute=60, burst=2)
+    assert first._take() == 0
+    assert second._take() == 0
+    assert first._take() > 0
+    assert second._take() > 0
+
+
+def test_zero_rate_disables_the_bucket(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate_per_minute=0, burst=1)
+    assert bucket.acquire(timeout=0) == 0
+    assert not os.path.exists(bucket_path)
+
+
+def make_llm(fake_openai, bucket_path, **kwargs):
+    client = openai.OpenAI(base_url=fake_openai.base_url, api_key="fake")
+    bucket = SharedTokenBucket(bucket_path, rate_per_minute=60000, burst=100)
+    return ResilientLLM(client, timeout=5, bucket=bucket, **kwargs)
+
+
+def test_chat_returns_the_completion(fake_openai, bucket_path):
+    llm = make_llm(fake_openai, bucket_path)
+    response = llm.chat(model="gpt-4o-mini", messages=MESSAGES)
+    assert response.choices[0].message.content
+    assert llm.stats["attempts"] == 1 and llm.stats["retries"] == 0
+
+
+def test_chat_retries_server_errors_then_raises(fake_openai, bucket_path):
+    fake_openai.configure(error_rate=1, error_status=503)
+    before = fake_openai.requests
+    llm = make_llm(fake_openai, bucket_path, max_retries=2)
+    with pytest.raises(openai.InternalServerError):
+        llm.chat(model="gpt-4o-mini", messages=MESSAGES)
+    assert fake_openai.requests - before == 3
+    assert llm.stats["retries"] == 2 and llm.stats["failures"] == 1
+
+
+def test_every_attempt_takes_a_token(fake_openai, bucket_path):
+    fake_openai.configure(error_rate=1, error_status=503)
+    llm = make_llm(fake_openai, bucket_path, max_retries=2)
+    llm.bucket = SharedTokenBucket(bucket_path, rate_per_minute=60, burst=3)
+    with pytest.raises(openai.InternalServerError):
+        llm.chat(model="gpt-4o-mini", messages=MESSAGES)
+    assert llm.bucket._take() > 0
+
+
+def test_client_errors_are_not_retried(fake_openai, bucket_path):
+    fake_openai.configure(error_rate=1, error_status=400)
+    llm = make_llm(fake_openai, bucket_path, max_retries=2)
+    with pytest.raises(openai.BadRequestError):
+        llm.chat(model="gpt-4o-mini", messages=MESSAGES)
+    assert llm.stats["attempts"] == 1
+    assert llm.breaker.failures == 0
+
+
+def test_failures_open_the_breaker(fake_openai, bucket_path):
+    fake_openai.configure(error_rate=1, error_status=503)
+    llm = make_llm(fake_openai, bucket_path, max_retries=0, breaker=CircuitBreaker(failure_threshold=2))
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            llm.chat(model="gpt-4o-mini", messages=MESSAGES)
+    before = fake_openai.requests
+    with pytest.raises(CircuitOpenError):
+        llm.chat(model="gpt-4o-mini", messages=MESSAGES)
+    assert fake_openai.requests == before
+    assert llm.stats["fast_failures"] == 1
+
+
+def test_bad_output_is_retried_without_backoff(fake_openai, bucket_path):
+    calls = []
+
+    def consume(response):
+        calls.append(response)
+        if len(calls) == 1:
+            raise ValueError("unusable")
+        return response.choices[0].message.content
+
+    llm = make_llm(fake_openai, bucket_path)
+    assert llm.chat(consume=consume, retry_on=(ValueError,), model="gpt-4o-mini", messages=MESSAGES)
+    assert llm.stats["output_retries"] == 1 and llm.stats["retries"] == 0
+
+
+def test_streaming_chat_hands_the_stream_to_consume(fake_openai, bucket_path):
+    def consume(stream):
+        return "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+
+    llm = make_llm(fake_openai, bucket_path)
+    assert llm.chat(consume=consume, stream=True, model="gpt-4o-mini", messages=MESSAGES)
+
+
+def test_async_chat_retries_and_shares_the_breaker(fake_openai, bucket_path):
+    sync_llm = make_llm(fake_openai, bucket_path, max_retries=1)
+    client = openai.AsyncOpenAI(base_url=fake_openai.base_url, api_key="fake")
+    llm = AsyncResilientLLM(client, timeout=5, max_retries=1, bucket=sync_llm.bucket, breaker=sync_llm.breaker)
+
+    async def run():
+        response = await llm.chat(model="gpt-4o-mini", messages=MESSAGES)
+        fake_openai.configure(error_rate=1, error_status=503)
+        with pytest.raises(openai.InternalServerError):
+            await llm.chat(model="gpt-4o-mini", messages=MESSAGES)
+        return response
+
+    assert asyncio.run(run()).choices[0].message.content
+    assert llm.stats["retries"] == 1
+    assert sync_llm.breaker.failures == 1
+
+
+def test_async_acquire_does_not_block_the_loop_on_a_held_lock(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate_per_minute=60, burst=5)
+    bucket._take()
+
+    async def run():
+        with open(bucket_path, "a+") as held:
+            fcntl.flock(held, fcntl.LOCK_EX)
+            acquire = asyncio.create_task(bucket.acquire_async(timeout=5))
+            ticks = 0
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            fcntl.flock(held, fcntl.LOCK_UN)
+        await acquire
+        return ticks
+
+    assert asyncio.run(run()) == 5
+
+
+def test_combined_buckets_take_a_token_from_each(tmp_path):
+    shared = SharedTokenBucket(str(tmp_path / "shared.json"), rate_per_minute=0.1, burst=5)
+    own = SharedTokenBucket(str(tmp_path / "own.json"), rate_per_minute=1, burst=1)
+    buckets = CombinedBuckets([shared, own])
+    buckets.acquire(timeout=1)
+    with pytest.raises(RateLimitTimeout):
+        buckets.acquire(timeout=1)
+    # Both attempts were charged to the shared budget
+    assert [shared._take() == 0 for _ in range(4)] == [True, True, True, False]
+
+
+def test_slow_streams_hit_the_total_deadline(fake_openai, bucket_path):
+    fake_openai.configure(chunk_delay=0.05)
+    llm = make_llm(fake_openai, bucket_path, max_retries=1, stream_deadline=0.2)
+    start = time.monotonic()
+    with pytest.raises(openai.APITimeoutError):
+        llm.chat(stream=True, model="gpt-4o-mini", messages=MESSAGES)
+    assert time.monotonic() - start < 2
+    assert llm.stats["attempts"] == 2 and llm.breaker.failures == 1
@@ -0,0 +1,48 @@
+import pytest
+
+import openai_batch
+from cache import lesson_cache
+from pdf_generator import load_lessons_data, select_lessons
+
+
+@pytest.fixture
+def lessons(tmp_path, monkeypatch):
+    monkeypatch.setattr(openai_batch, "BATCH_STATE_PATH", str(tmp_path / "openai_batch.json"))
+    monkeypatch.setattr(openai_batch, "BATCH_DIR", str(tmp_path / "batches"))
+    lesson_cache.clear()
+    selected = select_lessons(load_lessons_data(), subject="arabe", period="1", weeks="2")
+    assert selected
+    return selected
+
+
+def run(lessons, **kwargs):
+    return openai_batch.run_openai_batch(lessons, render=False, poll_seconds=0.01, **kwargs)
+
+
+def test_batch_results_are_loaded_into_the_cache(lessons, fake_openai):
+    keys = openai_batch.group_by_key(lessons)
+    result = run(lessons)
+    assert result["status"] == "completed" and result["loaded"] == len(keys) and result["failed"] == 0
+    assert all(openai_batch._cached(lesson) for lesson in lessons)
+    assert run(lessons) == {"submitted": 0, "rendered": 0}
+
+
+def test_no_wait_submits_and_the_next_run_collects(lessons, fake_openai):
+    submitted = run(lessons, wait=False)
+    assert submitted["submitted"] == len(openai_batch.group_by_key(lessons))
+    collected = run([])
+    assert collected["batch_id"] == submitted["batch_id"] and collected["loaded"] == submitted["submitted"]
+    assert openai_batch.load_state()["collected"]
+
+
+def test_failed_batch_is_submitted_again(lessons, fake_openai):
+    fake_openai.configure(batch_status="expired")
+    failed = run(lessons)
+    assert failed["status"] == "expired" and "loaded" not in failed
+    state = openai_batch.load_state()
+    assert not state["collected"] and state["status"] == "expired"
+    assert not any(openai_batch._cached(lesson) for lesson in lessons)
+
+    fake_openai.configure(batch_status="completed")
+    retried = run(lessons)
+    assert retried["batch_id"] != failed["batch_id"] and retried["loaded"] == len(openai_batch.group_by_key(lessons))
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+import pdf_generator
+from benchmarks.common import stub_chromium
+from cache import lesson_cache
+from llm_client import CombinedBuckets
+from pdf_generator import load_batch_manifest, load_lessons_data, parse_range, run_batch, select_lessons
+
+
+@pytest.fixture
+def lessons():
+    lesson_cache.clear()
+    stub_chromium(0)
+    selected = select_lessons(load_lessons_data(), subject="math", period="1", weeks="5")
+    assert len(selected) > 1
+    return selected
+
+
+def test_parse_range():
+    assert parse_range("1-3") == {"1", "2", "3"}
+    assert parse_range("04") == {"4"}
+    assert parse_range(None) is None
+
+
+def test_select_lessons_filters_and_skips_empty_decks():
+    lessons = [
+        {"title": "a", "subject": "mathématiques", "level": "5", "period": "1", "week": "2", "content": "x"},
+        {"title": "b", "subject": "mathématiques", "level": "5", "period": "1", "week": "5", "content": "x"},
+        {"title": "c", "subject": "français", "level": "5", "period": "1", "week": "2", "content": "x"},
+        {"title": "d", "subject": "mathématiques", "level": "5", "period": "1", "week": "3", "content": " "},
+    ]
+    assert [l["title"] for l in select_lessons(lessons, subject="MATH", weeks="1-4")] == ["a"]
+    assert [l["title"] for l in select_lessons(lessons, level=5, period="1")] == ["a", "b", "c"]
+
+
+def test_batch_run_resumes_from_its_manifest(lessons, fake_openai, tmp_path):
+    manifest = str(tmp_path / "batch_manifest.jsonl")
+    first = run_batch(lessons, concurrency=3, manifest_path=manifest)
+    assert first == {"done": len(lessons), "skipped": 0, "failed": 0}
+    records = load_batch_manifest(manifest)
+    assert set(records) == {l["id"] for l in lessons}
+    assert all(os.path.isfile(r["pdf_path"]) for r in records.values())
+
+    requests = fake_openai.requests
+    assert run_batch(lessons, manifest_path=manifest) == {"done": 0, "skipped": len(lessons), "failed": 0}
+    assert fake_openai.requests == requests
+
+
+def test_failed_lessons_are_retried_by_the_next_run(lessons, fake_openai, tmp_path, monkeypatch):
+    manifest = str(tmp_path / "batch_manifest.jsonl")
+    process_with_ai = pdf_generator.process_with_ai
+    flaky_id = lessons[0]["id"]
+    monkeypatch.setattr(pdf_generator, "process_with_ai",
+                        lambda title, *args: None if title == lessons[0]["title"] else process_with_ai(title, *args))
+    assert run_batch(lessons, manifest_path=manifest, render=False)["failed"] == 1
+    assert load_batch_manifest(manifest)[flaky_id]["status"] == "failed"
+
+    monkeypatch.setattr(pdf_generator, "process_with_ai", process_with_ai)
+    assert run_batch(lessons, manifest_path=manifest, render=False) == \
+        {"done": 1, "skipped": len(lessons) - 1, "failed": 0}
+    with open(manifest, encoding="utf-8") as f:
+        assert [json.loads(line)["status"] for line in f][-1] == "done"
+
+
+def test_rate_adds_a_batch_bucket_on_top_of_the_shared_one(lessons, fake_openai, tmp_path, monkeypatch):
+    shared = pdf_generator.llm.bucket
+    monkeypatch.setattr(pdf_generator.llm, "bucket", shared)
+    run_batch(lessons[:1], rate_per_minute=600, manifest_path=str(tmp_path / "m.jsonl"), render=False)
+    assert isinstance(pdf_generator.llm.bucket, CombinedBuckets)
+    assert pdf_generator.llm.bucket.buckets[0] is shared
@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+
+import pdf_store as pdf_store_module
+from pdf_store import PDFStore
+
+LESSON = {"subject": "français", "session": "1", "steps": [{"name": "Lecture", "content": "Lire"}]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PDFStore(str(tmp_path / "store"), max_bytes=0)
+
+
+@pytest.fixture
+def template(tmp_path):
+    (tmp_path / "style.css").write_text("body { color: red; }")
+    path = tmp_path / "journal.html"
+    path.write_text('<link rel="stylesheet" href="style.css"><p>{{ lesson_data.subject }}</p>')
+    return str(path)
+
+
+def test_put_then_get(store):
+    assert store.get_path("ab" * 32) is None
+    path = store.put("ab" * 32, b"%PDF-1.4 bytes")
+    assert store.get_path("ab" * 32) == path
+    with open(path, "rb") as f:
+        assert f.read() == b"%PDF-1.4 bytes"
+    assert store.get_stats()["hits"] == 1 and store.get_stats()["misses"] == 1
+
+
+def test_key_follows_lesson_template_and_assets(store, template, tmp_path):
+    teacher_info = str(tmp_path / "teacherInfo.json")
+    key = store.make_key(LESSON, template, teacher_info)
+    assert store.make_key(dict(LESSON), template, teacher_info) == key
+    assert store.make_key(dict(LESSON, session="2"), template, teacher_info) != key
+
+    time.sleep(0.01)
+    (tmp_path / "style.css").write_text("body { color: blue; }")
+    assert store.make_key(LESSON, template, teacher_info) != key
+
+    key = store.make_key(LESSON, template, teacher_info)
+    (tmp_path / "teacherInfo.json").write_text('{"name": "Mme Ben"}')
+    assert store.make_key(LESSON, template, teacher_info) != key
+
+
+def test_sweep_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_store_module, "PDF_STORE_MIN_AGE_SECONDS", 0)
+    store = PDFStore(str(tmp_path / "store"), max_bytes=2500)
+    keys = [f"{n:02d}" * 32 for n in range(3)]
+    now = time.time()
+    for age, key in zip((300, 200, 100), keys):
+        path = store.put(key, b"x" * 1000)
+        os.utime(path, (now - age, now - age))
+    store.get_path(keys[0])  # used again: now the newest
+
+    assert store.sweep() == 1
+    assert store.get_path(keys[1]) is None
+    assert store.get_path(keys[0]) and store.get_path(keys[2])
+    assert store.get_stats()["evicted"] == 1
+
+
+def test_recent_files_are_not_evicted(tmp_path):
+    store = PDFStore(str(tmp_path / "store"), max_bytes=1500)
+    for n in range(3):
+        store.put(f"{n:02d}" * 32, b"x" * 1000)
+    assert store.sweep() == 0
+
+
+def test_publish_links_the_stored_file(store, tmp_path):
+    store.put("cd" * 32, b"%PDF")
+    dest = store.publish("cd" * 32, str(tmp_path / "public" / "Lesson.pdf"))
+    assert os.path.samefile(dest, store.path_for("cd" * 32))
+    assert store.publish("cd" * 32, dest) == dest
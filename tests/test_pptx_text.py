@@ -0,0 +1,53 @@
+import io
+
+import pytest
+from pptx import Presentation
+from pptx.util import Inches
+
+from pptx_text import extract_slides
+from preprocess_data import extract_text_from_pptx
+
+
+@pytest.fixture
+def deck_path(tmp_path):
+    prs = Presentation()
+    first = prs.slides.add_slide(prs.slide_layouts[1])
+    first.shapes.title.text = "Le nombre décimal"
+    body = first.placeholders[1].text_frame
+    body.text = "Calcule 3,5 + 2,25"
+    body.add_paragraph().text = "Compare   4,7 et 4,07"
+    first.notes_slide.notes_text_frame.text = "Laisser chercher les élèves"
+
+    second = prs.slides.add_slide(prs.slide_layouts[6])
+    table = second.shapes.add_table(2, 2, Inches(1), Inches(1), Inches(4), Inches(2)).table
+    for row, cells in enumerate([("Nombre", "Arrondi"), ("4,07", "4")]):
+        for col, text in enumerate(cells):
+            table.cell(row, col).text = text
+    group = second.shapes.add_group_shape()
+    group.shapes.add_textbox(Inches(1), Inches(4), Inches(2), Inches(1)).text_frame.text = "Dans un groupe"
+
+    prs.slides.add_slide(prs.slide_layouts[6])
+    path = tmp_path / "deck.pptx"
+    prs.save(path)
+    return path
+
+
+def test_slides_come_out_in_order_with_notes(deck_path):
+    slides = extract_slides(str(deck_path))
+    assert slides[0] == "Le nombre décimal\nCalcule 3,5 + 2,25\nCompare 4,7 et 4,07\nLaisser chercher les élèves"
+    assert slides[1] == "Nombre\nArrondi\n4,07\n4\nDans un groupe"
+    assert slides[2] == ""
+
+
+def test_notes_can_be_left_out(deck_path):
+    assert "Laisser chercher" not in extract_slides(str(deck_path), include_notes=False)[0]
+
+
+def test_file_objects_are_accepted(deck_path):
+    assert extract_slides(io.BytesIO(deck_path.read_bytes())) == extract_slides(str(deck_path))
+
+
+def test_preprocess_joins_non_empty_slides(deck_path):
+    text = extract_text_from_pptx(str(deck_path))
+    assert "Le nombre décimal" in text and "Dans un groupe" in text
+    assert not text.endswith("\n")
@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+from pptx import Presentation
+
+import preprocess_data
+from preprocess_data import load_lessons_manifest, update_lessons_registry
+
+
+def save_deck(path, *lines):
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[1])
+    slide.shapes.title.text = lines[0]
+    slide.placeholders[1].text_frame.text = "\n".join(lines[1:])
+    prs.save(path)
+
+
+@pytest.fixture
+def scan(tmp_path, monkeypatch):
+    """Scan tmp_path/lessons into tmp_path/data/lessons.json; returns (lessons, extracted filenames)."""
+    extracted = []
+    extract_many = preprocess_data._extract_many
+
+    def recording(paths):
+        extracted.extend(os.path.basename(p) for p in paths)
+        return extract_many(paths)
+    monkeypatch.setattr(preprocess_data, "_extract_many", recording)
+    (tmp_path / "lessons").mkdir()
+    json_path = str(tmp_path / "data" / "lessons.json")
+
+    def run():
+        del extracted[:]
+        changed = update_lessons_registry(str(tmp_path / "lessons"), json_path)
+        with open(json_path, encoding="utf-8") as f:
+            return changed, json.load(f), list(extracted)
+    run.json_path = json_path
+    return run
+
+
+def test_new_decks_are_extracted_and_registered(tmp_path, scan):
+    save_deck(tmp_path / "lessons" / "MATH_N5_P1_SEM2_S3.pptx", "Les fractions", "Objectif : comparer deux fractions")
+    save_deck(tmp_path / "lessons" / "FR_N5_P2_SEM1_S1.pptx", "Lecture", "Lire un conte")
+    changed, lessons, extracted = scan()
+    assert changed and sorted(extracted) == ["FR_N5_P2_SEM1_S1.pptx", "MATH_N5_P1_SEM2_S3.pptx"]
+    math = next(l for l in lessons if l["subject"] == "mathématiques")
+    assert (math["period"], math["week"], math["session"]) == ("1", "2", "3")
+    assert math["objective"] == "Objectif : comparer deux fractions"
+    assert "Les fractions" in math["content"]
+    assert sorted(l["id"] for l in lessons) == [1, 2]
+    assert set(load_lessons_manifest(scan.json_path)) == {l["filename"] for l in lessons}
+
+
+def test_unchanged_and_touched_decks_are_not_extracted_again(tmp_path, scan):
+    deck = tmp_path / "lessons" / "AR_N6_P1_SEM1_S1.pptx"
+    save_deck(deck, "القراءة", "نص")
+    scan()
+    changed, _, extracted = scan()
+    assert changed is False and extracted == []
+
+    os.utime(deck, ns=(1, 10**18))
+    changed, _, extracted = scan()
+    assert changed is False and extracted == []
+    assert load_lessons_manifest(scan.json_path)[deck.name]["mtime_ns"] == 10**18
+
+
+def test_modified_deck_keeps_its_id(tmp_path, scan):
+    save_deck(tmp_path / "lessons" / "FR_N5_P1_SEM1_S1.pptx", "Lecture", "Premier texte")
+    save_deck(tmp_path / "lessons" / "FR_N5_P1_SEM1_S2.pptx", "Écriture", "Copier")
+    _, before, _ = scan()
+    save_deck(tmp_path / "lessons" / "FR_N5_P1_SEM1_S1.pptx", "Lecture", "Second texte, plus long")
+    changed, after, extracted = scan()
+    assert changed and extracted == ["FR_N5_P1_SEM1_S1.pptx"]
+    assert [l["id"] for l in after] == [l["id"] for l in before]
+    assert "Second texte" in after[0]["content"]
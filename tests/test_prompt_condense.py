@@ -0,0 +1,66 @@
+import pytest
+
+import prompt_condense
+from prompt_condense import BoilerplateIndex, condense_content, estimate_tokens
+
+
+def deck(steps, filler_lines=12):
+    lines = []
+    for step in range(steps):
+        lines.append(f"Lecture {step + 1}")
+        lines.extend(f"Étape {step + 1} : les élèves lisent la phrase numéro {n} du texte à voix haute."
+                     for n in range(filler_lines))
+    return "\n".join(lines)
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setattr(prompt_condense, "budget_for", lambda subject, session: 400)
+    monkeypatch.setattr(prompt_condense.boilerplate_index, "lines_for", lambda subject: set())
+    return 400
+
+
+def test_short_content_is_left_alone(budget):
+    condensed, info = condense_content("Le nombre décimal\nCalcule 3,5 + 2,25", "mathématiques", "1")
+    assert condensed == "Le nombre décimal\nCalcule 3,5 + 2,25" and not info["truncated"]
+
+
+def test_duplicates_are_dropped_and_spaces_folded(budget):
+    condensed, info = condense_content("Lis  le texte\nLis le texte\n\n  Réponds", "français", "1")
+    assert condensed == "Lis le texte\nRéponds" and info["removed_duplicates"] == 1
+
+
+def test_long_decks_keep_every_step(budget):
+    content = deck(steps=8)
+    condensed, info = condense_content(content, "français", "1")
+    assert info["truncated"] and estimate_tokens(condensed) <= budget
+    for step in range(1, 9):
+        assert f"Lecture {step}" in condensed
+        assert f"Étape {step} :" in condensed
+
+
+def test_one_huge_line_is_cut_not_dropped(budget):
+    condensed, info = condense_content("mot " * 5000, "français", "1")
+    assert condensed and estimate_tokens(condensed) <= budget
+
+
+def lesson(content, session, period="1"):
+    return {"subject": "Français", "session": session, "period": period, "content": content}
+
+
+def test_boilerplate_needs_several_sessions_and_periods(monkeypatch):
+    lessons = (
+        [lesson("Organisation de la semaine\nDescription de la scène.\n"
+                f"Que voit-on sur l'image ?\nTexte {i}", session=str(i % 4 + 1), period=str(i % 2 + 1))
+         for i in range(8)]
+        + [lesson("Dictée de la séance une", session="1") for _ in range(8)]
+    )
+    monkeypatch.setattr(prompt_condense.lesson_registry, "all", lambda: lessons)
+    learned = BoilerplateIndex(min_share=0.4, min_lessons=5)._build()["français"]
+    assert learned == {"organisation de la semaine"}
+
+
+def test_single_period_subjects_still_learn(monkeypatch):
+    lessons = [lesson(f"Organisation de la semaine\nTexte {i}", session=str(i % 4 + 1)) for i in range(8)]
+    monkeypatch.setattr(prompt_condense.lesson_registry, "all", lambda: lessons)
+    assert BoilerplateIndex(min_share=0.4, min_lessons=5)._build()["français"] == {"organisation de la semaine"}
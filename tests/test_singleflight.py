@@ -0,0 +1,93 @@
+import asyncio
+import fcntl
+import os
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call(tmp_path):
+    flight = SingleFlight("t", lock_dir=str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "résultat"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("a" * 64, fn, lambda: None)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("a" * 64, fn, lambda: None)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+    assert results == ["résultat"] * 4 and calls == [1]
+    assert flight.stats["coalesced_local"] == 3
+
+
+def test_result_from_another_worker_is_reused(tmp_path):
+    flight = SingleFlight("t", lock_dir=str(tmp_path))
+    assert flight.do("b" * 64, lambda: "fresh", recheck=lambda: "cached") == "cached"
+    assert flight.stats["coalesced_remote"] == 1 and flight.stats["executed"] == 0
+
+
+def hold_lock(flight, key):
+    os.makedirs(flight.lock_dir, exist_ok=True)
+    lock_file = open(flight._lock_path(key), "a")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def test_unrelated_keys_do_not_wait_on_each_other(tmp_path):
+    flight = SingleFlight("t", lock_dir=str(tmp_path), wait_seconds=5)
+    held = hold_lock(SingleFlight("t", lock_dir=str(tmp_path)), "c" * 64)
+    start = time.monotonic()
+    assert flight.do("c" * 8 + "d" * 56, lambda: "ok", lambda: None) == "ok"
+    assert time.monotonic() - start < 1
+    held.close()
+
+
+def test_a_stuck_leader_is_waited_for_only_so_long(tmp_path):
+    flight = SingleFlight("t", lock_dir=str(tmp_path), wait_seconds=0.2)
+    held = hold_lock(flight, "e" * 64)
+    assert flight.do("e" * 64, lambda: "ran anyway", lambda: None) == "ran anyway"
+    assert flight.stats["wait_timeouts"] == 1
+    held.close()
+
+
+def test_async_callers_share_one_call_and_time_out_too(tmp_path):
+    flight = SingleFlight("t", lock_dir=str(tmp_path), wait_seconds=0.2)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*(flight.do_async("f" * 64, fn, lambda: None) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["ok"] * 5 and calls == [1]
+    held = hold_lock(flight, "f" * 64)
+    assert asyncio.run(flight.do_async("f" * 64, fn, lambda: None)) == "ok"
+    assert flight.stats["wait_timeouts"] == 1
+    held.close()
+
+
+def test_generation_recheck_does_not_count_a_second_miss(fake_openai):
+    import pdf_generator
+    from cache import lesson_cache
+    content = "Leçon unique pour le test de singleflight\nCalcule 7 × 8"
+    before = dict(lesson_cache.stats)
+    assert pdf_generator.process_with_ai("Test", "math", "5", "1", "2", "3", content)
+    assert lesson_cache.stats["misses"] - before["misses"] == 1
+    assert lesson_cache.stats["total_requests"] - before["total_requests"] == 1
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+import template_env
+from browser_pool import request_allowed
+from template_env import NotAFontError, inline_assets, jinja_env, template_assets
+
+FONT_FACE = "@font-face { src: url('fonts/Body.ttf') format('truetype'); }"
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_stylesheet_and_font_are_inlined(tmp_path, monkeypatch):
+    monkeypatch.setattr(template_env, "FONT_SUBSET", False)
+    write(str(tmp_path / "fonts" / "Body.ttf"), b"\x00\x01\x00\x00" + b"\x00" * 64)
+    write(str(tmp_path / "style.css"), FONT_FACE.encode())
+    html = inline_assets('<link rel="stylesheet" href="style.css">', str(tmp_path))
+    assert "<style>" in html
+    assert "url('data:font/ttf;base64," in html
+    assert "format('truetype')" in html
+
+
+def test_file_that_is_not_a_font_fails_loudly(tmp_path):
+    write(str(tmp_path / "fonts" / "Body.ttf"), b"<!DOCTYPE html>\n<html><head></head></html>")
+    with pytest.raises(NotAFontError, match="Body.ttf"):
+        inline_assets(f"<style>{FONT_FACE}</style>", str(tmp_path))
+
+
+def test_missing_and_remote_fonts_are_left_alone(tmp_path):
+    source = "src: url('fonts/Missing.ttf'); @import url('https://fonts.googleapis.com/css2?family=Tajawal');"
+    assert inline_assets(source, str(tmp_path)) == source
+
+
+def test_shipped_templates_load():
+    for name in jinja_env.list_templates(filter_func=lambda name: name.endswith(".html")):
+        jinja_env.get_template(name)
+        assert all(os.path.isfile(path) for path in template_assets(os.path.join(template_env.TEMPLATES_DIR, name)))
+
+
+def test_render_pages_only_reach_the_font_hosts():
+    assert request_allowed("https://fonts.googleapis.com/css2?family=Tajawal:wght@400;700;900&display=swap")
+    assert request_allowed("https://fonts.gstatic.com/s/tajawal/v9/font.woff2")
+    assert not request_allowed("http://fonts.gstatic.com/s/tajawal/v9/font.woff2")
+    assert not request_allowed("https://example.com/logo.png")
+    assert not request_allowed("file:///etc/passwd")
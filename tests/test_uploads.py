@@ -0,0 +1,39 @@
+import json
+import os
+
+from preprocess_data import MANIFEST_NAME
+from uploads import ExtractedTextMemo, ManifestIndex
+
+
+def test_failed_extractions_are_not_remembered():
+    memo = ExtractedTextMemo()
+    memo.set("a" * 64, "")
+    assert memo.get("a" * 64) is None
+    memo.set("a" * 64, "Le nombre décimal")
+    assert memo.get("a" * 64) == "Le nombre décimal"
+
+
+def test_memo_evicts_least_recently_used():
+    memo = ExtractedTextMemo(max_entries=2)
+    memo.set("a", "1")
+    memo.set("b", "2")
+    memo.get("a")
+    memo.set("c", "3")
+    assert memo.get("b") is None and memo.get("a") == "1"
+
+
+def test_manifest_index_reloads_only_when_the_file_changes(tmp_path):
+    manifest_path = tmp_path / MANIFEST_NAME
+    manifest_path.write_text(json.dumps({"deck.pptx": {"sha256": "abc"}}))
+    index = ManifestIndex(str(tmp_path / "lessons.json"))
+    assert index.get("abc") == "deck.pptx"
+
+    stamp = index._stamp
+    assert index.get("def") is None and index._stamp == stamp
+
+    manifest_path.write_text(json.dumps({"other.pptx": {"sha256": "def"}}))
+    os.utime(manifest_path, ns=(stamp[0] + 10**9, stamp[0] + 10**9))
+    assert index.get("def") == "other.pptx" and index.get("abc") is None
+
+    manifest_path.unlink()
+    assert index.get("def") is None
@@ -0,0 +1,125 @@
+"""
+Streaming handling of PPTX uploads for /generate.
+The multipart parser writes the file into a spooled buffer that hashes the
+bytes as they arrive, so a deck we already know is recognised without a
+second pass and without ever touching lessons/.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from flask import Request
+
+from lesson_registry import lesson_registry
+from preprocess_data import MANIFEST_NAME, OUTPUT_JSON, load_lessons_manifest
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "100")) * 1024 * 1024
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_MB", "8")) * 1024 * 1024
+
+
+class HashingSpool:
+    """Writable spooled buffer that SHA256-hashes everything written to it."""
+
+    def __init__(self, max_memory: int = UPLOAD_SPOOL_BYTES):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory, mode="w+b")
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+
+class UploadRequest(Request):
+    """Request class whose uploaded files stream into a HashingSpool."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpool()
+
+
+class ExtractedTextMemo:
+    """
+    Small LRU of sha256 -> extracted text for decks uploaded but not saved.
+    Failed extractions (empty text) are not stored, so a re-upload parses again.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sha256: str) -> Optional[str]:
+        with self._lock:
+            content = self.entries.get(sha256)
+            if content is not None:
+                self.entries.move_to_end(sha256)
+            return content
+
+    def set(self, sha256: str, content: str) -> None:
+        if not content:
+            return
+        with self._lock:
+            self.entries[sha256] = content
+            self.entries.move_to_end(sha256)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class ManifestIndex:
+    """sha256 -> deck filename from lessons_manifest.json, re-read only when its mtime/size change."""
+
+    def __init__(self, json_path: str = OUTPUT_JSON):
+        self.json_path = json_path
+        self.path = os.path.join(os.path.dirname(json_path) or ".", MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self.by_sha256: Dict[str, str] = {}
+
+    def get(self, sha256: str) -> Optional[str]:
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        with self._lock:
+            if stamp != self._stamp:
+                manifest = load_lessons_manifest(self.json_path) if stamp is not None else {}
+                self.by_sha256 = {fp.get("sha256"): filename for filename, fp in manifest.items()}
+                self._stamp = stamp
+            return self.by_sha256.get(sha256)
+
+
+extracted_text_memo = ExtractedTextMemo()
+manifest_index = ManifestIndex()
+
+
+def known_deck_content(sha256: str) -> Optional[str]:
+    """
+    Text already extracted from a deck with this hash, if any.
+
+    Returns:
+        Slide text, or None if the deck has never been extracted
+    """
+    content = extracted_text_memo.get(sha256)
+    if content is not None:
+        return content
+    filename = manifest_index.get(sha256)
+    lesson = lesson_registry.get_by_filename(filename) if filename else None
+    if lesson is None:
+        return None
+    # An empty stored text is a failed extraction: parse the upload instead
+    return lesson.get("content") or None